@@ -1,5 +1,6 @@
 from typing import List, Union
 import os
+import sys
 import json
 import logging
 
@@ -11,6 +12,10 @@ import tensorflow as tf
 from tensorflow.keras.preprocessing.text import tokenizer_from_json, Tokenizer
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 
+# The graph-compiled model wrapper is shared with the combined app (FastApi/inference.py).
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from inference import CompiledModel  # noqa: E402
+
 # --- Configuration ---
 MODEL_PATH = "bilstm_payload_detector.h5"
 TOKENIZER_PATH = "tokenizer.json"
@@ -73,7 +78,7 @@ def startup_load_model_and_tokenizer():
         app.state.model = None
     else:
         try:
-            app.state.model = tf.keras.models.load_model(MODEL_PATH)
+            app.state.model = CompiledModel(tf.keras.models.load_model(MODEL_PATH), MAX_LEN)
             logger.info(f"Loaded model from {MODEL_PATH}")
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
@@ -109,7 +114,7 @@ def predict(req: PredictRequest):
     pad = pad_sequences(sequences, maxlen=MAX_LEN, padding='post', truncating='post')
 
     try:
-        preds = model.predict(pad)
+        preds = model(pad)
     except Exception as e:
         logger.error(f"Model prediction failed: {e}")
         raise HTTPException(status_code=500, detail="Model prediction failed")
@@ -1,12 +1,17 @@
 from typing import List, Optional
 import os
 import pickle
+import sys
 import numpy as np
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 from tensorflow.keras.models import load_model
 
+# The graph-compiled model wrapper is shared with the combined app (FastApi/inference.py).
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from inference import CompiledModel  # noqa: E402
+
 # ------------
 # Config
 # ------------
@@ -73,7 +78,7 @@ def load_artifacts():
         )
 
     # Load Keras model
-    model = load_model(MODEL_PATH)
+    model = CompiledModel(load_model(MODEL_PATH), MAXLEN)
 
     # Load LabelEncoder
     with open(ENCODER_PATH, "rb") as f:
@@ -113,7 +118,7 @@ def predict(req: PredictRequest):
     X = pad_sequences(seqs, maxlen=MAXLEN, padding="post", value=0)
 
     # Predict
-    probs = model.predict(X).reshape(-1)
+    probs = model(X).reshape(-1)
     labels = (probs >= 0.5).astype(int)
 
     predictions = [
@@ -1,5 +1,6 @@
 import os
 import pickle
+import sys
 from typing import List, Optional
 
 import numpy as np
@@ -10,6 +11,10 @@ from pydantic import BaseModel, Field
 import tensorflow as tf
 from tensorflow.keras.preprocessing.sequence import pad_sequences
 
+# The graph-compiled model wrapper is shared with the combined app (FastApi/inference.py).
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from inference import CompiledModel  # noqa: E402
+
 app = FastAPI(title="XSS Detector API", version="1.0.0")
 
 
@@ -49,7 +54,7 @@ class PredictBatchResponse(BaseModel):
 
 
 # --------- Model / Tokenizer holders ---------
-model: Optional[tf.keras.Model] = None
+model = None
 _tokenizer = None
 _saved_maxlen: Optional[int] = None
 
@@ -78,9 +83,6 @@ def load_model_and_tokenizer() -> None:
             "Tokenizer pickle not found. Set TOKENIZER_PATH or place xss_tokenizer.pkl in project or models/"
         )
 
-    # Load model
-    model = tf.keras.models.load_model(model_path)
-
     # Load tokenizer data
     data = pickle.load(open(tok_path, "rb"))
     if isinstance(data, dict) and "tokenizer" in data:
@@ -90,6 +92,13 @@ def load_model_and_tokenizer() -> None:
         _tokenizer = data
         _saved_maxlen = None
 
+    # Load model
+    model = CompiledModel(tf.keras.models.load_model(model_path), _saved_maxlen)
+
+
+def _run_model(X: np.ndarray) -> np.ndarray:
+    return model(X).ravel().astype(float)
+
 
 def _prepare_X(payloads: List[str], maxlen: Optional[int]):
     seqs = _tokenizer.texts_to_sequences(payloads)
@@ -137,7 +146,7 @@ def predict(req: PredictRequest, threshold: float = Query(0.5, ge=0.0, le=1.0)):
     payloads = [req.payload or ""]
     X, used_maxlen = _prepare_X(payloads, _saved_maxlen)
 
-    probs = model.predict(X, batch_size=1).ravel().astype(float)
+    probs = _run_model(X)
     prob = float(probs[0])
     pred = int(prob >= threshold)
 
@@ -161,8 +170,7 @@ def predict_batch(req: PredictBatchRequest, threshold: float = Query(0.5, ge=0.0
             status_code=400, detail="payloads must be a non-empty list")
 
     X, used_maxlen = _prepare_X(payloads, _saved_maxlen)
-    probs = model.predict(X, batch_size=min(
-        len(payloads), 128)).ravel().astype(float)
+    probs = _run_model(X)
 
     results = [
         PredictResponse(
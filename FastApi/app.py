@@ -4,20 +4,36 @@ import pickle
 import logging
 from typing import List, Union, Optional, Dict
 
+import asyncio
 import numpy as np
 import hashlib
-import math
+import importlib.util
+import threading
+import time
 from fastapi import FastAPI, APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, Field
 
-# TensorFlow / Keras may be optional at import time for some endpoints
-try:
-    import tensorflow as tf
-    from tensorflow.keras.preprocessing.sequence import pad_sequences
-    from tensorflow.keras.preprocessing.text import tokenizer_from_json, Tokenizer
-    TF_AVAILABLE = True
-except Exception:
-    TF_AVAILABLE = False
+from batching import MicroBatcher
+from cascade import CascadeTier1
+import fast_tokenizer
+import metrics
+from fast_tokenizer import pad_post
+from flow_meter import FlowMeter, FlowRecords, packets_from_events
+from forest import compile_forest
+from inference import import_tensorflow, load_inference_model, predict_bucketed
+import worker_status
+from loading import LOADING, ModelRegistry
+from rate_sketch import RateTracker
+from session_state import LstmSessionScorer, SessionStore
+from singleflight import SingleFlight
+from streaming import ndjson_response
+from verdict_cache import VerdictCache, model_version, payload_key
+
+# TensorFlow / Keras may be optional for some endpoints. It is only imported
+# by the loaders, so a pre-forking server master never initializes it.
+TF_AVAILABLE = importlib.util.find_spec("tensorflow") is not None
 
 # scikit / joblib for bot detection
 try:
@@ -27,18 +43,95 @@ except Exception:
 
 logger = logging.getLogger("uvicorn.error")
 
+# Metrics, served on GET /metrics. Under gunicorn each worker writes a
+# snapshot every METRICS_FLUSH_S seconds and /metrics sums all of them.
+METRICS_FLUSH_S = float(os.getenv("METRICS_FLUSH_S", "5"))
+METRIC_ROUTERS = ("bilstm", "bot", "ddos", "behaviour", "xss", "feature", "analyze")
+
+metrics_registry = metrics.Registry()
+requests_total = metrics_registry.counter("waf_requests_total", "HTTP requests by router and status code", ("router", "status"))
+request_seconds = metrics_registry.histogram("waf_request_seconds", "End-to-end request latency", ("router",))
+stage_seconds = metrics_registry.histogram("waf_stage_seconds", "Time spent per stage: tokenize, pad, forward, serialize",
+                                           ("router", "stage"))
+batch_rows = metrics_registry.histogram("waf_batch_size", "Rows per model forward pass", ("router",), buckets=metrics.SIZE_BUCKETS)
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that records its encoding time as the ``serialize`` stage."""
+
+    def render(self, content) -> bytes:
+        start = time.perf_counter()
+        body = super().render(content)
+        stage_seconds.observe(time.perf_counter() - start, metrics.current_router.get(), "serialize")
+        return body
+
+
 app = FastAPI(title="Combined FastAPI Models",
               description="Combined endpoints for BILSTM, Bot Detection, User Behaviour and XSS models",
-              version="1.0")
+              version="1.0",
+              default_response_class=TimedJSONResponse)
+app.add_middleware(metrics.MetricsMiddleware, requests=requests_total, latency=request_seconds, routers=METRIC_ROUTERS)
+
+# Models load in the background at startup (or on first use when a router is
+# lazy); requests that need a model wait up to MODEL_LOAD_WAIT_S for it.
+MODEL_LOAD_WORKERS = int(os.getenv("MODEL_LOAD_WORKERS", "4"))
+MODEL_LOAD_WAIT_S = float(os.getenv("MODEL_LOAD_WAIT_S", "30"))
+MODEL_LOAD_BLOCKING = os.getenv("MODEL_LOAD_BLOCKING", "0") == "1"
+# Models /ready waits for (comma-separated). Unset: every eager model whose artifacts are present.
+READY_MODELS = os.getenv("READY_MODELS")
+READY_MODELS = None if READY_MODELS is None else [name.strip() for name in READY_MODELS.split(",") if name.strip()]
+
+model_registry = ModelRegistry(MODEL_LOAD_WORKERS, required=READY_MODELS)
+
+# Threads each worker gives TensorFlow / TFLite / ONNX Runtime (0 = runtime
+# default). gunicorn.conf.py sets it to cores // workers.
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0")) or None
+
+
+# Bulk rescoring over NDJSON (POST /bilstm|/xss|/bot/predict/stream). Memory
+# is bounded by STREAM_BATCH_SIZE * STREAM_MAX_INFLIGHT lines.
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "256"))
+STREAM_MAX_INFLIGHT = int(os.getenv("STREAM_MAX_INFLIGHT", "2"))
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
+
+
+def stream_response(request: Request, parse, score):
+    return ndjson_response(request.stream(), parse, score, STREAM_BATCH_SIZE, STREAM_MAX_INFLIGHT, STREAM_MAX_LINE_BYTES)
+
+
+def payload_from_line(obj) -> str:
+    """A stream line is either a JSON string or an object with ``payload`` (or ``text``)."""
+    if isinstance(obj, dict):
+        obj = obj.get("payload", obj.get("text"))
+    if not isinstance(obj, str):
+        raise ValueError("expected a string or an object with a string `payload`")
+    return obj
+
+
+def env_ints(name: str) -> List[int]:
+    """Comma-separated integers from the environment, e.g. ``XSS_BUCKETS=32,64,128``."""
+    return [int(v) for v in os.getenv(name, "").split(",") if v.strip()]
+
+
+def require_model(name: str):
+    if not model_registry.wait(name, MODEL_LOAD_WAIT_S):
+        raise HTTPException(status_code=503, detail=f"{name} model is still loading", headers={"Retry-After": "5"})
 
 # --- feature-extractor dynamic imports (paths contain a hyphen so import by filepath)
-import importlib.util
 _FEAT_DIR = os.path.join(os.path.dirname(__file__), "feature-extractor")
 
 def _load_feature_funcs():
     get_geoip = None
+    get_geoip_batch = None
     get_ip_reputation = None
+    get_ip_reputation_async = None
+    close_reputation = None
     tokenize_payload = None
+    extract_payload_features = None
+    extract_payload_features_batch = None
+    ip_list_verdicts = None
+    ip_lists_stats = None
+    reload_ip_lists = None
 
     # geoip_utils.py
     try:
@@ -48,6 +141,7 @@ def _load_feature_funcs():
             mod = importlib.util.module_from_spec(spec)
             spec.loader.exec_module(mod)
             get_geoip = getattr(mod, "get_geoip", None)
+            get_geoip_batch = getattr(mod, "get_geoip_batch", None)
     except Exception as e:
         logger.warning(f"Failed to load geoip_utils: {e}")
 
@@ -59,6 +153,8 @@ def _load_feature_funcs():
             mod = importlib.util.module_from_spec(spec)
             spec.loader.exec_module(mod)
             get_ip_reputation = getattr(mod, "get_ip_reputation", None)
+            get_ip_reputation_async = getattr(mod, "get_ip_reputation_async", None)
+            close_reputation = getattr(mod, "aclose_reputation", None)
     except Exception as e:
         logger.warning(f"Failed to load reputation_api: {e}")
 
@@ -73,22 +169,119 @@ def _load_feature_funcs():
     except Exception as e:
         logger.warning(f"Failed to load payload_tokenizer: {e}")
 
+    # payload_features.py
+    try:
+        pf_path = os.path.join(_FEAT_DIR, "payload_features.py")
+        if os.path.exists(pf_path):
+            spec = importlib.util.spec_from_file_location("feat_payload", pf_path)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+            extract_payload_features = getattr(mod, "extract_payload_features", None)
+            extract_payload_features_batch = getattr(mod, "extract_payload_features_batch", None)
+    except Exception as e:
+        logger.warning(f"Failed to load payload_features: {e}")
+
+    # ip_lists.py
+    try:
+        lists_path = os.path.join(_FEAT_DIR, "ip_lists.py")
+        if os.path.exists(lists_path):
+            spec = importlib.util.spec_from_file_location("feat_ip_lists", lists_path)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+            ip_list_verdicts = getattr(mod, "ip_list_verdicts", None)
+            ip_lists_stats = getattr(mod, "ip_lists_stats", None)
+            reload_ip_lists = getattr(mod, "reload_ip_lists", None)
+    except Exception as e:
+        logger.warning(f"Failed to load ip_lists: {e}")
+
     # Fallbacks
     if get_geoip is None:
         def get_geoip(ip):
             return {"ip": ip, "country": "Unknown", "city": "Unknown", "latitude": None, "longitude": None}
 
+    if get_geoip_batch is None:
+        def get_geoip_batch(ips):
+            return [get_geoip(ip) for ip in ips]
+
     if get_ip_reputation is None:
         def get_ip_reputation(ip):
             return 0
 
+    if get_ip_reputation_async is None:
+        async def get_ip_reputation_async(ip):
+            return await run_in_threadpool(get_ip_reputation, ip)
+
+    if close_reputation is None:
+        async def close_reputation():
+            return None
+
     if tokenize_payload is None:
         def tokenize_payload(payload: str):
             return []
 
-    return get_geoip, get_ip_reputation, tokenize_payload
+    if extract_payload_features is None:
+        def extract_payload_features(payload: str):
+            # Same definition as payload_features.byte_entropy: a 256-bin histogram of the UTF-8 bytes.
+            data = payload.encode()
+            if data:
+                counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+                p = counts[counts > 0] / len(data)
+                entropy = round(float(-(p * np.log2(p)).sum()), 3) + 0.0
+            else:
+                entropy = 0.0
+            return {
+                "payload_hash": hashlib.md5(data).hexdigest(),
+                "tokens": tokenize_payload(payload),
+                "entropy": entropy,
+            }
+
+    if extract_payload_features_batch is None:
+        def extract_payload_features_batch(payloads):
+            return [extract_payload_features(p) for p in payloads]
+
+    if ip_list_verdicts is None:
+        def ip_list_verdicts(ips):
+            return [None] * len(ips)
+
+    if ip_lists_stats is None:
+        def ip_lists_stats():
+            return {"blocklist": None, "allowlist": None, "error": "ip_lists unavailable"}
+
+    if reload_ip_lists is None:
+        reload_ip_lists = ip_lists_stats
+
+    return (get_geoip, get_geoip_batch, get_ip_reputation, get_ip_reputation_async, close_reputation,
+            tokenize_payload, extract_payload_features, extract_payload_features_batch,
+            ip_list_verdicts, ip_lists_stats, reload_ip_lists)
+
+(get_geoip, get_geoip_batch, get_ip_reputation, get_ip_reputation_async, close_reputation,
+ tokenize_payload, extract_payload_features, extract_payload_features_batch,
+ ip_list_verdicts, ip_lists_stats, reload_ip_lists) = _load_feature_funcs()
+
+
+def load_cascade(path: str, enabled: bool) -> Optional[CascadeTier1]:
+    """Tier-1 cascade model trained by train_cascade.py, if enabled and present."""
+    if not enabled or not os.path.exists(path):
+        return None
+    try:
+        tier = CascadeTier1.load(path, tokenize_payload)
+        logger.info(f"Loaded cascade tier 1 from {path} (exits below {tier.low:.4f} / above {tier.high:.4f})")
+        return tier
+    except Exception as e:
+        logger.warning(f"Failed to load cascade tier 1 from {path}: {e}")
+        return None
+
 
-get_geoip, get_ip_reputation, tokenize_payload = _load_feature_funcs()
+def cascade_exits(router: str, tier: Optional[CascadeTier1], payloads: List[str], scores: List[Optional[float]],
+                  missing: List[int]) -> List[int]:
+    """Fills ``scores`` for the payloads that exit at tier 1; returns the indices still needing the deep model."""
+    if tier is None or not missing:
+        return missing
+    with stage_seconds.time(router, "cascade"):
+        early = tier.decide([payloads[i] for i in missing])
+    for i, p in zip(missing, early):
+        scores[i] = p
+    return [i for i, p in zip(missing, early) if p is None]
 
 ############################
 # BILSTM Payload Detector
@@ -99,9 +292,28 @@ BIL_MODEL_PATH = os.path.join("BiLstm", "bilstm_payload_detector.h5")
 BIL_TOKENIZER_PATH = os.path.join("BiLstm", "tokenizer.json")
 BIL_WORD_INDEX = os.path.join("BiLstm", "word_index.json")
 BIL_MAX_LEN = 100
+BIL_BATCH_MAX_SIZE = int(os.getenv("BIL_BATCH_MAX_SIZE", "32"))
+BIL_BATCH_MAX_WAIT_MS = float(os.getenv("BIL_BATCH_MAX_WAIT_MS", "5"))
+BIL_CACHE_MAX_ENTRIES = int(os.getenv("BIL_CACHE_MAX_ENTRIES", "100000"))
+BIL_CACHE_TTL_S = float(os.getenv("BIL_CACHE_TTL_S", "3600"))
+BIL_CACHE_MAX_MB = float(os.getenv("BIL_CACHE_MAX_MB", "64"))
+# Concurrent requests for a payload already being scored wait for that result (singleflight.py).
+BIL_COALESCE = os.getenv("BIL_COALESCE", "1") == "1"
+BIL_LAZY_LOAD = os.getenv("BIL_LAZY_LOAD", "0") == "1"
+BIL_BACKEND = os.getenv("BIL_BACKEND", "keras")  # keras | tflite | onnx
+BIL_QUANT = os.getenv("BIL_QUANT") or None  # dynamic | int8, with the tflite / onnx backends
+# Shorter padded lengths for short inputs (Keras backend only). Off by default:
+# the model does not mask padding, so scores shift slightly.
+BIL_BUCKETS = env_ints("BIL_BUCKETS")
+# Tier-1 cascade (train_cascade.py): used when the file exists, unless BIL_CASCADE=0.
+BIL_CASCADE = os.getenv("BIL_CASCADE", "1") == "1"
+BIL_CASCADE_PATH = os.getenv("BIL_CASCADE_PATH", os.path.join("BiLstm", "cascade_tier1.npz"))
 
 bil_model = None
 bil_tokenizer = None
+bil_cascade: Optional[CascadeTier1] = None
+bil_cache = VerdictCache("bilstm", BIL_CACHE_MAX_ENTRIES, BIL_CACHE_TTL_S, int(BIL_CACHE_MAX_MB * 1024 * 1024))
+bil_flights = SingleFlight("bilstm", BIL_COALESCE)
 
 
 class BilPredictRequest(BaseModel):
@@ -113,27 +325,20 @@ def bil_preprocess_text(text: str) -> str:
 
 
 def bil_load_tokenizer(path: str):
-    if not TF_AVAILABLE:
-        logger.error("TensorFlow not available - BILSTM endpoints will fail at runtime")
-        return None
-
     if os.path.exists(path) and os.path.getsize(path) > 10:
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                raw = f.read()
-            tok = tokenizer_from_json(raw)
-            logger.info(f"Loaded tokenizer from {path}")
+            tok = fast_tokenizer.load_keras_json(path)
+            logger.info(f"Loaded tokenizer from {path} ({len(tok)} entries)")
             return tok
         except Exception as e:
-            logger.warning(f"Failed to load tokenizer_from_json: {e}")
+            logger.warning(f"Failed to load tokenizer json: {e}")
 
     if os.path.exists(BIL_WORD_INDEX) and os.path.getsize(BIL_WORD_INDEX) > 10:
         try:
             with open(BIL_WORD_INDEX, "r", encoding="utf-8") as f:
                 wi = json.load(f)
-            tok = Tokenizer()
-            tok.word_index = wi
-            tok.index_word = {int(v): k for k, v in wi.items()}
+            # Same settings as a default Keras Tokenizer() with this word_index
+            tok = fast_tokenizer.from_config(wi)
             logger.info(f"Reconstructed tokenizer from {BIL_WORD_INDEX}")
             return tok
         except Exception as e:
@@ -144,7 +349,7 @@ def bil_load_tokenizer(path: str):
 
 
 def bil_startup_load():
-    global bil_model, bil_tokenizer
+    global bil_model, bil_tokenizer, bil_cascade
     if not TF_AVAILABLE:
         bil_model = None
         bil_tokenizer = None
@@ -156,51 +361,118 @@ def bil_startup_load():
         bil_model = None
     else:
         try:
-            bil_model = tf.keras.models.load_model(model_path)
-            logger.info(f"Loaded BILSTM model from {model_path}")
+            bil_model = load_inference_model(model_path, BIL_BACKEND, seq_len=BIL_MAX_LEN, num_threads=INFERENCE_THREADS,
+                                             bucket_lengths=BIL_BUCKETS, quantization=BIL_QUANT)
+            logger.info(f"Loaded BILSTM model from {bil_model.path} ({bil_model.backend})")
         except Exception as e:
             logger.error(f"Failed to load BILSTM model: {e}")
             bil_model = None
 
     bil_tokenizer = bil_load_tokenizer(BIL_TOKENIZER_PATH)
+    bil_cache.set_version(model_version(bil_model.path, BIL_TOKENIZER_PATH) if bil_model is not None else None)
+    bil_cascade = load_cascade(BIL_CASCADE_PATH, BIL_CASCADE)
 
 
-@bil_router.post("/predict")
-def bil_predict(req: BilPredictRequest):
+def observe_forward(router: str, rows: int, timings: Dict[str, float]):
+    batch_rows.observe(rows, router)
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, router, stage)
+
+
+def bil_forward(sequences: List[List[int]]) -> List[float]:
+    timings: Dict[str, float] = {}
+    scores = predict_bucketed(bil_model, sequences, timings=timings)
+    observe_forward("bilstm", len(sequences), timings)
+    return scores.astype(float).tolist()
+
+
+bil_batcher = MicroBatcher("bilstm", bil_forward, BIL_BATCH_MAX_SIZE, BIL_BATCH_MAX_WAIT_MS)
+
+
+def bil_score(texts: List[str], use_cache: bool = True, cascade: bool = True) -> List[float]:
+    require_model("bilstm")
     if bil_model is None:
         raise HTTPException(status_code=500, detail="BILSTM model not loaded")
     if bil_tokenizer is None:
         raise HTTPException(status_code=500, detail="BILSTM tokenizer not available")
 
+    version = bil_cache.version
+    keys = [payload_key(t) for t in texts]
+    scores = [bil_cache.get(k) for k in keys] if use_cache else [None] * len(texts)
+    missing = [i for i, s in enumerate(scores) if s is None]
+    if cascade:
+        missing = cascade_exits("bilstm", bil_cascade, texts, scores, missing)
+    if not missing:
+        return scores
+
+    # Payloads another request is already scoring are left to it; this one scores the rest (`lead`).
+    with bil_flights.claim([(version, keys[i]) for i in missing]) as flight:
+        lead = [missing[j] for j in flight.lead]
+        if lead:
+            try:
+                with stage_seconds.time("bilstm", "tokenize"):
+                    processed = [bil_preprocess_text(texts[i]) for i in lead]
+                    sequences = bil_tokenizer.texts_to_sequences(processed, maxlen=BIL_MAX_LEN)
+            except Exception as e:
+                logger.error(f"Error converting texts to sequences: {e}")
+                raise HTTPException(status_code=500, detail="Tokenizer failed to convert texts to sequences")
+
+            futures = bil_batcher.submit_many(sequences)
+            try:
+                for j, i, f in zip(flight.lead, lead, futures):
+                    scores[i] = f.result()
+                    if use_cache:
+                        bil_cache.put(keys[i], scores[i], version)
+                    flight.resolve(j, scores[i])
+            except Exception as e:
+                logger.error(f"Model prediction failed: {e}")
+                raise HTTPException(status_code=500, detail="Model prediction failed")
+
+    for j, i in enumerate(missing):
+        if scores[i] is None:
+            scores[i] = flight.result(j)
+    return scores
+
+
+def bil_result(txt: str, conf: float) -> Dict:
+    label = "sql_injection" if conf > 0.5 else "safe"
+    return {"input": txt, "label": label, "confidence": round(conf, 6)}
+
+
+@bil_router.get("/health")
+def bil_health():
+    ok = bil_model is not None and bil_tokenizer is not None
+    return {"status": "ok" if ok else "missing-artifacts", "backend": getattr(bil_model, "backend", None),
+            "quantization": getattr(bil_model, "quantization", None),
+            "lengths": getattr(bil_model, "lengths", None), "cache": bil_cache.stats(), "coalescing": bil_flights.stats(),
+            "cascade": bil_cascade.stats() if bil_cascade is not None else None}
+
+
+@bil_router.post("/predict")
+def bil_predict(req: BilPredictRequest):
     texts = req.text
     if isinstance(texts, str):
         texts = [texts]
     if not isinstance(texts, list) or len(texts) == 0:
         raise HTTPException(status_code=400, detail="`text` must be a non-empty string or list of strings")
 
-    processed = [bil_preprocess_text(t) for t in texts]
-    try:
-        sequences = bil_tokenizer.texts_to_sequences(processed)
-    except Exception as e:
-        logger.error(f"Error converting texts to sequences: {e}")
-        raise HTTPException(status_code=500, detail="Tokenizer failed to convert texts to sequences")
+    preds = bil_score(texts)
+    return {"results": [bil_result(txt, conf) for txt, conf in zip(texts, preds)]}
 
-    pad = pad_sequences(sequences, maxlen=BIL_MAX_LEN, padding='post', truncating='post')
 
-    try:
-        preds = bil_model.predict(pad)
-    except Exception as e:
-        logger.error(f"Model prediction failed: {e}")
-        raise HTTPException(status_code=500, detail="Model prediction failed")
+@bil_router.post("/predict/stream")
+async def bil_predict_stream(request: Request):
+    """
+    NDJSON in, NDJSON out: one `{"line", "id"?, "label", "confidence"}` per non-blank input line, in order.
+    Verdicts bypass the cache so bulk rescoring does not evict live traffic.
+    """
+    await run_in_threadpool(require_model, "bilstm")
 
-    preds = np.array(preds).reshape(-1)
-    results = []
-    for i, txt in enumerate(texts):
-        conf = float(preds[i])
-        label = "sql_injection" if conf > 0.5 else "safe"
-        results.append({"input": txt, "label": label, "confidence": round(conf, 6)})
+    def score(texts: List[str]) -> List[Dict]:
+        return [{"label": r["label"], "confidence": r["confidence"]}
+                for r in map(bil_result, texts, bil_score(texts, use_cache=False))]
 
-    return {"results": results}
+    return stream_response(request, payload_from_line, score)
 
 
 ############################
@@ -212,8 +484,23 @@ RF_MODEL_PATH = os.path.join("bot detection", "rf_bot_model.pkl")
 RF_SCALER_PATH = os.path.join("bot detection", "rf_bot_scaler.pkl")
 ISO_MODEL_PATH = os.path.join("bot detection", "isolation_forest_bot_model.pkl")
 ISO_SCALER_PATH = os.path.join("bot detection", "isolation_forest_bot_scaler.pkl")
-
-models_store: Dict[str, Dict] = {"rf": {"model": None, "scaler": None}, "iso": {"model": None, "scaler": None}}
+BOT_LAZY_LOAD = os.getenv("BOT_LAZY_LOAD", "0") == "1"
+# Forest arrays are memory-mapped from joblib's pickles instead of copied
+# into each process ("" disables).
+BOT_MMAP_MODE = os.getenv("BOT_MMAP_MODE", "r") or None
+# Forests are also compiled to flat node arrays (forest.py), which score small
+# batches much faster than sklearn; larger batches still go to sklearn.
+BOT_COMPILED = os.getenv("BOT_COMPILED", "1") == "1"
+BOT_COMPILED_MAX_ROWS = int(os.getenv("BOT_COMPILED_MAX_ROWS", "1024"))
+# Packet-to-flow aggregation for /bot/flows (flow_meter.py). CICFlowMeter, which the
+# training features come from, ends flows 120 s after their first packet or on FIN/RST.
+BOT_FLOW_MAX_FLOWS = int(os.getenv("BOT_FLOW_MAX_FLOWS", "100000"))
+BOT_FLOW_IDLE_S = float(os.getenv("BOT_FLOW_IDLE_S", "120"))
+BOT_FLOW_ACTIVE_S = float(os.getenv("BOT_FLOW_ACTIVE_S", "120"))
+
+models_store: Dict[str, Dict] = {"rf": {"model": None, "scaler": None, "compiled": None},
+                                 "iso": {"model": None, "scaler": None, "compiled": None}}
+bot_flow_meter = FlowMeter(BOT_FLOW_MAX_FLOWS, BOT_FLOW_IDLE_S, BOT_FLOW_ACTIVE_S)
 
 
 class TrafficFlow(BaseModel):
@@ -227,11 +514,43 @@ class TrafficFlow(BaseModel):
     flow_iat_mean: float
 
 
+BOT_FEATURES = list(TrafficFlow.model_fields)
+
+
 class BatchPredictionRequest(BaseModel):
     flows: List[TrafficFlow]
     model_type: str = "rf"
 
 
+class ColumnarBatchRequest(BaseModel):
+    """One array per TrafficFlow feature; row i of every array is flow i."""
+    model_type: str = "rf"
+    flow_duration: List[float]
+    flow_byts_s: List[float]
+    flow_pkts_s: List[float]
+    pkt_len_mean: List[float]
+    pkt_len_std: List[float]
+    fwd_pkts_s: List[float]
+    bwd_pkts_s: List[float]
+    flow_iat_mean: List[float]
+
+
+class PacketEvent(BaseModel):
+    ts: float  # seconds
+    src: str
+    dst: str
+    sport: int = Field(0, ge=0, le=65535)
+    dport: int = Field(0, ge=0, le=65535)
+    proto: Union[int, str] = 6  # number or tcp / udp / icmp / icmpv6
+    length: int = Field(..., ge=0, le=0xFFFFFFFF)  # IP length, header included
+    flags: int = Field(0, ge=0, le=255)  # TCP flag bits; FIN (0x01) or RST (0x04) ends the flow
+
+
+class PacketBatchRequest(BaseModel):
+    packets: List[PacketEvent]
+    model_type: str = "rf"
+
+
 class PredictionResponse(BaseModel):
     prediction: int
     prediction_label: str
@@ -248,8 +567,8 @@ def bot_load_models():
 
     if os.path.exists(RF_MODEL_PATH) and os.path.exists(RF_SCALER_PATH):
         try:
-            models_store["rf"]["model"] = joblib.load(RF_MODEL_PATH)
-            models_store["rf"]["scaler"] = joblib.load(RF_SCALER_PATH)
+            models_store["rf"]["model"] = joblib.load(RF_MODEL_PATH, mmap_mode=BOT_MMAP_MODE)
+            models_store["rf"]["scaler"] = joblib.load(RF_SCALER_PATH, mmap_mode=BOT_MMAP_MODE)
             logger.info(f"Loaded RF model from {RF_MODEL_PATH}")
         except Exception as e:
             logger.warning(f"Failed to load RF model: {e}")
@@ -258,14 +577,39 @@ def bot_load_models():
 
     if os.path.exists(ISO_MODEL_PATH) and os.path.exists(ISO_SCALER_PATH):
         try:
-            models_store["iso"]["model"] = joblib.load(ISO_MODEL_PATH)
-            models_store["iso"]["scaler"] = joblib.load(ISO_SCALER_PATH)
+            models_store["iso"]["model"] = joblib.load(ISO_MODEL_PATH, mmap_mode=BOT_MMAP_MODE)
+            models_store["iso"]["scaler"] = joblib.load(ISO_SCALER_PATH, mmap_mode=BOT_MMAP_MODE)
             logger.info(f"Loaded ISO model from {ISO_MODEL_PATH}")
         except Exception as e:
             logger.warning(f"Failed to load ISO model: {e}")
     else:
         logger.info("ISO model files not found for bot detection")
 
+    for kind in ("rf", "iso"):
+        models_store[kind]["compiled"] = _compile_bot_model(kind) if BOT_COMPILED else None
+
+
+def _compile_bot_model(kind: str):
+    model = models_store[kind]["model"]
+    if model is None:
+        return None
+    try:
+        compiled = compile_forest(model)
+    except Exception as e:
+        logger.warning(f"Could not compile the {kind} forest, scoring with sklearn: {e}")
+        return None
+    if compiled is None:
+        logger.warning(f"{type(model).__name__} is not a supported forest; {kind} scores with sklearn")
+    else:
+        logger.info(f"Compiled {kind} forest: {compiled.n_trees} trees, {compiled.nbytes / 2 ** 20:.1f} MB")
+    return compiled
+
+
+def _bot_forest(kind: str, rows: int):
+    """The compiled forest for batches it scores faster, else the sklearn model (same outputs either way)."""
+    compiled = models_store[kind]["compiled"]
+    return compiled if compiled is not None and rows <= BOT_COMPILED_MAX_ROWS else models_store[kind]["model"]
+
 
 def _traffic_flow_to_array(flow: TrafficFlow) -> np.ndarray:
     return np.array([[
@@ -280,33 +624,67 @@ def _traffic_flow_to_array(flow: TrafficFlow) -> np.ndarray:
     ]])
 
 
-def _predict_rf(flow: TrafficFlow) -> Dict:
+def _flows_to_matrix(flows: List[TrafficFlow]) -> np.ndarray:
+    return np.array([[getattr(f, name) for name in BOT_FEATURES] for f in flows], dtype=np.float64).reshape(-1, len(BOT_FEATURES))
+
+
+def _predict_rf_batch(X: np.ndarray):
+    """Scores an N x 8 matrix with one scaler.transform and one predict_proba call."""
     if models_store["rf"]["model"] is None or models_store["rf"]["scaler"] is None:
         raise HTTPException(status_code=503, detail="RandomForest model not loaded")
 
-    X = _traffic_flow_to_array(flow)
+    model = _bot_forest("rf", len(X))
     X_scaled = models_store["rf"]["scaler"].transform(X)
-    pred = models_store["rf"]["model"].predict(X_scaled)[0]
-    proba = models_store["rf"]["model"].predict_proba(X_scaled)[0]
-    confidence = float(np.max(proba))
-    return {"prediction": int(pred), "prediction_label": "Bot/Attack" if pred == 1 else "Normal", "confidence": confidence, "model_type": "rf"}
+    proba = model.predict_proba(X_scaled)
+    # Same as model.predict(), without a second pass over the trees
+    pred = model.classes_.take(np.argmax(proba, axis=1))
+    return pred.astype(int), proba.max(axis=1), pred == 1
 
 
-def _predict_iso(flow: TrafficFlow) -> Dict:
+def _predict_iso_batch(X: np.ndarray):
+    """Scores an N x 8 matrix with one scaler.transform and one decision_function call."""
     if models_store["iso"]["model"] is None or models_store["iso"]["scaler"] is None:
         raise HTTPException(status_code=503, detail="IsolationForest model not loaded")
 
-    X = _traffic_flow_to_array(flow)
     X_scaled = models_store["iso"]["scaler"].transform(X)
-    pred = models_store["iso"]["model"].predict(X_scaled)[0]
-    anomaly_score = models_store["iso"]["model"].decision_function(X_scaled)[0]
-    confidence = float(abs(anomaly_score))
-    return {"prediction": int(pred), "prediction_label": "Bot/Attack" if pred == -1 else "Normal", "confidence": confidence, "model_type": "iso"}
+    anomaly_score = _bot_forest("iso", len(X)).decision_function(X_scaled)
+    # IsolationForest.predict() marks negative decision scores as anomalies (-1)
+    pred = np.where(anomaly_score < 0, -1, 1)
+    return pred, np.abs(anomaly_score), pred == -1
+
+
+BOT_BATCH_PREDICTORS = {"rf": _predict_rf_batch, "iso": _predict_iso_batch}
+
+
+def bot_predict_matrix(X: np.ndarray, model_type: str):
+    if model_type not in BOT_BATCH_PREDICTORS:
+        raise HTTPException(status_code=400, detail="model_type must be 'rf' or 'iso'")
+    require_model("bot")
+    with stage_seconds.time("bot", "forward"):
+        result = BOT_BATCH_PREDICTORS[model_type](X)
+    batch_rows.observe(len(X), "bot")
+    return result
+
+
+def bot_predictions(X: np.ndarray, model_type: str) -> List[Dict]:
+    pred, confidence, is_bot = bot_predict_matrix(X, model_type)
+    return [{"prediction": int(p), "prediction_label": "Bot/Attack" if b else "Normal", "confidence": float(c), "model_type": model_type}
+            for p, c, b in zip(pred.tolist(), confidence.tolist(), is_bot.tolist())]
+
+
+def _predict_rf(flow: TrafficFlow) -> Dict:
+    return bot_predictions(_traffic_flow_to_array(flow), "rf")[0]
+
+
+def _predict_iso(flow: TrafficFlow) -> Dict:
+    return bot_predictions(_traffic_flow_to_array(flow), "iso")[0]
 
 
 @bot_router.get("/health")
 def bot_health():
-    return {"status": "ok", "rf_loaded": models_store["rf"]["model"] is not None, "iso_loaded": models_store["iso"]["model"] is not None}
+    return {"status": "ok", "rf_loaded": models_store["rf"]["model"] is not None, "iso_loaded": models_store["iso"]["model"] is not None,
+            "rf_compiled": models_store["rf"]["compiled"] is not None, "iso_compiled": models_store["iso"]["compiled"] is not None,
+            "flows": bot_flow_meter.stats()}
 
 
 @bot_router.post("/predict/supervised", response_model=PredictionResponse)
@@ -321,18 +699,150 @@ def predict_unsupervised(flow: TrafficFlow):
 
 @bot_router.post("/predict/batch")
 def predict_batch(request: BatchPredictionRequest):
-    predictions = []
-    for flow in request.flows:
-        if request.model_type == "rf":
-            result = _predict_rf(flow)
-        elif request.model_type == "iso":
-            result = _predict_iso(flow)
-        else:
-            raise HTTPException(status_code=400, detail="model_type must be 'rf' or 'iso'")
-        predictions.append(result)
+    if request.model_type not in BOT_BATCH_PREDICTORS:
+        raise HTTPException(status_code=400, detail="model_type must be 'rf' or 'iso'")
+    if not request.flows:
+        return {"predictions": [], "total": 0}
+    predictions = bot_predictions(_flows_to_matrix(request.flows), request.model_type)
     return {"predictions": predictions, "total": len(predictions)}
 
 
+@bot_router.post("/predict/batch/columnar")
+def predict_batch_columnar(request: ColumnarBatchRequest):
+    if request.model_type not in BOT_BATCH_PREDICTORS:
+        raise HTTPException(status_code=400, detail="model_type must be 'rf' or 'iso'")
+    columns = [getattr(request, name) for name in BOT_FEATURES]
+    n = len(columns[0])
+    if any(len(col) != n for col in columns):
+        raise HTTPException(status_code=400, detail="all feature arrays must have the same length")
+    if n == 0:
+        return {"prediction": [], "prediction_label": [], "confidence": [], "model_type": request.model_type, "total": 0}
+
+    pred, confidence, is_bot = bot_predict_matrix(np.array(columns, dtype=np.float64).T, request.model_type)
+    labels = np.where(is_bot, "Bot/Attack", "Normal")
+    return {"prediction": pred.tolist(), "prediction_label": labels.tolist(), "confidence": confidence.tolist(),
+            "model_type": request.model_type, "total": n}
+
+
+@bot_router.post("/predict/stream")
+async def predict_stream(request: Request, model_type: str = Query("rf")):
+    """
+    NDJSON in, NDJSON out: each input line is a TrafficFlow object; each output line is
+    `{"line", "id"?, "prediction", "prediction_label", "confidence", "model_type"}`, in order.
+    """
+    if model_type not in BOT_BATCH_PREDICTORS:
+        raise HTTPException(status_code=400, detail="model_type must be 'rf' or 'iso'")
+    await run_in_threadpool(require_model, "bot")
+    if models_store[model_type]["model"] is None:
+        raise HTTPException(status_code=503, detail=f"{model_type} bot model not loaded")
+    return stream_response(request, TrafficFlow.model_validate,
+                           lambda flows: bot_predictions(_flows_to_matrix(flows), model_type))
+
+
+def _require_bot_model(model_type: str):
+    if model_type not in BOT_BATCH_PREDICTORS:
+        raise HTTPException(status_code=400, detail="model_type must be 'rf' or 'iso'")
+    require_model("bot")
+    if models_store[model_type]["model"] is None:
+        raise HTTPException(status_code=503, detail=f"{model_type} bot model not loaded")
+
+
+def bot_flow_verdicts(records: FlowRecords, model_type: str) -> Dict:
+    flows = records.to_dicts()
+    if flows:
+        for flow, verdict in zip(flows, bot_predictions(records.features, model_type)):
+            flow.update(verdict)
+    return {"flows": flows, "total": len(flows), "live_flows": bot_flow_meter.stats()["live"]}
+
+
+@bot_router.post("/flows/packets")
+def bot_flow_packets(request: PacketBatchRequest):
+    """
+    Adds packets to the flow table and scores the flows they finished. Each finished flow is returned with
+    its endpoints, `end` reason and TrafficFlow features, plus the model's verdict.
+    """
+    _require_bot_model(request.model_type)
+    try:
+        packets = packets_from_events([p.model_dump() for p in request.packets])
+    except (KeyError, ValueError, OverflowError) as e:
+        raise HTTPException(status_code=400, detail=f"invalid packet: {e}")
+    return bot_flow_verdicts(bot_flow_meter.ingest(packets), request.model_type)
+
+
+@bot_router.post("/flows/flush")
+def bot_flow_flush(model_type: str = Query("rf")):
+    """Ends and scores every live flow."""
+    _require_bot_model(model_type)
+    return bot_flow_verdicts(bot_flow_meter.flush(), model_type)
+
+
+############################
+# DDoS: request rates per IP and subnet (rate_sketch.py)
+############################
+ddos_router = APIRouter(prefix="/ddos", tags=["DDoS"])
+
+# Requests/s at which the score starts rising; it reaches 1 at DDOS_FLOOD_FACTOR times the limit.
+DDOS_IP_LIMIT = float(os.getenv("DDOS_IP_LIMIT", "20"))
+DDOS_SUBNET_LIMIT = float(os.getenv("DDOS_SUBNET_LIMIT", "200"))
+DDOS_FLOOD_FACTOR = float(os.getenv("DDOS_FLOOD_FACTOR", "5"))
+DDOS_V4_PREFIX = int(os.getenv("DDOS_V4_PREFIX", "24"))
+DDOS_V6_PREFIX = int(os.getenv("DDOS_V6_PREFIX", "64"))
+DDOS_WINDOW_S = float(os.getenv("DDOS_WINDOW_S", "10"))
+DDOS_BUCKETS = int(os.getenv("DDOS_BUCKETS", "10"))
+# Memory is 2 * (DDOS_BUCKETS + 1) * depth * width * 4 bytes: 11.5 MB with the defaults.
+DDOS_SKETCH_WIDTH = int(os.getenv("DDOS_SKETCH_WIDTH", "32768"))
+DDOS_SKETCH_DEPTH = int(os.getenv("DDOS_SKETCH_DEPTH", "4"))
+DDOS_TOP_K = int(os.getenv("DDOS_TOP_K", "64"))
+
+# Created at import so that gunicorn workers forked from a preloading master share the counters.
+ddos_tracker = RateTracker(DDOS_IP_LIMIT, DDOS_SUBNET_LIMIT, DDOS_FLOOD_FACTOR, DDOS_V4_PREFIX, DDOS_V6_PREFIX,
+                           DDOS_WINDOW_S, DDOS_BUCKETS, DDOS_SKETCH_WIDTH, DDOS_SKETCH_DEPTH, DDOS_TOP_K)
+
+
+class RateObservation(BaseModel):
+    ip: str
+    count: int = Field(1, ge=1, le=1_000_000)
+
+
+def _ddos_result(result: Optional[Dict], ip: str) -> Dict:
+    if result is None:
+        raise HTTPException(status_code=400, detail=f"not an IP address: {ip!r}")
+    return result
+
+
+def ddos_observe_many(ips: List[Optional[str]]) -> List[Optional[Dict]]:
+    """Counts one request per IP; None for a missing IP or one that is not an address.
+
+    The sketch takes a cross-process lock, so call this off the event loop.
+    """
+    return [ddos_tracker.observe(ip) if ip else None for ip in ips]
+
+
+@ddos_router.post("/observe")
+def ddos_observe(req: RateObservation):
+    """
+    Counts `count` requests from `ip` and returns the request rates of the IP and its subnet over
+    the sliding window, with the 0..1 ddos `score`.
+    """
+    return _ddos_result(ddos_tracker.observe(req.ip, req.count), req.ip)
+
+
+@ddos_router.get("/score")
+def ddos_score(ip: str = Query(...)):
+    """Rates and score of `ip` without counting a request."""
+    return _ddos_result(ddos_tracker.peek(ip), ip)
+
+
+@ddos_router.get("/heavy-hitters")
+def ddos_heavy_hitters():
+    return ddos_tracker.heavy_hitters()
+
+
+@ddos_router.get("/health")
+def ddos_health():
+    return {"status": "ok", **ddos_tracker.stats()}
+
+
 ############################
 # User Behaviour (Behavior LSTM)
 ############################
@@ -341,10 +851,17 @@ beh_router = APIRouter(prefix="/behaviour", tags=["UserBehaviour"])
 BEH_MODEL_PATH = os.path.join("User_Behaviour", "behavior_lstm_model.h5")
 BEH_ENCODER_PATH = os.path.join("User_Behaviour", "action_encoder.pkl")
 BEH_MAXLEN = 20
+BEH_LAZY_LOAD = os.getenv("BEH_LAZY_LOAD", "0") == "1"
+BEH_BACKEND = os.getenv("BEH_BACKEND", "keras")  # keras | tflite | onnx
+BEH_QUANT = os.getenv("BEH_QUANT") or None
+BEH_SESSION_MAX_ENTRIES = int(os.getenv("BEH_SESSION_MAX_ENTRIES", "100000"))
+BEH_SESSION_TTL_S = float(os.getenv("BEH_SESSION_TTL_S", "1800"))
+BEH_SESSION_MAX_MB = float(os.getenv("BEH_SESSION_MAX_MB", "32"))
 
 beh_model = None
 beh_label_to_index = None
 beh_unknown_idx = None
+beh_sessions: Optional[SessionStore] = None
 
 
 class EventItem(BaseModel):
@@ -362,12 +879,16 @@ class PredictSessionsRequest(BaseModel):
     sessions: List[SessionInput]
 
 
+class SessionEventsRequest(BaseModel):
+    events: List[EventItem] = Field(..., min_length=1)
+
+
 def beh_combine_token(e: EventItem) -> str:
     return f"{e.Event}_{e.page_name}_{e.browser_type}"
 
 
 def beh_load_artifacts():
-    global beh_model, beh_label_to_index, beh_unknown_idx
+    global beh_model, beh_label_to_index, beh_unknown_idx, beh_sessions
     if not TF_AVAILABLE:
         logger.error("TensorFlow not available - Behaviour endpoints will fail")
         beh_model = None
@@ -378,13 +899,33 @@ def beh_load_artifacts():
         beh_model = None
         return
 
-    beh_model = tf.keras.models.load_model(BEH_MODEL_PATH)
+    beh_model = load_inference_model(BEH_MODEL_PATH, BEH_BACKEND, seq_len=BEH_MAXLEN, num_threads=INFERENCE_THREADS,
+                                     quantization=BEH_QUANT)
     with open(BEH_ENCODER_PATH, "rb") as f:
         encoder_obj = pickle.load(f)
     classes = list(encoder_obj.classes_)
     beh_label_to_index = {label: idx for idx, label in enumerate(classes)}
     beh_unknown_idx = len(classes)
 
+    # The session scorer runs the float weights, so it would not match a quantized model's scores.
+    if getattr(beh_model, "quantization", None):
+        logger.warning(f"Behaviour model is served {beh_model.quantization}-quantized; incremental session scoring is disabled")
+        beh_sessions = None
+        return
+    # The TFLite / ONNX runners do not carry the Keras weights; those are read from the .h5 without TensorFlow.
+    keras_model = getattr(beh_model, "model", None)
+    try:
+        scorer = LstmSessionScorer.from_keras(keras_model) if keras_model is not None else LstmSessionScorer.from_h5(BEH_MODEL_PATH)
+    except Exception as e:
+        logger.warning(f"Could not read the behaviour model weights: {e}")
+        scorer = None
+    if scorer is None:
+        logger.warning("Behaviour model is not Embedding -> LSTM -> Dense; incremental session scoring is disabled")
+        beh_sessions = None
+    else:
+        beh_sessions = SessionStore(scorer, BEH_MAXLEN, BEH_SESSION_MAX_ENTRIES, BEH_SESSION_TTL_S,
+                                    int(BEH_SESSION_MAX_MB * 1024 * 1024))
+
 
 def beh_encode_session(events: List[EventItem]) -> List[int]:
     tokens = [beh_combine_token(e) for e in events]
@@ -392,20 +933,63 @@ def beh_encode_session(events: List[EventItem]) -> List[int]:
     return indices
 
 
-@beh_router.post("/predict")
-def beh_predict(req: PredictSessionsRequest):
+def beh_score(sessions: List[SessionInput]) -> List[Dict]:
+    require_model("behaviour")
     if beh_model is None:
         raise HTTPException(status_code=500, detail="Behaviour model not loaded")
+
+    with stage_seconds.time("behaviour", "tokenize"):
+        seqs = [beh_encode_session(s.events) if s.events else [] for s in sessions]
+    with stage_seconds.time("behaviour", "pad"):
+        X = pad_post(seqs, BEH_MAXLEN, truncating="pre")
+    with stage_seconds.time("behaviour", "forward"):
+        probs = beh_model(X).reshape(-1)
+    batch_rows.observe(len(X), "behaviour")
+    labels = (probs >= 0.5).astype(int)
+
+    return [{"sessn_id": s.sessn_id, "probability": float(p), "label": int(l)} for s, p, l in zip(sessions, probs, labels)]
+
+
+@beh_router.post("/predict")
+def beh_predict(req: PredictSessionsRequest):
     if not req.sessions:
         raise HTTPException(status_code=400, detail="No sessions provided")
 
-    seqs = [beh_encode_session(s.events) if s.events else [] for s in req.sessions]
-    X = pad_sequences(seqs, maxlen=BEH_MAXLEN, padding="post", value=0)
-    probs = beh_model.predict(X).reshape(-1)
-    labels = (probs >= 0.5).astype(int)
+    return {"predictions": beh_score(req.sessions)}
+
 
-    predictions = [{"sessn_id": s.sessn_id, "probability": float(p), "label": int(l)} for s, p, l in zip(req.sessions, probs, labels)]
-    return {"predictions": predictions}
+@beh_router.get("/health")
+def beh_health():
+    return {"status": "ok" if beh_model is not None else "missing-artifacts", "backend": getattr(beh_model, "backend", None),
+            "quantization": getattr(beh_model, "quantization", None),
+            "sessions": beh_sessions.stats() if beh_sessions is not None else None}
+
+
+@beh_router.post("/sessions/{sessn_id}/events")
+def beh_session_events(sessn_id: str, req: SessionEventsRequest):
+    """
+    Appends events to a session held server-side and returns its updated score, the same
+    as `/behaviour/predict` on every event seen so far. Cost per event does not grow with
+    the session. `events_seen` restarts from the new events when the session had expired
+    or been evicted; resend the full history to rebuild it.
+    """
+    require_model("behaviour")
+    if beh_sessions is None:
+        raise HTTPException(status_code=501, detail="Incremental scoring is not available for this behaviour model")
+
+    with stage_seconds.time("behaviour", "tokenize"):
+        tokens = beh_encode_session(req.events)
+    with stage_seconds.time("behaviour", "forward"):
+        prob, seen = beh_sessions.append(sessn_id, tokens)
+    batch_rows.observe(1, "behaviour")
+    return {"sessn_id": sessn_id, "probability": prob, "label": int(prob >= 0.5), "events_seen": seen}
+
+
+@beh_router.delete("/sessions/{sessn_id}")
+def beh_session_end(sessn_id: str):
+    if beh_sessions is None or not beh_sessions.discard(sessn_id):
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return {"sessn_id": sessn_id, "discarded": True}
 
 
 ############################
@@ -416,9 +1000,27 @@ xss_router = APIRouter(prefix="/xss", tags=["XSS"])
 XSS_MODEL_CANDIDATES = [os.path.join("XSS", "xss_bilstm_model.h5"), os.path.join("XSS", "models", "xss_bilstm_model.h5"), os.getenv("XSS_MODEL_PATH")]
 XSS_TOKENIZER_CANDIDATES = [os.path.join("XSS", "xss_tokenizer.pkl"), os.path.join("XSS", "models", "xss_tokenizer.pkl"), os.getenv("XSS_TOKENIZER_PATH")]
 
+XSS_BATCH_MAX_SIZE = int(os.getenv("XSS_BATCH_MAX_SIZE", "32"))
+XSS_BATCH_MAX_WAIT_MS = float(os.getenv("XSS_BATCH_MAX_WAIT_MS", "5"))
+XSS_CACHE_MAX_ENTRIES = int(os.getenv("XSS_CACHE_MAX_ENTRIES", "100000"))
+XSS_CACHE_TTL_S = float(os.getenv("XSS_CACHE_TTL_S", "3600"))
+XSS_CACHE_MAX_MB = float(os.getenv("XSS_CACHE_MAX_MB", "64"))
+XSS_COALESCE = os.getenv("XSS_COALESCE", "1") == "1"
+XSS_LAZY_LOAD = os.getenv("XSS_LAZY_LOAD", "0") == "1"
+XSS_BACKEND = os.getenv("XSS_BACKEND", "keras")  # keras | tflite | onnx
+XSS_QUANT = os.getenv("XSS_QUANT") or None
+XSS_BUCKETS = env_ints("XSS_BUCKETS")  # same trade-off as BIL_BUCKETS
+XSS_CASCADE = os.getenv("XSS_CASCADE", "1") == "1"
+XSS_CASCADE_PATH = os.getenv("XSS_CASCADE_PATH", os.path.join("XSS", "cascade_tier1.npz"))
+# Tier-1 exits are calibrated for this decision threshold; other thresholds skip the cascade.
+CASCADE_THRESHOLD = 0.5
+
 xss_model = None
 xss_tokenizer = None
+xss_cascade: Optional[CascadeTier1] = None
 xss_saved_maxlen: Optional[int] = None
+xss_cache = VerdictCache("xss", XSS_CACHE_MAX_ENTRIES, XSS_CACHE_TTL_S, int(XSS_CACHE_MAX_MB * 1024 * 1024))
+xss_flights = SingleFlight("xss", XSS_COALESCE)
 
 
 class XssPredictRequest(BaseModel):
@@ -437,7 +1039,7 @@ def _first_existing(paths: List[Optional[str]]) -> Optional[str]:
 
 
 def xss_load_model_and_tokenizer():
-    global xss_model, xss_tokenizer, xss_saved_maxlen
+    global xss_model, xss_tokenizer, xss_saved_maxlen, xss_cascade
     if not TF_AVAILABLE:
         logger.error("TensorFlow not available - XSS endpoints will fail")
         xss_model = None
@@ -450,27 +1052,87 @@ def xss_load_model_and_tokenizer():
         logger.warning("XSS model or tokenizer not found")
         xss_model = None
         xss_tokenizer = None
+        xss_cache.set_version(None)
         return
 
-    xss_model = tf.keras.models.load_model(model_path)
+    # Unpickling the Keras tokenizer imports Keras; go through the shared,
+    # serialized TensorFlow import so it cannot race the other loaders.
+    import_tensorflow(INFERENCE_THREADS)
     data = pickle.load(open(tok_path, "rb"))
     if isinstance(data, dict) and "tokenizer" in data:
-        xss_tokenizer = data["tokenizer"]
+        keras_tokenizer = data["tokenizer"]
         xss_saved_maxlen = data.get("maxlen")
     else:
-        xss_tokenizer = data
+        keras_tokenizer = data
         xss_saved_maxlen = None
+    xss_tokenizer = fast_tokenizer.from_keras(keras_tokenizer)
+    xss_model = load_inference_model(model_path, XSS_BACKEND, seq_len=xss_saved_maxlen, num_threads=INFERENCE_THREADS,
+                                     bucket_lengths=XSS_BUCKETS, quantization=XSS_QUANT)
+    xss_cache.set_version(model_version(xss_model.path, tok_path))
+    xss_cascade = load_cascade(XSS_CASCADE_PATH, XSS_CASCADE)
 
 
-def xss_prepare_X(payloads: List[str], maxlen: Optional[int]):
-    seqs = xss_tokenizer.texts_to_sequences(payloads)
+def xss_pad(seqs: List[List[int]], maxlen: Optional[int]):
     if maxlen is None:
         lengths = [len(s) for s in seqs]
         maxlen = min(max(lengths) if lengths else 200, 200)
-    X = pad_sequences(seqs, maxlen=maxlen, padding="post", truncating="post")
+    X = pad_post(seqs, maxlen)
     return X, maxlen
 
 
+def xss_forward(seqs: List[List[int]]) -> List[float]:
+    timings: Dict[str, float] = {}
+    if xss_saved_maxlen is not None:
+        scores = predict_bucketed(xss_model, seqs, timings=timings)
+    else:
+        start = time.perf_counter()
+        X, _ = xss_pad(seqs, xss_saved_maxlen)
+        padded = time.perf_counter()
+        scores = xss_model(X).ravel()
+        timings = {"pad": padded - start, "forward": time.perf_counter() - padded}
+    observe_forward("xss", len(seqs), timings)
+    return scores.astype(float).tolist()
+
+
+def xss_score(payloads: List[str], use_cache: bool = True, cascade: bool = True) -> List[float]:
+    require_model("xss")
+    if xss_model is None or xss_tokenizer is None:
+        raise HTTPException(status_code=500, detail="XSS model or tokenizer not loaded")
+
+    version = xss_cache.version
+    keys = [payload_key(p) for p in payloads]
+    scores = [xss_cache.get(k) for k in keys] if use_cache else [None] * len(payloads)
+    missing = [i for i, s in enumerate(scores) if s is None]
+    if cascade:
+        missing = cascade_exits("xss", xss_cascade, payloads, scores, missing)
+    if not missing:
+        return scores
+
+    with xss_flights.claim([(version, keys[i]) for i in missing]) as flight:
+        lead = [missing[j] for j in flight.lead]
+        if lead:
+            with stage_seconds.time("xss", "tokenize"):
+                seqs = xss_tokenizer.texts_to_sequences([payloads[i] for i in lead], maxlen=xss_saved_maxlen)
+            futures = xss_batcher.submit_many(seqs)
+            try:
+                for j, i, f in zip(flight.lead, lead, futures):
+                    scores[i] = f.result()
+                    if use_cache:
+                        xss_cache.put(keys[i], scores[i], version)
+                    flight.resolve(j, scores[i])
+            except Exception as e:
+                logger.error(f"XSS prediction failed: {e}")
+                raise HTTPException(status_code=500, detail="XSS model prediction failed")
+
+    for j, i in enumerate(missing):
+        if scores[i] is None:
+            scores[i] = flight.result(j)
+    return scores
+
+
+xss_batcher = MicroBatcher("xss", xss_forward, XSS_BATCH_MAX_SIZE, XSS_BATCH_MAX_WAIT_MS)
+
+
 @xss_router.get("/")
 def xss_root():
     return {"name": "XSS Detector (mounted)", "endpoints": {"predict": "/xss/predict", "predict_batch": "/xss/predict/batch"}}
@@ -479,53 +1141,186 @@ def xss_root():
 @xss_router.get("/health")
 def xss_health():
     ok = xss_model is not None and xss_tokenizer is not None
-    return {"status": "ok" if ok else "missing-artifacts", "maxlen": xss_saved_maxlen}
+    return {"status": "ok" if ok else "missing-artifacts", "maxlen": xss_saved_maxlen, "backend": getattr(xss_model, "backend", None),
+            "quantization": getattr(xss_model, "quantization", None),
+            "lengths": getattr(xss_model, "lengths", None), "cache": xss_cache.stats(), "coalescing": xss_flights.stats(),
+            "cascade": xss_cascade.stats() if xss_cascade is not None else None}
 
 
 @xss_router.post("/predict")
 def xss_predict(req: XssPredictRequest, threshold: float = Query(0.5, ge=0.0, le=1.0)):
-    if xss_model is None or xss_tokenizer is None:
-        raise HTTPException(status_code=500, detail="XSS model or tokenizer not loaded")
-    payloads = [req.payload or ""]
-    X, used_maxlen = xss_prepare_X(payloads, xss_saved_maxlen)
-    probs = xss_model.predict(X, batch_size=1).ravel().astype(float)
-    prob = float(probs[0])
+    prob = xss_score([req.payload or ""], cascade=threshold == CASCADE_THRESHOLD)[0]
     pred = int(prob >= threshold)
     return {"payload": req.payload, "prob_malicious": prob, "pred_label": pred, "threshold": threshold}
 
 
 @xss_router.post("/predict/batch")
 def xss_predict_batch(req: XssPredictBatchRequest, threshold: float = Query(0.5, ge=0.0, le=1.0)):
-    if xss_model is None or xss_tokenizer is None:
-        raise HTTPException(status_code=500, detail="XSS model or tokenizer not loaded")
     payloads = [p or "" for p in req.payloads]
     if len(payloads) == 0:
         raise HTTPException(status_code=400, detail="payloads must be a non-empty list")
-    X, used_maxlen = xss_prepare_X(payloads, xss_saved_maxlen)
-    probs = xss_model.predict(X, batch_size=min(len(payloads), 128)).ravel().astype(float)
+    probs = xss_score(payloads, cascade=threshold == CASCADE_THRESHOLD)
     results = [{"payload": payloads[i], "prob_malicious": float(probs[i]), "pred_label": int(probs[i] >= threshold), "threshold": threshold} for i in range(len(payloads))]
     return {"results": results, "threshold": threshold}
 
 
+@xss_router.post("/predict/stream")
+async def xss_predict_stream(request: Request, threshold: float = Query(0.5, ge=0.0, le=1.0)):
+    """
+    NDJSON in, NDJSON out: one `{"line", "id"?, "prob_malicious", "pred_label"}` per non-blank input line, in order.
+    Verdicts bypass the cache so bulk rescoring does not evict live traffic.
+    """
+    await run_in_threadpool(require_model, "xss")
+    cascade = threshold == CASCADE_THRESHOLD
+
+    def score(payloads: List[str]) -> List[Dict]:
+        return [{"prob_malicious": p, "pred_label": int(p >= threshold)}
+                for p in xss_score(payloads, use_cache=False, cascade=cascade)]
+
+    return stream_response(request, payload_from_line, score)
+
+
 ############################
 # App startup: load all artifacts
 ############################
+model_registry.register("bilstm", bil_startup_load, lambda: bil_model is not None and bil_tokenizer is not None, lazy=BIL_LAZY_LOAD)
+model_registry.register("bot", bot_load_models, lambda: any(m["model"] is not None for m in models_store.values()), lazy=BOT_LAZY_LOAD)
+model_registry.register("behaviour", beh_load_artifacts, lambda: beh_model is not None, lazy=BEH_LAZY_LOAD)
+model_registry.register("xss", xss_load_model_and_tokenizer, lambda: xss_model is not None and xss_tokenizer is not None, lazy=XSS_LAZY_LOAD)
+
+
+# Models that are safe to load in a pre-forking master (see gunicorn.conf.py).
+# TensorFlow is not fork-safe, so the Keras models always load in the workers.
+PRELOAD_MODELS = [name for name in os.getenv("PRELOAD_MODELS", "bot").split(",") if name.strip()]
+FORK_SAFE_MODELS = {"bot"}
+
+
+def preload_models():
+    """Loads the fork-safe models on the calling thread, so forked workers share their memory."""
+    for name in PRELOAD_MODELS:
+        if name not in FORK_SAFE_MODELS:
+            logger.warning(f"Not preloading {name} model: it is not fork-safe")
+            continue
+        model_registry.load_now(name)
+
+
+def publish_worker_status():
+    worker_status.publish({"pid": os.getpid(), "ready": model_registry.ready(), "not_ready": model_registry.not_ready(),
+                           "models": model_registry.status()})
+
+
+def _registry_gauge():
+    return {(name,): float(s["state"] == "ready") for name, s in model_registry.status().items()}
+
+
+def _cache_counter(attr: str):
+    return lambda: {(c.name,): getattr(c, attr) for c in (bil_cache, xss_cache)}
+
+
+def _coalesced_counter():
+    return {(f.name,): f.coalesced for f in (bil_flights, xss_flights)}
+
+
+def _cascade_counter():
+    return {(router, outcome): count for router, tier in (("bilstm", bil_cascade), ("xss", xss_cascade)) if tier is not None
+            for outcome, count in dict(tier.counts).items()}
+
+
+metrics_registry.gauge_callback("waf_queue_depth", "Rows waiting in the micro-batch queue", ("router",),
+                                lambda: {("bilstm",): bil_batcher.qsize(), ("xss",): xss_batcher.qsize()})
+metrics_registry.gauge_callback("waf_model_loaded", "1 when the model is loaded (summed over workers)", ("model",), _registry_gauge)
+metrics_registry.gauge_callback("waf_cache_hits_total", "Verdict cache hits", ("router",), _cache_counter("hits"), kind="counter")
+metrics_registry.gauge_callback("waf_cache_misses_total", "Verdict cache misses", ("router",), _cache_counter("misses"), kind="counter")
+metrics_registry.gauge_callback("waf_coalesced_total", "Payloads that waited for an identical in-flight request instead of being scored",
+                                ("router",), _coalesced_counter, kind="counter")
+metrics_registry.gauge_callback("waf_cascade_total", "Payloads by cascade tier-1 outcome (exit_benign, exit_attack, deferred)",
+                                ("router", "outcome"), _cascade_counter, kind="counter")
+
+
+def _with_cache_hit_ratio(snapshot: Dict) -> Dict:
+    # Computed after merging, since ratios cannot be summed across workers.
+    hits = snapshot["waf_cache_hits_total"]["samples"]
+    misses = snapshot["waf_cache_misses_total"]["samples"]
+    ratios = {k: hits[k] / (hits[k] + misses.get(k, 0.0)) if hits[k] + misses.get(k, 0.0) else 0.0 for k in hits}
+    snapshot["waf_cache_hit_ratio"] = {"type": "gauge", "help": "Verdict cache hits / lookups", "labelnames": ["router"],
+                                       "samples": ratios}
+    return snapshot
+
+
+def _publish_metrics_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_S)
+        try:
+            worker_status.publish_metrics(metrics_registry.snapshot())
+        except Exception as e:
+            logger.warning(f"Publishing metrics failed: {e}")
+
 
 @app.on_event("startup")
 def app_startup():
-    # BILSTM
-    bil_startup_load()
-    # Bot detection
-    bot_load_models()
-    # Behaviour
-    beh_load_artifacts()
-    # XSS
-    xss_load_model_and_tokenizer()
+    # Eager models load concurrently in the background; /feature and any
+    # router whose model is ready serve immediately. Models preloaded by the
+    # server master are already ready here.
+    model_registry.on_update = publish_worker_status
+    model_registry.start()
+    publish_worker_status()
+    if worker_status.enabled():
+        threading.Thread(target=_publish_metrics_loop, name="metrics-publish", daemon=True).start()
+    if MODEL_LOAD_BLOCKING:
+        model_registry.wait_all()
+
+
+@app.get("/ready")
+def ready():
+    """200 once every model that gates readiness is ready to serve, 503 otherwise. Lists each model's load state.
+
+    Those are the ``READY_MODELS``, or by default every eager model whose
+    artifacts are present. One that is still loading or failed (or, when
+    listed in ``READY_MODELS``, has no artifacts) keeps the answer at 503;
+    ``not_ready`` names it with its error. Under gunicorn
+    the answer covers every worker: ready only when all expected workers have
+    reported in and each of them is ready.
+    """
+    body = {"ready": model_registry.ready(), "pid": os.getpid(), "not_ready": model_registry.not_ready(),
+            "models": model_registry.status()}
+    if worker_status.enabled():
+        workers = worker_status.collect()
+        expected = int(os.getenv("GUNICORN_WORKERS", "0"))
+        body["workers"] = workers
+        # Each model that cannot serve, with the workers it is failing on.
+        not_ready = {}
+        for pid, w in workers.items():
+            for name, problem in w.get("not_ready", {}).items():
+                not_ready.setdefault(name, {**problem, "pids": []})["pids"].append(int(pid))
+        if len(workers) < expected:
+            not_ready["workers"] = {"state": LOADING, "error": f"{len(workers)} of {expected} workers reported"}
+        body["not_ready"] = not_ready
+        body["ready"] = body["ready"] and not not_ready and all(w["ready"] for w in workers.values())
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text format. Under gunicorn, sums this worker's live metrics with the other workers' last snapshots."""
+    snapshot = metrics_registry.snapshot()
+    if worker_status.enabled():
+        snapshot = metrics.merge([snapshot, *worker_status.collect_metrics(exclude=os.getpid()).values()])
+    return PlainTextResponse(metrics.render(_with_cache_hit_ratio(snapshot)), media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("shutdown")
+async def app_shutdown():
+    model_registry.shutdown()
+    worker_status.remove(os.getpid())
+    bil_batcher.close()
+    xss_batcher.close()
+    await close_reputation()
 
 
 # include routers
 app.include_router(bil_router)
 app.include_router(bot_router)
+app.include_router(ddos_router)
 app.include_router(beh_router)
 app.include_router(xss_router)
 
@@ -535,6 +1330,21 @@ app.include_router(xss_router)
 feat_router = APIRouter(prefix="/feature", tags=["FeatureExtractor"])
 
 
+class FeatureItem(BaseModel):
+    payload: str = ""
+    ip: str = ""
+    ua: str = ""
+
+
+class FeatureBatchRequest(BaseModel):
+    items: List[FeatureItem]
+
+
+def feature_extract_timed(payloads: List[str]) -> List[Dict]:
+    with stage_seconds.time("feature", "tokenize"):
+        return extract_payload_features_batch(payloads)
+
+
 @feat_router.post("/extract_features")
 async def extract_features(request: Request):
     """
@@ -545,42 +1355,197 @@ async def extract_features(request: Request):
     ip = data.get("ip", "")
     ua = data.get("ua", "")
 
-    # --- Tokenize payload ---
-    tokens = tokenize_payload(payload)
-
-    # --- Calculate entropy ---
-    def calculate_entropy(s):
-        if not s:
-            return 0.0
-        probabilities = [float(s.count(c)) / len(s) for c in dict.fromkeys(list(s))]
-        entropy = - sum([p * math.log(p, 2) for p in probabilities])
-        return round(entropy, 3)
+    # --- Blocklist / allowlist: a listed IP gets its verdict without any feature extraction ---
+    verdict = ip_list_verdicts([ip])[0]
+    if verdict is not None:
+        return {"ip": ip, "verdict": verdict, "user_agent": ua}
 
-    entropy = calculate_entropy(payload) if payload else 0.0
+    # --- Tokens, entropy and payload hash ---
+    with stage_seconds.time("feature", "tokenize"):
+        response = extract_payload_features(payload)
 
     # --- GeoIP Lookup ---
-    geo = get_geoip(ip)
+    response["geo"] = get_geoip(ip)
 
     # --- IP Reputation ---
-    reputation_score = get_ip_reputation(ip)
-
-    # --- Hash the payload for uniqueness ---
-    payload_hash = hashlib.md5(payload.encode()).hexdigest()
-
-    # --- Response ---
-    response = {
-        "payload_hash": payload_hash,
-        "tokens": tokens,
-        "entropy": entropy,
-        "geo": geo,
-        "reputation_score": reputation_score,
-        "user_agent": ua
-    }
+    response["reputation_score"] = await get_ip_reputation_async(ip)
+
+    response["user_agent"] = ua
     return response
 
+
+@feat_router.post("/extract_features/batch")
+async def extract_features_batch(req: FeatureBatchRequest):
+    """
+    Same as /extract_features for many items. Payload entropy is computed in one
+    vectorized pass and each distinct IP is resolved once.
+    """
+    verdicts = ip_list_verdicts([it.ip for it in req.items])
+    items = [it for it, v in zip(req.items, verdicts) if v is None]
+    ips = [it.ip for it in items]
+    unique_ips = list(dict.fromkeys(ips))
+
+    results, geos, reputations = await asyncio.gather(
+        run_in_threadpool(feature_extract_timed, [it.payload for it in items]),
+        run_in_threadpool(get_geoip_batch, ips),
+        asyncio.gather(*(get_ip_reputation_async(ip) for ip in unique_ips)),
+    )
+    reputation = dict(zip(unique_ips, reputations))
+
+    for it, res, geo in zip(items, results, geos):
+        res["geo"] = geo
+        res["reputation_score"] = reputation[it.ip]
+        res["user_agent"] = it.ua
+    extracted = iter(results)
+    results = [next(extracted) if v is None else {"ip": it.ip, "verdict": v, "user_agent": it.ua}
+               for it, v in zip(req.items, verdicts)]
+    return {"results": results, "total": len(results)}
+
+
+@feat_router.get("/ip_lists")
+def feature_ip_lists():
+    return ip_lists_stats()
+
+
+@feat_router.post("/ip_lists/reload")
+def feature_ip_lists_reload():
+    """Reloads the blocklist and allowlist files in this process. Other workers pick the change up on their next check."""
+    return reload_ip_lists()
+
 app.include_router(feat_router)
 
 
+############################
+# Combined analysis: features and every model in one request
+############################
+analyze_router = APIRouter(tags=["Analyze"])
+
+
+class AnalyzeRequest(BaseModel):
+    payload: str = ""
+    ip: str = ""
+    ua: str = ""
+    flow: Optional[TrafficFlow] = None
+    sessions: Optional[List[SessionInput]] = None
+
+
+class AnalyzeBatchRequest(BaseModel):
+    requests: List[AnalyzeRequest]
+
+
+async def _analyze_part(name: str, errors: Dict[str, str], fn, *args):
+    try:
+        return await run_in_threadpool(fn, *args)
+    except HTTPException as e:
+        errors[name] = str(e.detail)
+    except Exception as e:
+        logger.error(f"analyze: {name} failed: {e}")
+        errors[name] = str(e)
+    return None
+
+
+async def _analyze_async_part(name: str, errors: Dict[str, str], coro):
+    try:
+        return await coro
+    except Exception as e:
+        logger.error(f"analyze: {name} failed: {e}")
+        errors[name] = str(e)
+    return None
+
+
+def listed_result(it: "AnalyzeRequest", verdict: str) -> Dict:
+    """Result for a request whose IP is on the blocklist or allowlist: the verdict, and no models run."""
+    return {"verdict": verdict, "scores": {"payload": None, "xss": None, "bot": None, "ddos": None, "behavior": None},
+            "bilstm": None, "xss": None, "bot": None, "ddos": None, "behaviour": None,
+            "features": {"user_agent": it.ua}, "errors": {}}
+
+
+async def analyze_many(items: List[AnalyzeRequest]) -> List[Dict]:
+    """Runs feature extraction and every applicable model for a list of requests.
+
+    Requests from a blocklisted or allowlisted IP get that ``verdict`` at once.
+    For the others each model is called once for the whole list, and the
+    independent parts run concurrently. A part that fails is reported under
+    ``errors`` and leaves its scores empty instead of failing the request.
+    """
+    verdicts = ip_list_verdicts([it.ip for it in items])
+    if any(v is not None for v in verdicts):
+        pending = [it for it, v in zip(items, verdicts) if v is None]
+        scored = iter(await analyze_many(pending) if pending else [])
+        return [next(scored) if v is None else listed_result(it, v) for it, v in zip(items, verdicts)]
+
+    errors: Dict[str, str] = {}
+    payloads = [it.payload or "" for it in items]
+    ips = list(dict.fromkeys(it.ip for it in items))
+    flows = [it.flow for it in items if it.flow is not None]
+    sessions = [s for it in items for s in (it.sessions or [])]
+
+    parts = {
+        "features": _analyze_part("features", errors, feature_extract_timed, payloads),
+        "geo": _analyze_part("geo", errors, get_geoip_batch, ips),
+        "reputation": _analyze_async_part("reputation", errors, asyncio.gather(*[get_ip_reputation_async(ip) for ip in ips])),
+        "bilstm": _analyze_part("bilstm", errors, bil_score, payloads),
+        "xss": _analyze_part("xss", errors, xss_score, payloads),
+        "ddos": _analyze_part("ddos", errors, ddos_observe_many, [it.ip for it in items]),
+    }
+    if flows:
+        X_flows = _flows_to_matrix(flows)
+        parts["bot_supervised"] = _analyze_part("bot_supervised", errors, bot_predictions, X_flows, "rf")
+        parts["bot_unsupervised"] = _analyze_part("bot_unsupervised", errors, bot_predictions, X_flows, "iso")
+    if sessions:
+        parts["behaviour"] = _analyze_part("behaviour", errors, beh_score, sessions)
+    done = dict(zip(parts, await asyncio.gather(*parts.values())))
+
+    geo_by_ip = dict(zip(ips, done["geo"] or [None] * len(ips)))
+    rep_by_ip = dict(zip(ips, done["reputation"] or [0] * len(ips)))
+    rf_iter = iter(done.get("bot_supervised") or [])
+    iso_iter = iter(done.get("bot_unsupervised") or [])
+    beh_iter = iter(done.get("behaviour") or [])
+
+    results = []
+    for i, it in enumerate(items):
+        features = dict(done["features"][i]) if done["features"] else {}
+        features.update(geo=geo_by_ip[it.ip], reputation_score=rep_by_ip[it.ip], user_agent=it.ua)
+        bil = bil_result(payloads[i], done["bilstm"][i]) if done["bilstm"] else None
+        xss = {"prob_malicious": done["xss"][i], "pred_label": int(done["xss"][i] >= 0.5)} if done["xss"] else None
+        bot = None
+        if it.flow is not None:
+            bot = {"supervised": next(rf_iter, None), "unsupervised": next(iso_iter, None)}
+        behaviour = [next(beh_iter) for _ in it.sessions] if it.sessions and done.get("behaviour") else None
+
+        bot_src = bot and (bot["supervised"] or bot["unsupervised"])
+        ddos = done["ddos"][i] if done["ddos"] else None
+        scores = {
+            "payload": bil["confidence"] if bil else None,
+            "xss": xss["prob_malicious"] if xss else None,
+            "bot": bot_src["confidence"] if bot_src else None,
+            "ddos": ddos["score"] if ddos else None,
+            "behavior": behaviour[0]["probability"] if behaviour else None,
+        }
+        results.append({"verdict": None, "scores": scores, "bilstm": bil, "xss": xss, "bot": bot, "ddos": ddos,
+                        "behaviour": behaviour, "features": features, "errors": dict(errors)})
+    return results
+
+
+@analyze_router.post("/analyze")
+async def analyze(req: AnalyzeRequest):
+    """
+    Single-hop analysis: features, BILSTM, XSS, bot, ddos and behaviour scores for one request.
+    The request counts towards its IP's ddos rate.
+    """
+    return (await analyze_many([req]))[0]
+
+
+@analyze_router.post("/analyze/batch")
+async def analyze_batch(req: AnalyzeBatchRequest):
+    if not req.requests:
+        raise HTTPException(status_code=400, detail="requests must be a non-empty list")
+    results = await analyze_many(req.requests)
+    return {"results": results, "total": len(results)}
+
+app.include_router(analyze_router)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8000, log_level="info")
@@ -0,0 +1,106 @@
+"""
+In-process micro-batching for the model routers.
+
+Request handlers submit single input rows and get a ``Future`` back. A worker
+thread gathers rows for up to ``max_wait_ms`` milliseconds or ``max_batch_size``
+items, runs one batched forward pass and resolves every caller's future with
+its own result.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Sequence
+
+logger = logging.getLogger("uvicorn.error")
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Collects concurrent single-row requests into batched calls of ``batch_fn``.
+
+    ``batch_fn`` receives a list of inputs and must return a list of outputs of
+    the same length and order. All calls to ``batch_fn`` happen on a single
+    worker thread, so the wrapped model is never used concurrently.
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item: Any) -> Future:
+        fut: Future = Future()
+        self._ensure_started()
+        self._queue.put((item, fut))
+        return fut
+
+    def submit_many(self, items: Sequence[Any]) -> List[Future]:
+        return [self.submit(item) for item in items]
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def close(self, timeout: float = 5.0):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put((_STOP, None))
+            thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item, fut = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [(item, fut)]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        nxt = self._queue.get(timeout=remaining)
+                    else:
+                        nxt = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt[0] is _STOP:
+                    stop = True
+                    break
+                batch.append(nxt)
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch):
+        batch = [(item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            outputs = self.batch_fn([item for item, _ in batch])
+            if len(outputs) != len(batch):
+                raise RuntimeError(f"{self.name} batch returned {len(outputs)} results for {len(batch)} inputs")
+        except Exception as e:
+            logger.error(f"{self.name} batch of {len(batch)} failed: {e}")
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        for (_, fut), out in zip(batch, outputs):
+            fut.set_result(out)
@@ -0,0 +1,89 @@
+"""
+Throughput of full-length padding against length-bucketed padding.
+
+Sequence lengths are drawn from a log-normal distribution (most payloads are
+short, with a long tail), and the same rows are scored both ways in batches.
+The models do not mask padding, so bucketed scores differ slightly from the
+full-length ones; the max difference and label agreement are reported.
+
+Run from the FastApi folder:
+
+    python benchmarks/bench_bucketing.py --models xss --buckets 32 64 128 --batch-size 32
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from inference import CompiledModel, predict_bucketed  # noqa: E402
+
+MODELS = {
+    "bilstm": (os.path.join("BiLstm", "bilstm_payload_detector.h5"), 100),
+    "xss": (os.path.join("XSS", "xss_bilstm_model.h5"), 300),
+}
+
+
+def sample_sequences(n: int, max_len: int, vocab: int, median: float, sigma: float, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(np.log(median), sigma, size=n).astype(int), 1, max_len)
+    return [rng.integers(1, vocab, size=k).tolist() for k in lengths], lengths
+
+
+def _throughput(model, sequences, batch_size: int) -> float:
+    predict_bucketed(model, sequences[:batch_size])
+    start = time.perf_counter()
+    for i in range(0, len(sequences), batch_size):
+        predict_bucketed(model, sequences[i:i + batch_size])
+    return len(sequences) / (time.perf_counter() - start)
+
+
+def bench_model(name, path, seq_len, buckets, batch_size, rows, median, sigma):
+    keras_model = tf.keras.models.load_model(path)
+    full = CompiledModel(keras_model, seq_len=seq_len).warmup()
+    bucketed = CompiledModel(keras_model, seq_len=seq_len, bucket_lengths=buckets).warmup()
+    vocab = getattr(keras_model.layers[0], "input_dim", 2)
+    sequences, lengths = sample_sequences(rows, seq_len, vocab, median, sigma)
+
+    full_rps = _throughput(full, sequences, batch_size)
+    bucketed_rps = _throughput(bucketed, sequences, batch_size)
+    a = np.concatenate([predict_bucketed(full, sequences[i:i + batch_size]) for i in range(0, rows, batch_size)])
+    b = np.concatenate([predict_bucketed(bucketed, sequences[i:i + batch_size]) for i in range(0, rows, batch_size)])
+    return {
+        "model": name,
+        "lengths": bucketed.lengths,
+        "p50/p90 len": f"{int(np.percentile(lengths, 50))}/{int(np.percentile(lengths, 90))}",
+        "full rows/s": full_rps,
+        "bucketed rows/s": bucketed_rps,
+        "speedup": bucketed_rps / full_rps,
+        "max |diff|": float(np.max(np.abs(a - b))),
+        "label agree": float(np.mean((a >= 0.5) == (b >= 0.5))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark length-bucketed padding")
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=list(MODELS))
+    parser.add_argument("--buckets", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--rows", type=int, default=2048)
+    parser.add_argument("--median-len", type=float, default=24, help="median payload length in tokens")
+    parser.add_argument("--sigma", type=float, default=1.0, help="log-normal spread of payload lengths")
+    args = parser.parse_args()
+
+    for name in args.models:
+        path, seq_len = MODELS[name]
+        if not os.path.exists(path):
+            print(f"{name:<8} skipped: {path} not found")
+            continue
+        result = bench_model(name, path, seq_len, args.buckets, args.batch_size, args.rows, args.median_len, args.sigma)
+        for key, value in result.items():
+            print(f"{key:<16} {value:.4g}" if isinstance(value, float) else f"{key:<16} {value}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
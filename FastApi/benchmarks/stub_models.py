@@ -0,0 +1,131 @@
+"""
+Small stand-in models with the same interfaces as the real ones.
+
+Writes a directory laid out like the FastApi folder (``BiLstm/``, ``XSS/``,
+``User_Behaviour/``, ``bot detection/``) with untrained, much smaller
+models, tokenizers and encoders of the same shapes and formats. Start the app
+from that directory and every endpoint serves without the real ``.h5`` /
+``.pkl`` files:
+
+    python benchmarks/stub_models.py --out /tmp/waf-stubs
+    cd /tmp/waf-stubs && python -m uvicorn app:app --app-dir /path/to/FastApi
+
+Scores from the stubs are meaningless. Load tests against them measure the
+serving path (HTTP, validation, tokenization, batching, serialization) plus a
+model forward of roughly ``--units`` LSTM units, not the real models' cost.
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import corpus  # noqa: E402
+
+BIL_MAX_LEN = 100
+BIL_NUM_WORDS = 10000
+XSS_MAX_LEN = 300
+BEH_MAXLEN = 20
+
+
+def _sequence_model(vocab: int, seq_len: int, units: int, bidirectional: bool):
+    from tensorflow import keras
+
+    inputs = keras.Input(shape=(seq_len,), dtype="int32")
+    x = keras.layers.Embedding(vocab, 16)(inputs)
+    lstm = keras.layers.LSTM(units)
+    x = keras.layers.Bidirectional(lstm)(x) if bidirectional else lstm(x)
+    outputs = keras.layers.Dense(1, activation="sigmoid")(x)
+    model = keras.Model(inputs, outputs)
+    model.compile(optimizer="adam", loss="binary_crossentropy")
+    return model
+
+
+def _texts(seed: int, n: int = 2000):
+    return [p["payload"] for p in corpus.synthetic_payloads(n, random.Random(seed))]
+
+
+def build_bilstm(out_dir: str, units: int, seed: int):
+    from tensorflow.keras.preprocessing.text import Tokenizer
+
+    os.makedirs(os.path.join(out_dir, "BiLstm"), exist_ok=True)
+    tokenizer = Tokenizer(num_words=BIL_NUM_WORDS, oov_token="<OOV>")
+    tokenizer.fit_on_texts([" ".join(t.lower().split()) for t in _texts(seed)])
+    with open(os.path.join(out_dir, "BiLstm", "tokenizer.json"), "w", encoding="utf-8") as f:
+        f.write(tokenizer.to_json())
+    model = _sequence_model(BIL_NUM_WORDS, BIL_MAX_LEN, units, bidirectional=True)
+    model.save(os.path.join(out_dir, "BiLstm", "bilstm_payload_detector.h5"))
+
+
+def build_xss(out_dir: str, units: int, seed: int):
+    from tensorflow.keras.preprocessing.text import Tokenizer
+
+    os.makedirs(os.path.join(out_dir, "XSS"), exist_ok=True)
+    tokenizer = Tokenizer(char_level=True, oov_token="[UNK]")
+    tokenizer.fit_on_texts(_texts(seed))
+    with open(os.path.join(out_dir, "XSS", "xss_tokenizer.pkl"), "wb") as f:
+        pickle.dump({"tokenizer": tokenizer, "maxlen": XSS_MAX_LEN}, f)
+    model = _sequence_model(len(tokenizer.word_index) + 1, XSS_MAX_LEN, units, bidirectional=True)
+    model.save(os.path.join(out_dir, "XSS", "xss_bilstm_model.h5"))
+
+
+def build_behaviour(out_dir: str, units: int):
+    from sklearn.preprocessing import LabelEncoder
+
+    os.makedirs(os.path.join(out_dir, "User_Behaviour"), exist_ok=True)
+    tokens = [f"{e}_{p}_{b}" for e in corpus.EVENTS for p in corpus.PAGES for b in corpus.BROWSERS]
+    encoder = LabelEncoder().fit(tokens)
+    with open(os.path.join(out_dir, "User_Behaviour", "action_encoder.pkl"), "wb") as f:
+        pickle.dump(encoder, f)
+    model = _sequence_model(len(encoder.classes_) + 1, BEH_MAXLEN, units, bidirectional=False)
+    model.save(os.path.join(out_dir, "User_Behaviour", "behavior_lstm_model.h5"))
+
+
+def build_bot(out_dir: str, seed: int):
+    import joblib
+    from sklearn.ensemble import IsolationForest, RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    folder = os.path.join(out_dir, "bot detection")
+    os.makedirs(folder, exist_ok=True)
+    flows = corpus.synthetic_flows(2000, random.Random(seed))
+    X = np.array([list(f.values()) for f in flows])
+    y = np.random.default_rng(seed).integers(0, 2, size=len(X))
+
+    rf_scaler = StandardScaler().fit(X)
+    rf = RandomForestClassifier(n_estimators=20, max_depth=8, random_state=seed).fit(rf_scaler.transform(X), y)
+    iso_scaler = StandardScaler().fit(X)
+    iso = IsolationForest(n_estimators=50, random_state=seed).fit(iso_scaler.transform(X))
+    joblib.dump(rf, os.path.join(folder, "rf_bot_model.pkl"))
+    joblib.dump(rf_scaler, os.path.join(folder, "rf_bot_scaler.pkl"))
+    joblib.dump(iso, os.path.join(folder, "isolation_forest_bot_model.pkl"))
+    joblib.dump(iso_scaler, os.path.join(folder, "isolation_forest_bot_scaler.pkl"))
+
+
+def build_stubs(out_dir: str, units: int = 16, seed: int = 0) -> str:
+    """Writes every stand-in artifact under ``out_dir`` and returns it."""
+    os.makedirs(out_dir, exist_ok=True)
+    build_bilstm(out_dir, units, seed)
+    build_xss(out_dir, units, seed)
+    build_behaviour(out_dir, units)
+    build_bot(out_dir, seed)
+    with open(os.path.join(out_dir, "STUB_MODELS.json"), "w", encoding="utf-8") as f:
+        json.dump({"units": units, "seed": seed}, f)
+    return out_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write small stand-in models for load testing")
+    parser.add_argument("--out", required=True, help="directory to write the FastApi-style model tree into")
+    parser.add_argument("--units", type=int, default=16, help="LSTM units of the stand-in sequence models")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(f"Stand-in models written to {build_stubs(args.out, args.units, args.seed)}")
+
+
+if __name__ == "__main__":
+    main()
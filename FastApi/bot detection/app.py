@@ -6,7 +6,7 @@ Supports both supervised (RandomForest) and unsupervised (IsolationForest) model
 import os
 import joblib
 import numpy as np
-from typing import Dict, Optional
+from typing import Dict, List
 from pydantic import BaseModel
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
@@ -106,6 +106,19 @@ class BatchPredictionRequest(BaseModel):
         }
 
 
+class ColumnarBatchRequest(BaseModel):
+    """Batch request with one array per feature; row i of every array is flow i."""
+    model_type: str = "rf"  # 'rf' or 'iso'
+    flow_duration: List[float]
+    flow_byts_s: List[float]
+    flow_pkts_s: List[float]
+    pkt_len_mean: List[float]
+    pkt_len_std: List[float]
+    fwd_pkts_s: List[float]
+    bwd_pkts_s: List[float]
+    flow_iat_mean: List[float]
+
+
 class PredictionResponse(BaseModel):
     """Prediction response."""
     prediction: int  # 0: normal, 1: bot/attack (-1 for iso anomaly)
@@ -120,6 +133,18 @@ class BatchPredictionResponse(BaseModel):
     total: int
 
 
+class ColumnarBatchResponse(BaseModel):
+    """Columnar batch prediction response; element i of every array belongs to flow i."""
+    prediction: List[int]
+    prediction_label: List[str]
+    confidence: List[float]
+    model_type: str
+    total: int
+
+
+FLOW_FIELDS = list(TrafficFlow.model_fields)
+
+
 # ==============================
 # Model Loading
 # ==============================
@@ -167,46 +192,71 @@ def _traffic_flow_to_array(flow: TrafficFlow) -> np.ndarray:
     ]])
 
 
-def _predict_rf(flow: TrafficFlow) -> Dict:
-    """Predict using RandomForest model."""
+def _flows_to_matrix(flows: List[TrafficFlow]) -> np.ndarray:
+    """Convert a list of TrafficFlows to an N x 8 matrix with correct feature order."""
+    return np.array([[getattr(f, name) for name in FLOW_FIELDS] for f in flows], dtype=np.float64).reshape(-1, len(FLOW_FIELDS))
+
+
+def _predict_rf_batch(X: np.ndarray):
+    """Predict an N x 8 matrix with RandomForest in one transform/predict_proba call."""
     if models["rf"]["model"] is None or models["rf"]["scaler"] is None:
         raise HTTPException(status_code=503, detail="RandomForest model not loaded")
 
-    X = _traffic_flow_to_array(flow)
     X_scaled = models["rf"]["scaler"].transform(X)
-    pred = models["rf"]["model"].predict(X_scaled)[0]
-    
-    # Get probability for confidence
-    proba = models["rf"]["model"].predict_proba(X_scaled)[0]
-    confidence = float(np.max(proba))
+    proba = models["rf"]["model"].predict_proba(X_scaled)
 
-    return {
-        "prediction": int(pred),
-        "prediction_label": "Bot/Attack" if pred == 1 else "Normal",
-        "confidence": confidence,
-        "model_type": "rf",
-    }
+    # Same as model.predict(), without a second pass over the trees
+    pred = models["rf"]["model"].classes_.take(np.argmax(proba, axis=1))
+    confidence = proba.max(axis=1)
 
+    return pred.astype(int), confidence, pred == 1
 
-def _predict_iso(flow: TrafficFlow) -> Dict:
-    """Predict using IsolationForest model."""
+
+def _predict_iso_batch(X: np.ndarray):
+    """Predict an N x 8 matrix with IsolationForest in one transform/decision_function call."""
     if models["iso"]["model"] is None or models["iso"]["scaler"] is None:
         raise HTTPException(status_code=503, detail="IsolationForest model not loaded")
 
-    X = _traffic_flow_to_array(flow)
     X_scaled = models["iso"]["scaler"].transform(X)
-    pred = models["iso"]["model"].predict(X_scaled)[0]
-    
-    # Get anomaly score
-    anomaly_score = models["iso"]["model"].decision_function(X_scaled)[0]
-    confidence = float(np.abs(anomaly_score))
+    anomaly_score = models["iso"]["model"].decision_function(X_scaled)
+
+    # IsolationForest.predict() marks negative scores as anomalies: 1 normal, -1 anomaly
+    pred = np.where(anomaly_score < 0, -1, 1)
+    confidence = np.abs(anomaly_score)
+
+    return pred, confidence, pred == -1
+
+
+BATCH_PREDICTORS = {"rf": _predict_rf_batch, "iso": _predict_iso_batch}
 
-    return {
-        "prediction": int(pred),  # 1: normal, -1: anomaly
-        "prediction_label": "Bot/Attack" if pred == -1 else "Normal",
-        "confidence": confidence,
-        "model_type": "iso",
-    }
+
+def _check_model_type(model_type: str):
+    if model_type not in BATCH_PREDICTORS:
+        raise HTTPException(status_code=400, detail="model_type must be 'rf' or 'iso'")
+
+
+def _predictions(X: np.ndarray, model_type: str) -> List[Dict]:
+    """Run the batch predictor and build one response dict per row."""
+    pred, confidence, is_bot = BATCH_PREDICTORS[model_type](X)
+    return [
+        {
+            "prediction": int(p),
+            "prediction_label": "Bot/Attack" if b else "Normal",
+            "confidence": float(c),
+            "model_type": model_type,
+        }
+        for p, c, b in zip(pred.tolist(), confidence.tolist(), is_bot.tolist())
+    ]
+
+
+def _predict_rf(flow: TrafficFlow) -> Dict:
+    """Predict using RandomForest model."""
+    return _predictions(_traffic_flow_to_array(flow), "rf")[0]
+
+
+def _predict_iso(flow: TrafficFlow) -> Dict:
+    """Predict using IsolationForest model."""
+    return _predictions(_traffic_flow_to_array(flow), "iso")[0]
 
 
 # ==============================
@@ -269,21 +319,45 @@ def predict_batch(request: BatchPredictionRequest):
     - predictions: List of predictions
     - total: Number of flows predicted
     """
-    predictions = []
-    
-    for flow in request.flows:
-        if request.model_type == "rf":
-            result = _predict_rf(flow)
-        elif request.model_type == "iso":
-            result = _predict_iso(flow)
-        else:
-            raise HTTPException(status_code=400, detail="model_type must be 'rf' or 'iso'")
-        
-        predictions.append(PredictionResponse(**result))
-    
+    _check_model_type(request.model_type)
+    if not request.flows:
+        return BatchPredictionResponse(predictions=[], total=0)
+
+    predictions = _predictions(_flows_to_matrix(request.flows), request.model_type)
     return BatchPredictionResponse(predictions=predictions, total=len(predictions))
 
 
+@app.post("/predict/batch/columnar", response_model=ColumnarBatchResponse, tags=["Prediction"])
+def predict_batch_columnar(request: ColumnarBatchRequest):
+    """
+    Columnar batch prediction endpoint.
+
+    Parameters:
+    - model_type: "rf" (supervised) or "iso" (unsupervised)
+    - one array per feature (flow_duration, flow_byts_s, ...), all the same length
+
+    Returns:
+    - prediction, prediction_label, confidence: one array each, in input order
+    - total: Number of flows predicted
+    """
+    _check_model_type(request.model_type)
+    columns = [getattr(request, name) for name in FLOW_FIELDS]
+    n = len(columns[0])
+    if any(len(col) != n for col in columns):
+        raise HTTPException(status_code=400, detail="all feature arrays must have the same length")
+    if n == 0:
+        return ColumnarBatchResponse(prediction=[], prediction_label=[], confidence=[], model_type=request.model_type, total=0)
+
+    pred, confidence, is_bot = BATCH_PREDICTORS[request.model_type](np.array(columns, dtype=np.float64).T)
+    return ColumnarBatchResponse(
+        prediction=pred.tolist(),
+        prediction_label=np.where(is_bot, "Bot/Attack", "Normal").tolist(),
+        confidence=confidence.tolist(),
+        model_type=request.model_type,
+        total=n,
+    )
+
+
 # ==============================
 # Root Endpoint
 # ==============================
@@ -299,6 +373,7 @@ def root():
             "predict_supervised": "POST /predict/supervised",
             "predict_unsupervised": "POST /predict/unsupervised",
             "predict_batch": "POST /predict/batch",
+            "predict_batch_columnar": "POST /predict/batch/columnar",
             "docs": "/docs (Swagger UI)",
             "redoc": "/redoc (ReDoc)",
         },
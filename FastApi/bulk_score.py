@@ -0,0 +1,350 @@
+"""
+Offline bulk scoring of historical logs with every model.
+
+Reads CSV or JSON Lines exports in chunks, scores each chunk with every
+model on a pool of worker processes and writes one columnar part file per
+chunk into an output directory:
+
+    python bulk_score.py --input access-2024-05.jsonl.gz --output scored/ --workers 4
+
+Run from the FastApi folder, or point ``--model-dir`` at a folder laid out
+like it. Each worker process imports the app and loads the models with the
+server's own loaders, with ``INFERENCE_THREADS`` split between the workers.
+
+Input columns, all optional:
+
+- ``payload`` (or ``text`` / ``Sentence``): scored by the BiLSTM and XSS models
+- the eight TrafficFlow fields (``flow_duration``, ...) or their CTU-13 names
+  (``Flow Duration``, ...): scored by both bot models
+- ``events``: one session's events as a list (a JSON string in CSV), scored
+  by the behaviour model
+
+Rows without a model's input get nulls in that model's columns. ``id`` and
+``sessn_id`` (and any ``--keep`` column) are copied to the output as strings.
+
+Every part file is written under a temporary name and renamed once complete.
+Start an interrupted run again with the same arguments and it skips the
+chunks whose part file exists. Read the result with
+``pandas.read_parquet("scored/")``. Parquet output needs the optional
+``pyarrow`` package; ``--format csv`` does not.
+"""
+import argparse
+import glob
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SCORERS = ("bilstm", "xss", "bot_rf", "bot_iso", "behaviour")
+# Registry name of the model behind each scorer.
+SCORER_MODELS = {"bilstm": "bilstm", "xss": "xss", "bot_rf": "bot", "bot_iso": "bot", "behaviour": "behaviour"}
+PAYLOAD_COLUMNS = ("payload", "text", "Sentence")
+# CTU-13 column for each TrafficFlow field, in the order the app expects.
+FLOW_COLUMNS = {
+    "flow_duration": "Flow Duration",
+    "flow_byts_s": "Flow Byts/s",
+    "flow_pkts_s": "Flow Pkts/s",
+    "pkt_len_mean": "Pkt Len Mean",
+    "pkt_len_std": "Pkt Len Std",
+    "fwd_pkts_s": "Fwd Pkts/s",
+    "bwd_pkts_s": "Bwd Pkts/s",
+    "flow_iat_mean": "Flow IAT Mean",
+}
+DEFAULT_KEEP = ("id", "sessn_id")
+JSONL_SUFFIXES = (".jsonl", ".ndjson", ".json")
+COMPRESSION_SUFFIXES = (".gz", ".bz2", ".xz", ".zst", ".zip")
+MANIFEST = "_manifest.json"
+
+
+def _is_jsonl(path: str) -> bool:
+    name = path.lower()
+    for suffix in COMPRESSION_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    return name.endswith(JSONL_SUFFIXES)
+
+
+def read_chunks(path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    if _is_jsonl(path):
+        reader = pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False, convert_dates=False)
+    else:
+        # Only empty cells are missing; a payload of "NA" or "null" is still a payload.
+        reader = pd.read_csv(path, chunksize=chunk_size, keep_default_na=False, na_values=[""], low_memory=False)
+    with reader:
+        for chunk in reader:
+            chunk.columns = [str(c).strip() for c in chunk.columns]
+            yield chunk
+
+
+############################
+# Worker process
+############################
+waf = None  # the app module, imported by each worker
+_available: Dict[str, bool] = {}
+
+
+def init_worker(model_dir: str, threads: int, batch_size: int, scorers: List[str]):
+    global waf
+    os.environ["INFERENCE_THREADS"] = str(threads)
+    os.environ.setdefault("BIL_BATCH_MAX_SIZE", str(batch_size))
+    os.environ.setdefault("XSS_BATCH_MAX_SIZE", str(batch_size))
+    os.chdir(model_dir)
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    import app
+    from loading import READY
+
+    waf = app
+    for name in dict.fromkeys(SCORER_MODELS[s] for s in scorers):
+        waf.model_registry.load_now(name)
+    for scorer in scorers:
+        if scorer in ("bot_rf", "bot_iso"):
+            _available[scorer] = waf.models_store[scorer[4:]]["model"] is not None
+        else:
+            _available[scorer] = waf.model_registry.status()[scorer]["state"] == READY
+
+
+def _payloads(df: pd.DataFrame, column: Optional[str]) -> Tuple[np.ndarray, List[str]]:
+    columns = [column] if column else PAYLOAD_COLUMNS
+    name = next((c for c in columns if c in df.columns), None)
+    if name is None:
+        return np.zeros(len(df), dtype=bool), []
+    values = df[name]
+    mask = values.notna().to_numpy()
+    return mask, [str(v) for v in values[mask]]
+
+
+def _flows(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    columns = []
+    for field, ctu in FLOW_COLUMNS.items():
+        name = field if field in df.columns else ctu if ctu in df.columns else None
+        if name is None:
+            return np.zeros(len(df), dtype=bool), np.empty((0, len(FLOW_COLUMNS)))
+        columns.append(name)
+    X = df[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    mask = np.isfinite(X).all(axis=1)
+    return mask, X[mask]
+
+
+def _sessions(df: pd.DataFrame) -> Tuple[np.ndarray, list]:
+    mask = np.zeros(len(df), dtype=bool)
+    sessions = []
+    if "events" not in df.columns:
+        return mask, sessions
+    ids = df["sessn_id"] if "sessn_id" in df.columns else pd.Series([None] * len(df), index=df.index)
+    for i, (sid, events) in enumerate(zip(ids, df["events"])):
+        try:
+            if isinstance(events, str):
+                events = json.loads(events)
+            if not isinstance(events, list):
+                continue
+            sessions.append(waf.SessionInput.model_validate({"sessn_id": "" if pd.isna(sid) else str(sid), "events": events}))
+        except ValueError:
+            continue
+        mask[i] = True
+    return mask, sessions
+
+
+def _fill(out: Dict[str, pd.Series], n: int, mask: np.ndarray, columns: Dict[str, Tuple[str, list]]):
+    """Adds one nullable column per entry of ``columns`` (``name: (dtype, values for the masked rows)``)."""
+    for name, (dtype, values) in columns.items():
+        column = pd.array([pd.NA] * n, dtype=dtype)
+        if len(values):
+            column[np.flatnonzero(mask)] = pd.array(values, dtype=dtype)
+        out[name] = pd.Series(column)
+
+
+def score_frame(df: pd.DataFrame, scorers: List[str], payload_column: Optional[str] = None,
+                xss_threshold: float = 0.5) -> pd.DataFrame:
+    """One row of verdicts per input row; columns of unavailable models or missing inputs are null."""
+    n = len(df)
+    out: Dict[str, pd.Series] = {}
+    payload_mask, payloads = _payloads(df, payload_column) if {"bilstm", "xss"} & set(scorers) else (None, [])
+    flow_mask, X = _flows(df) if {"bot_rf", "bot_iso"} & set(scorers) else (None, None)
+
+    if "bilstm" in scorers:
+        results = []
+        if _available["bilstm"] and payloads:
+            results = list(map(waf.bil_result, payloads, waf.bil_score(payloads, use_cache=False)))
+        _fill(out, n, payload_mask, {"bilstm_label": ("string", [r["label"] for r in results]),
+                                     "bilstm_confidence": ("Float64", [r["confidence"] for r in results])})
+    if "xss" in scorers:
+        probs = (waf.xss_score(payloads, use_cache=False, cascade=xss_threshold == waf.CASCADE_THRESHOLD)
+                 if _available["xss"] and payloads else [])
+        _fill(out, n, payload_mask, {"xss_prob_malicious": ("Float64", probs),
+                                     "xss_pred_label": ("Int64", [int(p >= xss_threshold) for p in probs])})
+    for scorer in ("bot_rf", "bot_iso"):
+        if scorer not in scorers:
+            continue
+        pred, confidence, is_bot = [], [], []
+        if _available[scorer] and len(X):
+            pred, confidence, is_bot = (a.tolist() for a in waf.bot_predict_matrix(X, scorer[4:]))
+        _fill(out, n, flow_mask, {f"{scorer}_prediction": ("Int64", pred), f"{scorer}_confidence": ("Float64", confidence),
+                                  f"{scorer}_is_bot": ("boolean", is_bot)})
+    if "behaviour" in scorers:
+        session_mask, sessions = _sessions(df)
+        results = waf.beh_score(sessions) if _available["behaviour"] and sessions else []
+        _fill(out, n, session_mask, {"behaviour_probability": ("Float64", [r["probability"] for r in results]),
+                                     "behaviour_label": ("Int64", [r["label"] for r in results])})
+    return pd.DataFrame(out)
+
+
+def write_part(df: pd.DataFrame, path: str, fmt: str):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    if fmt == "parquet":
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def score_chunk(task: Dict) -> Tuple[int, int, float]:
+    """Scores one chunk and writes its part file; returns ``(chunk, rows, seconds)``."""
+    start = time.perf_counter()
+    df = task["frame"].reset_index(drop=True)
+    meta = pd.DataFrame({"input_file": pd.Series(task["input"], index=df.index, dtype="string"),
+                         "row": np.arange(task["first_row"], task["first_row"] + len(df), dtype=np.int64)})
+    kept = pd.DataFrame({c: df[c].astype("string") for c in task["keep"] if c in df.columns})
+    verdicts = score_frame(df, task["scorers"], task["payload_column"], task["xss_threshold"])
+    write_part(pd.concat([meta, kept, verdicts], axis=1), task["path"], task["format"])
+    return task["chunk"], len(df), time.perf_counter() - start
+
+
+############################
+# Driver
+############################
+def part_path(output: str, chunk: int, fmt: str) -> str:
+    return os.path.join(output, f"part-{chunk:05d}.{fmt}")
+
+
+def run_settings(args) -> Dict:
+    """Everything that decides which rows land in which part file and what they hold."""
+    inputs = [{"path": os.path.abspath(p), "size": os.path.getsize(p), "mtime": int(os.path.getmtime(p))}
+              for p in args.input]
+    return {"inputs": inputs, "chunk_size": args.chunk_size, "models": args.models, "format": args.format,
+            "payload_column": args.payload_column, "xss_threshold": args.xss_threshold,
+            "keep": list(dict.fromkeys(DEFAULT_KEEP + tuple(args.keep)))}
+
+
+def prepare_output(args, settings: Dict):
+    """Creates the output directory, or checks that the run found there used the same settings."""
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = os.path.join(args.output, MANIFEST)
+    leftovers = glob.glob(os.path.join(args.output, "part-*.tmp-*"))
+    if args.restart:
+        leftovers += glob.glob(os.path.join(args.output, "part-*"))
+    elif os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous.get("settings") != settings:
+            sys.exit(f"{args.output} holds a run with different inputs or settings; "
+                     "use another --output or pass --restart to discard it")
+    for path in set(leftovers):
+        os.remove(path)
+    write_manifest(args.output, {"settings": settings, "complete": False})
+
+
+def write_manifest(output: str, manifest: Dict):
+    tmp = os.path.join(output, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(output, MANIFEST))
+
+
+def iter_tasks(args, settings: Dict, counts: Dict) -> Iterator[Dict]:
+    """One task per chunk still to score; chunks are numbered across all inputs."""
+    chunk = 0
+    for path in args.input:
+        first_row = 0
+        for frame in read_chunks(path, args.chunk_size):
+            out = part_path(args.output, chunk, args.format)
+            counts["chunks"] += 1
+            if os.path.exists(out):
+                counts["skipped"] += 1
+            else:
+                yield {"chunk": chunk, "input": path, "first_row": first_row, "frame": frame, "path": out,
+                       "format": args.format, "scorers": args.models, "keep": settings["keep"],
+                       "payload_column": args.payload_column, "xss_threshold": args.xss_threshold}
+            chunk += 1
+            first_row += len(frame)
+
+
+def run(args) -> int:
+    if args.format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        sys.exit("Parquet output needs pyarrow (pip install pyarrow); or pass --format csv")
+    settings = run_settings(args)
+    prepare_output(args, settings)
+
+    workers = args.workers or multiprocessing.cpu_count()
+    threads = max(1, multiprocessing.cpu_count() // workers)
+    counts = {"chunks": 0, "skipped": 0}
+    rows = 0
+    start = time.perf_counter()
+
+    def report(done):
+        nonlocal rows
+        for future in done:
+            chunk, n, seconds = future.result()
+            rows += n
+            elapsed = time.perf_counter() - start
+            print(f"chunk {chunk}: {n} rows in {seconds:.1f}s ({rows} rows, {rows / elapsed:.0f} rows/s)", flush=True)
+
+    # Spawned, not forked: TensorFlow does not survive a fork once initialized.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker,
+                             initargs=(os.path.abspath(args.model_dir), threads, args.batch_size, args.models)) as pool:
+        pending = set()
+        try:
+            for task in iter_tasks(args, settings, counts):
+                # Bounded read-ahead: at most two chunks per worker are held in memory.
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    report(done)
+                pending.add(pool.submit(score_chunk, task))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                report(done)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    if counts["skipped"]:
+        print(f"{counts['skipped']} chunks were already scored by an earlier run")
+    write_manifest(args.output, {"settings": settings, "complete": True, "chunks": counts["chunks"],
+                                 "completed_at": time.time()})
+    print(f"Scored {rows} rows in {time.perf_counter() - start:.1f}s into {args.output}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score historical logs with every model, in chunks, on a process pool")
+    parser.add_argument("--input", nargs="+", required=True, help="CSV or JSON Lines files (optionally compressed)")
+    parser.add_argument("--output", required=True, help="directory for the part files")
+    parser.add_argument("--models", nargs="+", choices=SCORERS, default=list(SCORERS))
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="rows per chunk and per part file")
+    parser.add_argument("--batch-size", type=int, default=256, help="model batch size of the BiLSTM and XSS batchers")
+    parser.add_argument("--model-dir", default=".", help="folder holding the model artifacts (default: current)")
+    parser.add_argument("--payload-column", help="column to score with the payload models (default: payload, text or Sentence)")
+    parser.add_argument("--keep", nargs="*", default=[], help="extra input columns to copy to the output")
+    parser.add_argument("--xss-threshold", type=float, default=0.5)
+    parser.add_argument("--restart", action="store_true", help="discard part files of an earlier run in --output")
+    args = parser.parse_args()
+    try:
+        sys.exit(run(args))
+    except KeyboardInterrupt:
+        sys.exit("Interrupted; run again with the same arguments to resume")
+
+
+if __name__ == "__main__":
+    main()
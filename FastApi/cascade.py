@@ -0,0 +1,158 @@
+"""
+Cheap first tier in front of the BiLSTM and XSS models.
+
+Tier 1 scores a payload with a logistic model over hashed token unigrams and
+bigrams (from the feature extractor's ``tokenize_payload``) plus a handful of
+attack signatures. When its probability is clearly low or clearly high the
+payload exits with that probability and the deep model never sees it; only
+the uncertain middle goes on to the deep model.
+
+The exit thresholds come from ``train_cascade.py``. It fits tier 1 to the
+deep model's own verdicts and sets the thresholds on held-out payloads so
+that at most a given fraction of the deep model's attacks would exit as
+benign (and of its benign verdicts as attacks). A payload that matches any
+signature never exits as benign.
+
+Artifacts are ``.npz`` files holding the weight vector, the thresholds and
+the calibration report.
+"""
+import json
+import re
+import threading
+import zlib
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Case-insensitive. A match is a feature of the linear model and rules out a benign exit.
+SIGNATURES = (
+    r"\bunion\b[\s\S]*\bselect\b",
+    r"\bselect\b[\s\S]+\bfrom\b",
+    r"'\s*(or|and)\s+['\d(]",
+    r"'\s*(--|#|;)",
+    r"/\*",
+    r";\s*(drop|insert|update|delete|exec|shutdown)\b",
+    r"\b(sleep|benchmark|pg_sleep)\s*\(|\bwaitfor\s+delay\b",
+    r"\bxp_cmdshell\b|\binformation_schema\b",
+    r"\border\s+by\s+\d",
+    r"<\s*/?\s*(script|iframe|svg|img|body|object|embed|input|style|link|meta)\b",
+    r"javascript\s*:|vbscript\s*:",
+    r"\bon[a-z]+\s*=",
+    r"document\s*\.\s*(cookie|location|write)|window\s*\.\s*location",
+    r"\b(alert|prompt|confirm|eval)\s*\(",
+    r"%3c|%3e|&#x?[0-9a-f]+;?|\\x3c|\\u003c",
+)
+
+DEFAULT_BITS = 18
+EXIT_BENIGN = "exit_benign"
+EXIT_ATTACK = "exit_attack"
+DEFERRED = "deferred"
+
+
+def _hash(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8", "surrogatepass"))
+
+
+class CascadeTier1:
+    def __init__(self, weights: np.ndarray, bias: float, low: float, high: float, tokenize: Callable[[str], List[str]],
+                 signatures: Sequence[str] = SIGNATURES, report: Optional[Dict] = None):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.mask = len(self.weights) - 1
+        if len(self.weights) & self.mask:
+            raise ValueError("weight vector length must be a power of two")
+        self.low = low
+        self.high = high
+        self.tokenize = tokenize
+        self.signatures = tuple(signatures)
+        self._patterns = [re.compile(s, re.IGNORECASE) for s in self.signatures]
+        self._signature_index = [_hash(f"sig:{s}") & self.mask for s in self.signatures]
+        self.report = report or {}
+        self.counts = {EXIT_BENIGN: 0, EXIT_ATTACK: 0, DEFERRED: 0}
+        self._lock = threading.Lock()
+
+    def features(self, payload: str) -> Tuple[List[int], bool]:
+        """Hashed feature indices of ``payload`` and whether it matched a signature."""
+        tokens = self.tokenize(payload)
+        mask = self.mask
+        indices = [_hash(t) & mask for t in tokens]
+        indices += [_hash(f"{a} {b}") & mask for a, b in zip(tokens, tokens[1:])]
+        flagged = False
+        for pattern, index in zip(self._patterns, self._signature_index):
+            if pattern.search(payload):
+                indices.append(index)
+                flagged = True
+        return indices, flagged
+
+    def probabilities(self, payloads: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        logits = np.empty(len(payloads), dtype=np.float64)
+        flagged = np.zeros(len(payloads), dtype=bool)
+        weights = self.weights
+        for i, payload in enumerate(payloads):
+            indices, flagged[i] = self.features(payload)
+            # Binary features: a repeated n-gram counts once, as in training.
+            logits[i] = self.bias + float(weights[np.unique(indices)].sum()) if indices else self.bias
+        return 1.0 / (1.0 + np.exp(-logits)), flagged
+
+    def decide(self, payloads: Sequence[str]) -> List[Optional[float]]:
+        """Tier-1 probability for payloads that exit early, None for those the deep model must score."""
+        probs, flagged = self.probabilities(payloads)
+        out: List[Optional[float]] = []
+        benign = attack = 0
+        for p, f in zip(probs.tolist(), flagged.tolist()):
+            if p < self.low and not f:
+                benign += 1
+                out.append(p)
+            elif p > self.high:
+                attack += 1
+                out.append(p)
+            else:
+                out.append(None)
+        with self._lock:
+            self.counts[EXIT_BENIGN] += benign
+            self.counts[EXIT_ATTACK] += attack
+            self.counts[DEFERRED] += len(out) - benign - attack
+        return out
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        exits = counts[EXIT_BENIGN] + counts[EXIT_ATTACK]
+        return {**counts, "exit_ratio": round(exits / total, 4) if total else 0.0, "low": self.low, "high": self.high,
+                "calibration": self.report}
+
+    def save(self, path: str):
+        np.savez_compressed(path, weights=self.weights, bias=np.float64(self.bias), low=np.float64(self.low),
+                            high=np.float64(self.high), signatures=np.array(self.signatures),
+                            report=np.array(json.dumps(self.report)))
+
+    @classmethod
+    def load(cls, path: str, tokenize: Callable[[str], List[str]]) -> "CascadeTier1":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["weights"], float(data["bias"]), float(data["low"]), float(data["high"]), tokenize,
+                       [str(s) for s in data["signatures"]], json.loads(str(data["report"])))
+
+
+def exit_thresholds(probs: np.ndarray, labels: np.ndarray, flagged: np.ndarray, max_miss: float,
+                    max_false_alarm: float, decision: float = 0.5) -> Tuple[float, float]:
+    """``(low, high)`` such that on these payloads exiting below ``low`` drops at most ``max_miss`` of the
+    attacks and exiting above ``high`` flags at most ``max_false_alarm`` of the benign ones.
+
+    ``low`` is capped and ``high`` floored at ``decision`` so an exit never contradicts its own label.
+    """
+    labels = labels.astype(bool)
+
+    # Benign exits: unflagged payloads in increasing probability, stopping before the allowance is exceeded.
+    candidates = np.sort(probs[~flagged])
+    attacks = labels[~flagged][np.argsort(probs[~flagged], kind="stable")]
+    allowed = int(max_miss * labels.sum())
+    over = np.flatnonzero(np.cumsum(attacks) > allowed)
+    low = float(candidates[over[0]]) if len(over) else float("inf")
+
+    order = np.argsort(-probs, kind="stable")
+    benign = ~labels[order]
+    allowed = int(max_false_alarm * (~labels).sum())
+    over = np.flatnonzero(np.cumsum(benign) > allowed)
+    high = float(probs[order][over[0]]) if len(over) else float("-inf")
+    return min(low, decision), max(high, decision)
@@ -0,0 +1,170 @@
+"""
+Export the Keras models to TFLite and ONNX for the lighter CPU backends.
+
+Each export is checked against the Keras model on padded token sequences
+before it is written next to the ``.h5`` file (``<name>.tflite`` /
+``<name>.onnx``). Exports that drift beyond ``--tolerance`` are not written.
+Select the backend at serve time with ``BIL_BACKEND``, ``XSS_BACKEND`` and
+``BEH_BACKEND``.
+
+Run from the FastApi folder:
+
+    python export_models.py --models xss behaviour --formats tflite onnx
+
+TFLite has no builtin kernel for a recurrent loop over a dynamic batch, so
+recurrent layers are unrolled before conversion. ONNX export needs the
+optional ``tf2onnx`` package; serving it needs ``onnxruntime``.
+"""
+import argparse
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from inference import CompiledModel, OnnxModel, TFLiteModel, exported_path
+
+MODELS = {
+    "bilstm": (os.path.join("BiLstm", "bilstm_payload_detector.h5"), 100),
+    "xss": (os.path.join("XSS", "xss_bilstm_model.h5"), None),
+    "behaviour": (os.path.join("User_Behaviour", "behavior_lstm_model.h5"), 20),
+}
+RUNNERS = {"tflite": TFLiteModel, "onnx": OnnxModel}
+RECURRENT_LAYERS = ("LSTM", "GRU", "SimpleRNN")
+
+
+def unrolled_model(model):
+    """Rebuilds ``model`` with every recurrent layer (including wrapped ones) unrolled."""
+    config = model.get_config()
+
+    def walk(node):
+        if isinstance(node, dict):
+            if node.get("class_name") in RECURRENT_LAYERS and "config" in node:
+                node["config"]["unroll"] = True
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(config)
+    clone = model.__class__.from_config(config)
+    clone.set_weights(model.get_weights())
+    return clone
+
+
+def export_saved_model(model, seq_len: int, workdir: str) -> str:
+    path = os.path.join(workdir, "saved_model")
+    model.export(path, input_signature=[tf.TensorSpec([None, seq_len], tf.int32)], verbose=False)
+    return path
+
+
+def export_tflite(model, seq_len: int, out_path: str, workdir: str):
+    converter = tf.lite.TFLiteConverter.from_saved_model(export_saved_model(unrolled_model(model), seq_len, workdir))
+    with open(out_path, "wb") as f:
+        f.write(converter.convert())
+
+
+def export_onnx(model, seq_len: int, out_path: str, workdir: str, opset: int = 17):
+    if importlib.util.find_spec("tf2onnx") is None:
+        raise RuntimeError("tf2onnx is not installed")
+    cmd = [sys.executable, "-m", "tf2onnx.convert", "--saved-model", export_saved_model(model, seq_len, workdir),
+           "--output", out_path, "--opset", str(opset)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "tf2onnx failed")
+
+
+EXPORTERS = {"tflite": export_tflite, "onnx": export_onnx}
+
+
+def parity_inputs(model, seq_len: int, samples: int, seed: int = 0) -> np.ndarray:
+    """Post-padded sequences of random length, like the ones the app builds."""
+    vocab = getattr(model.layers[0], "input_dim", 2)
+    rng = np.random.default_rng(seed)
+    X = rng.integers(1, vocab, size=(samples, seq_len)).astype(np.int32)
+    lengths = rng.integers(0, seq_len + 1, size=samples)
+    X[np.arange(seq_len)[None, :] >= lengths[:, None]] = 0
+    return X
+
+
+def batched_predict(fn, X: np.ndarray, batch_size: int) -> np.ndarray:
+    return np.concatenate([fn(X[i:i + batch_size]).reshape(-1) for i in range(0, len(X), batch_size)])
+
+
+def time_ms(fn, X: np.ndarray, repeats: int) -> float:
+    fn(X)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(X)
+    return (time.perf_counter() - start) * 1000.0 / repeats
+
+
+def export_model(name: str, path: str, seq_len, formats, tolerance: float, samples: int, repeats: int):
+    model = tf.keras.models.load_model(path)
+    reference = CompiledModel(model, seq_len=seq_len).warmup()
+    seq_len = reference.seq_len
+    X = parity_inputs(model, seq_len, samples)
+    expected = batched_predict(reference, X, 32)
+    keras_ms = time_ms(reference, X[:32], repeats)
+
+    rows = []
+    for fmt in formats:
+        out_path = exported_path(path, fmt)
+        workdir = tempfile.mkdtemp(prefix=f"export-{name}-")
+        try:
+            tmp_path = os.path.join(workdir, os.path.basename(out_path))
+            EXPORTERS[fmt](model, seq_len, tmp_path, workdir)
+            runner = RUNNERS[fmt](tmp_path).warmup()
+            # Batch sizes 1 and 32 exercise both a single row and a resized batch.
+            got = np.concatenate([batched_predict(runner, X[:8], 1), batched_predict(runner, X[8:], 32)])
+            diff = float(np.max(np.abs(got - expected)))
+            agree = float(np.mean((got >= 0.5) == (expected >= 0.5)))
+            ok = diff <= tolerance
+            if ok:
+                shutil.move(tmp_path, out_path)
+            rows.append((name, fmt, os.path.getsize(out_path if ok else tmp_path) / 1024, diff, agree,
+                         keras_ms, time_ms(runner, X[:32], repeats), "written" if ok else "REJECTED"))
+        except Exception as e:
+            rows.append((name, fmt, None, None, None, keras_ms, None, f"failed: {e}"))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+
+def format_cell(value, spec: str) -> str:
+    width = int(spec.split(".")[0])
+    return format(value, ">" + spec) if value is not None else "-".rjust(width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Keras models to TFLite / ONNX with a parity check")
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=list(MODELS))
+    parser.add_argument("--formats", nargs="+", default=list(EXPORTERS), choices=list(EXPORTERS))
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="max |keras - export| over the parity set")
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'model':<10} {'format':<7} {'size KB':>9} {'max |diff|':>11} {'agree':>7} {'keras ms':>9} {'export ms':>10}  status")
+    failed = False
+    for name in args.models:
+        path, seq_len = MODELS[name]
+        if not os.path.exists(path):
+            print(f"{name:<10} skipped: {path} not found")
+            continue
+        for row in export_model(name, path, seq_len, args.formats, args.tolerance, args.samples, args.repeats):
+            name_, fmt, size, diff, agree, keras_ms, export_ms, status = row
+            failed = failed or status != "written"
+            print(f"{name_:<10} {fmt:<7} {format_cell(size, '9.1f')} {format_cell(diff, '11.2e')} "
+                  f"{format_cell(agree, '7.3f')} {keras_ms:>9.2f} {format_cell(export_ms, '10.2f')}  {status}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
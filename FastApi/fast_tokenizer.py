@@ -0,0 +1,182 @@
+"""
+Drop-in replacements for Keras ``Tokenizer.texts_to_sequences``.
+
+``WordTokenizer`` keeps only the part of the vocabulary that can change the
+output: words ranked below ``num_words``. Every other word maps to the OOV
+index, or is dropped when there is no OOV token. Filtering reuses one
+precomputed translate table instead of rebuilding it for every text.
+
+``CharTokenizer`` turns the vocabulary into a NumPy table indexed by code
+point and encodes a whole batch with one gather.
+
+Both give exactly the sequences the Keras tokenizer they were built from
+gives, and neither needs TensorFlow at serve time.
+"""
+import json
+from itertools import repeat
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+
+# Marks a token Keras would skip (no OOV token configured).
+_DROP = -1
+# Largest code point table we build; rarer characters fall back to a dict.
+_MAX_TABLE = 1 << 16
+
+
+def _token_values(word_index: Dict[str, int], num_words: Optional[int], oov_token: Optional[str]):
+    """Mirrors the branches of ``Tokenizer.texts_to_sequences_generator``.
+
+    Returns the value emitted for an unknown token, and a map holding only the
+    tokens whose value differs from it. A value of ``_DROP`` means "emit
+    nothing"; ``None`` is kept as-is because Keras emits it when the OOV token
+    is set but missing from the vocabulary.
+    """
+    oov_index = word_index.get(oov_token)
+    unknown = oov_index if oov_token is not None else _DROP
+    overflow = oov_index if oov_index is not None else _DROP
+    values = {}
+    for word, i in word_index.items():
+        value = overflow if num_words and i >= num_words else i
+        if value != unknown:
+            values[word] = value
+    return unknown, values
+
+
+class WordTokenizer:
+    def __init__(self, word_index: Dict[str, int], num_words: Optional[int] = None, oov_token: Optional[str] = None,
+                 filters: str = DEFAULT_FILTERS, lower: bool = True, split: str = " ", char_level: bool = False):
+        self.num_words = num_words
+        self.oov_token = oov_token
+        self.lower = lower
+        self.split = split
+        self.char_level = char_level
+        self._table = str.maketrans({c: split for c in filters})
+        self._unknown, self._values = _token_values(word_index, num_words, oov_token)
+        self._may_drop = self._unknown == _DROP or _DROP in self._values.values()
+
+    def __len__(self):
+        return len(self._values)
+
+    def _tokens(self, text: str):
+        if self.lower:
+            text = text.lower()
+        if self.char_level:
+            return text
+        return filter(None, text.translate(self._table).split(self.split))
+
+    def text_to_sequence(self, text: str, maxlen: Optional[int] = None) -> List[int]:
+        seq = list(map(self._values.get, self._tokens(text), repeat(self._unknown)))
+        if self._may_drop:
+            seq = [i for i in seq if i != _DROP]
+        return seq[:maxlen] if maxlen is not None else seq
+
+    def texts_to_sequences(self, texts: List[str], maxlen: Optional[int] = None) -> List[List[int]]:
+        """Same as Keras; ``maxlen`` keeps the first ``maxlen`` ids, like ``truncating='post'``."""
+        return [self.text_to_sequence(t, maxlen) for t in texts]
+
+
+class CharTokenizer:
+    def __init__(self, word_index: Dict[str, int], num_words: Optional[int] = None, oov_token: Optional[str] = None,
+                 lower: bool = True):
+        self.num_words = num_words
+        self.oov_token = oov_token
+        self.lower = lower
+        unknown, values = _token_values(word_index, num_words, oov_token)
+        if unknown is None or None in values.values():
+            raise ValueError("oov_token is set but missing from word_index; use WordTokenizer")
+        chars = {c: v for c, v in values.items() if len(c) == 1}
+        size = min(max((ord(c) for c in chars), default=0) + 1, _MAX_TABLE)
+        self._lut = np.full(size, unknown, dtype=np.int32)
+        self._rare = {}
+        for c, v in chars.items():
+            if ord(c) < size:
+                self._lut[ord(c)] = v
+            else:
+                self._rare[ord(c)] = v
+        self._unknown = unknown
+        self._may_drop = unknown == _DROP or _DROP in chars.values()
+
+    def _codes(self, texts: List[str], maxlen: Optional[int]):
+        truncate = maxlen is not None and not self._may_drop
+        if truncate:
+            # One id per character, so only the first maxlen characters matter.
+            # ASCII lowercases character by character and can be cut first.
+            texts = [t[:maxlen] if t.isascii() else t for t in texts]
+        if self.lower:
+            texts = [t.lower() for t in texts]
+        if truncate:
+            texts = [t[:maxlen] for t in texts]
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+        joined = "".join(texts)
+        if joined.isascii():
+            codes = np.frombuffer(joined.encode("ascii"), dtype=np.uint8)
+        else:
+            codes = np.frombuffer(joined.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        return codes, lengths
+
+    def _lookup(self, codes: np.ndarray) -> np.ndarray:
+        size = len(self._lut)
+        if not len(codes) or int(codes.max()) < size:
+            return self._lut.take(codes)
+        beyond = codes >= size
+        ids = self._lut.take(np.where(beyond, 0, codes))
+        ids[beyond] = [self._rare.get(int(c), self._unknown) for c in codes[beyond]]
+        return ids
+
+    def texts_to_sequences(self, texts: List[str], maxlen: Optional[int] = None) -> List[List[int]]:
+        """Same as Keras; ``maxlen`` keeps the first ``maxlen`` ids, like ``truncating='post'``."""
+        if not texts:
+            return []
+        codes, lengths = self._codes(texts, maxlen)
+        ids = self._lookup(codes)
+        rows = np.split(ids, np.cumsum(lengths)[:-1])
+        if self._may_drop:
+            rows = [r[r != _DROP] for r in rows]
+        if maxlen is not None:
+            rows = [r[:maxlen] for r in rows]
+        return [r.tolist() for r in rows]
+
+    def text_to_sequence(self, text: str, maxlen: Optional[int] = None) -> List[int]:
+        return self.texts_to_sequences([text], maxlen)[0]
+
+
+def from_config(word_index: Dict[str, int], num_words=None, oov_token=None, filters=DEFAULT_FILTERS,
+                lower=True, split=" ", char_level=False):
+    if char_level:
+        try:
+            return CharTokenizer(word_index, num_words, oov_token, lower)
+        except ValueError:
+            pass
+    return WordTokenizer(word_index, num_words, oov_token, filters, lower, split, char_level)
+
+
+def from_keras(tokenizer):
+    """Compiles a fitted Keras ``Tokenizer``."""
+    if getattr(tokenizer, "analyzer", None) is not None:
+        raise ValueError("Tokenizers with a custom analyzer are not supported")
+    return from_config(tokenizer.word_index, tokenizer.num_words, tokenizer.oov_token, tokenizer.filters,
+                       tokenizer.lower, tokenizer.split, tokenizer.char_level)
+
+
+def load_keras_json(path: str):
+    """Reads a ``Tokenizer.to_json()`` file. Only ``word_index`` is decoded; the word counts are skipped."""
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)["config"]
+    word_index = config["word_index"]
+    if isinstance(word_index, str):
+        word_index = json.loads(word_index)
+    return from_config(word_index, config.get("num_words"), config.get("oov_token"),
+                       config.get("filters", DEFAULT_FILTERS), config.get("lower", True),
+                       config.get("split", " "), config.get("char_level", False))
+
+
+def pad_post(sequences, maxlen: int, truncating: str = "post", dtype=np.int32) -> np.ndarray:
+    """``pad_sequences(sequences, maxlen, padding='post', truncating=truncating)``."""
+    out = np.zeros((len(sequences), maxlen), dtype=dtype)
+    for i, seq in enumerate(sequences):
+        seq = seq[:maxlen] if truncating == "post" else seq[-maxlen:]
+        out[i, :len(seq)] = seq
+    return out
@@ -1,13 +1,28 @@
+import asyncio
+from typing import List
+
 from fastapi import FastAPI, Request
-from geoip_utils import get_geoip
-from reputation_api import get_ip_reputation
-from tokenizer.payload_tokenizer import tokenize_payload
-import hashlib
-import math
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from geoip_utils import get_geoip, get_geoip_batch
+from ip_lists import ip_list_verdicts, ip_lists_stats, reload_ip_lists
+from reputation_api import get_ip_reputation_async, aclose_reputation
+from payload_features import extract_payload_features, extract_payload_features_batch
 import uvicorn
 
 app = FastAPI(title="Feature Extractor Service", version="1.0")
 
+
+class FeatureItem(BaseModel):
+    payload: str = ""
+    ip: str = ""
+    ua: str = ""
+
+
+class FeatureBatchRequest(BaseModel):
+    items: List[FeatureItem]
+
+
 @app.post("/extract_features")
 async def extract_features(request: Request):
     """
@@ -18,37 +33,66 @@ async def extract_features(request: Request):
     ip = data.get("ip", "")
     ua = data.get("ua", "")
 
-    # --- Tokenize payload ---
-    tokens = tokenize_payload(payload)
-
-    # --- Calculate entropy ---
-    def calculate_entropy(s):
-        probabilities = [float(s.count(c)) / len(s) for c in dict.fromkeys(list(s))]
-        entropy = - sum([p * math.log(p, 2) for p in probabilities])
-        return round(entropy, 3)
+    # --- Blocklist / allowlist: a listed IP gets its verdict without any feature extraction ---
+    verdict = ip_list_verdicts([ip])[0]
+    if verdict is not None:
+        return {"ip": ip, "verdict": verdict, "user_agent": ua}
 
-    entropy = calculate_entropy(payload) if payload else 0.0
+    # --- Tokens, entropy and payload hash ---
+    response = extract_payload_features(payload)
 
     # --- GeoIP Lookup ---
-    geo = get_geoip(ip)
+    response["geo"] = get_geoip(ip)
 
     # --- IP Reputation ---
-    reputation_score = get_ip_reputation(ip)
-
-    # --- Hash the payload for uniqueness ---
-    payload_hash = hashlib.md5(payload.encode()).hexdigest()
-
-    # --- Response ---
-    response = {
-        "payload_hash": payload_hash,
-        "tokens": tokens,
-        "entropy": entropy,
-        "geo": geo,
-        "reputation_score": reputation_score,
-        "user_agent": ua
-    }
+    response["reputation_score"] = await get_ip_reputation_async(ip)
+
+    response["user_agent"] = ua
     return response
 
 
+@app.post("/extract_features/batch")
+async def extract_features_batch(req: FeatureBatchRequest):
+    """
+    Same as /extract_features for many items. Payload entropy is computed in one
+    vectorized pass and each distinct IP is resolved once.
+    """
+    verdicts = ip_list_verdicts([it.ip for it in req.items])
+    items = [it for it, v in zip(req.items, verdicts) if v is None]
+    ips = [it.ip for it in items]
+    unique_ips = list(dict.fromkeys(ips))
+
+    results, geos, reputations = await asyncio.gather(
+        run_in_threadpool(extract_payload_features_batch, [it.payload for it in items]),
+        run_in_threadpool(get_geoip_batch, ips),
+        asyncio.gather(*(get_ip_reputation_async(ip) for ip in unique_ips)),
+    )
+    reputation = dict(zip(unique_ips, reputations))
+
+    for it, res, geo in zip(items, results, geos):
+        res["geo"] = geo
+        res["reputation_score"] = reputation[it.ip]
+        res["user_agent"] = it.ua
+    extracted = iter(results)
+    results = [next(extracted) if v is None else {"ip": it.ip, "verdict": v, "user_agent": it.ua}
+               for it, v in zip(req.items, verdicts)]
+    return {"results": results, "total": len(results)}
+
+
+@app.get("/ip_lists")
+def ip_lists():
+    return ip_lists_stats()
+
+
+@app.post("/ip_lists/reload")
+def ip_lists_reload():
+    return reload_ip_lists()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await aclose_reputation()
+
+
 if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
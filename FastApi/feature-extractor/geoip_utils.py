@@ -1,35 +1,112 @@
-import geoip2.database
+import functools
+import os
 import socket
+import threading
+import time
+
+import geoip2.database
+import geoip2.errors
+
+GEOIP_DB_PATH = os.getenv("GEOIP_DB_PATH", "./GeoLite2-City.mmdb")
+GEOIP_CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", "65536"))
+GEOIP_RETRY_S = float(os.getenv("GEOIP_RETRY_S", "30"))
+
+_reader = None
+_reader_error_msg = None
+_reader_retry_at = 0.0
+_reader_lock = threading.Lock()
+
+
+def _get_reader():
+    """
+    Returns the process-wide GeoLite2 reader, opened once in memory-mapped mode.
+    A failed open is reported to every lookup for ``GEOIP_RETRY_S`` seconds,
+    then the next lookup tries to open the database again.
+    """
+    global _reader, _reader_error_msg, _reader_retry_at
+    if _reader is None and (_reader_error_msg is None or time.monotonic() >= _reader_retry_at):
+        with _reader_lock:
+            if _reader is None and (_reader_error_msg is None or time.monotonic() >= _reader_retry_at):
+                try:
+                    _reader = geoip2.database.Reader(GEOIP_DB_PATH, mode=geoip2.database.MODE_MMAP)
+                    _reader_error_msg = None
+                except Exception as e:
+                    # Only the message is kept: re-raising one exception object grows its traceback every time.
+                    _reader_error_msg = str(e)
+                    _reader_retry_at = time.monotonic() + GEOIP_RETRY_S
+    if _reader is None:
+        raise RuntimeError(_reader_error_msg) from None
+    return _reader
+
+
+def reload_geoip():
+    """Closes the current reader and clears cached lookups; the next call reopens the database."""
+    global _reader, _reader_error_msg
+    with _reader_lock:
+        if _reader is not None:
+            _reader.close()
+        _reader = None
+        _reader_error_msg = None
+    _cached_lookup.cache_clear()
+
+
+@functools.lru_cache(maxsize=1)
+def _local_ip():
+    return socket.gethostbyname(socket.gethostname())
+
+
+@functools.lru_cache(maxsize=GEOIP_CACHE_SIZE)
+def _cached_lookup(ip_address):
+    # Addresses missing from the database are cached like hits, so repeated
+    # misses stay cheap. Any other error propagates, and lru_cache does not
+    # cache raised exceptions, so the next call for that IP tries again.
+    if ip_address == "127.0.0.1" or ip_address.lower() == "localhost":
+        ip_address = _local_ip()
+
+    try:
+        response = _get_reader().city(ip_address)
+    except geoip2.errors.AddressNotFoundError as e:
+        return _unknown(ip_address, e)
+
+    return {
+        "ip": ip_address,
+        "country": response.country.name,
+        "city": response.city.name,
+        "latitude": response.location.latitude,
+        "longitude": response.location.longitude
+    }
+
+
+def _unknown(ip_address, error):
+    return {
+        "ip": ip_address,
+        "country": "Unknown",
+        "city": "Unknown",
+        "latitude": None,
+        "longitude": None,
+        "error": str(error)
+    }
+
+
+def _lookup(ip_address):
+    try:
+        return _cached_lookup(ip_address)
+    except Exception as e:
+        return _unknown(ip_address, e)
+
 
 def get_geoip(ip_address):
     """
     Returns GeoIP location data using MaxMind GeoLite2.
     If no database or invalid IP, returns default.
     """
-    try:
-        if ip_address == "127.0.0.1" or ip_address.lower() == "localhost":
-            hostname = socket.gethostname()
-            ip_address = socket.gethostbyname(hostname)
-
-        reader = geoip2.database.Reader("./GeoLite2-City.mmdb")
-        response = reader.city(ip_address)
-
-        geo_data = {
-            "ip": ip_address,
-            "country": response.country.name,
-            "city": response.city.name,
-            "latitude": response.location.latitude,
-            "longitude": response.location.longitude
-        }
-        reader.close()
-        return geo_data
+    return dict(_lookup(ip_address))
 
-    except Exception as e:
-        return {
-            "ip": ip_address,
-            "country": "Unknown",
-            "city": "Unknown",
-            "latitude": None,
-            "longitude": None,
-            "error": str(e)
-        }
+
+def get_geoip_batch(ip_addresses):
+    """
+    Resolves many IPs in one call. Each distinct IP is looked up once and the
+    results come back in input order.
+    """
+    resolved = {ip: _lookup(ip) for ip in dict.fromkeys(ip_addresses)}
+    return [dict(resolved[ip]) for ip in ip_addresses]
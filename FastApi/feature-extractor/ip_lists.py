@@ -0,0 +1,248 @@
+"""
+IP blocklist / allowlist checked before any feature extraction or model call.
+
+Each list is a text file with one IP or CIDR per line (``#`` starts a
+comment). Prefixes are merged into disjoint, sorted address ranges: IPv4 as
+two uint32 arrays (8 bytes a range), IPv6 as two arrays of 16-byte big-endian
+values, which sort like the addresses (32 bytes a range). An address is in a
+list when the number of range starts at or below it is one more than the
+number of range ends below it: two binary searches, done for a whole batch at
+once.
+
+The lists are loaded at import. Every ``IP_LISTS_CHECK_S`` seconds a lookup
+checks whether either file changed, and if so they are reloaded in a
+background thread. The new pair of indexes replaces the old one in a single
+assignment, so a lookup sees either the old lists or the new ones. Replace a
+list file by renaming a complete new file over it, so a reload never reads a
+half-written one.
+
+The allowlist wins over the blocklist.
+"""
+import os
+import socket
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+IP_BLOCKLIST_PATH = os.getenv("IP_BLOCKLIST_PATH", "")
+IP_ALLOWLIST_PATH = os.getenv("IP_ALLOWLIST_PATH", "")
+IP_LISTS_CHECK_S = float(os.getenv("IP_LISTS_CHECK_S", "10"))
+
+BLOCK = "block"
+ALLOW = "allow"
+
+_V4_MAPPED = 0xFFFF << 32
+_V4_MAPPED_NET = _V4_MAPPED >> 32
+
+
+def parse_cidr(text: str) -> Tuple[bool, int, int]:
+    """``(is IPv4, first address, last address)`` of an IP or CIDR; host bits are ignored.
+
+    IPv4-mapped IPv6 addresses and prefixes (``::ffff:0:0/96`` and longer) are treated as IPv4.
+    """
+    addr, _, length = text.partition("/")
+    if ":" in addr:
+        value, bits = int.from_bytes(socket.inet_pton(socket.AF_INET6, addr), "big"), 128
+    else:
+        value, bits = int.from_bytes(socket.inet_pton(socket.AF_INET, addr), "big"), 32
+    prefix = int(length) if length else bits
+    if not 0 <= prefix <= bits:
+        raise ValueError(f"invalid prefix length in {text!r}")
+    if bits == 128 and value >> 32 == _V4_MAPPED_NET and prefix >= 96:
+        value, bits, prefix = value & 0xFFFFFFFF, 32, prefix - 96
+    host = (1 << (bits - prefix)) - 1
+    start = value & ~host
+    return bits == 32, start, start | host
+
+
+def _parse_address(ip: str) -> Optional[Tuple[bool, int]]:
+    try:
+        v4, start, _ = parse_cidr(ip.strip())
+    except (OSError, ValueError):
+        return None
+    return v4, start
+
+
+def _merge(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted, disjoint ranges covering the same addresses; overlapping and adjacent ranges are joined."""
+    if not len(starts):
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    first = np.ones(len(starts), dtype=bool)
+    first[1:] = starts[1:] > reach[:-1] + 1
+    heads = np.flatnonzero(first)
+    return starts[heads], np.maximum.reduceat(ends, heads)
+
+
+def _to_v16(values: Sequence[int]) -> np.ndarray:
+    return np.frombuffer(b"".join(v.to_bytes(16, "big") for v in values), dtype="V16").copy()
+
+
+class CidrIndex:
+    """Sorted, disjoint address ranges of one list."""
+
+    def __init__(self, v4_starts: np.ndarray, v4_ends: np.ndarray, v6_starts: np.ndarray, v6_ends: np.ndarray,
+                 prefixes: int = 0, invalid: int = 0):
+        self.v4_starts = v4_starts
+        self.v4_ends = v4_ends
+        self.v6_starts = v6_starts
+        self.v6_ends = v6_ends
+        self.prefixes = prefixes
+        self.invalid = invalid
+
+    @classmethod
+    def empty(cls) -> "CidrIndex":
+        return cls.from_cidrs([])
+
+    @classmethod
+    def from_cidrs(cls, lines) -> "CidrIndex":
+        """Builds the index from IP / CIDR strings. Blank lines, comments and invalid entries are skipped."""
+        v4_starts, v4_ends = array("I"), array("I")
+        v6 = []
+        prefixes = invalid = 0
+        for line in lines:
+            text = line.split("#", 1)[0].strip()
+            if not text:
+                continue
+            try:
+                v4, start, end = parse_cidr(text.split(None, 1)[0])
+            except (OSError, ValueError):
+                invalid += 1
+                continue
+            prefixes += 1
+            if v4:
+                v4_starts.append(start)
+                v4_ends.append(end)
+            else:
+                v6.append((start, end))
+
+        # int64 leaves room for the "+ 1" of the adjacency test at 255.255.255.255.
+        starts4, ends4 = _merge(np.frombuffer(v4_starts, dtype=np.uint32).astype(np.int64),
+                                np.frombuffer(v4_ends, dtype=np.uint32).astype(np.int64))
+        merged6: List[List[int]] = []
+        for start, end in sorted(v6):
+            if merged6 and start <= merged6[-1][1] + 1:
+                merged6[-1][1] = max(merged6[-1][1], end)
+            else:
+                merged6.append([start, end])
+        return cls(starts4.astype(np.uint32), ends4.astype(np.uint32),
+                   _to_v16([s for s, _ in merged6]), _to_v16([e for _, e in merged6]), prefixes, invalid)
+
+    @classmethod
+    def load(cls, path: str) -> "CidrIndex":
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return cls.from_cidrs(f)
+
+    @property
+    def ranges(self) -> int:
+        return len(self.v4_starts) + len(self.v6_starts)
+
+    @property
+    def nbytes(self) -> int:
+        return self.v4_starts.nbytes + self.v4_ends.nbytes + self.v6_starts.nbytes + self.v6_ends.nbytes
+
+    @staticmethod
+    def _inside(starts: np.ndarray, ends: np.ndarray, values: np.ndarray) -> np.ndarray:
+        # Ranges are disjoint and sorted, so the ends are sorted too.
+        return np.searchsorted(starts, values, side="right") - 1 == np.searchsorted(ends, values, side="left")
+
+    def contains_many(self, ips: Sequence[str]) -> np.ndarray:
+        """Whether each IP is in the list; strings that are not addresses are not."""
+        out = np.zeros(len(ips), dtype=bool)
+        rows4, values4, rows6, values6 = [], [], [], []
+        for row, ip in enumerate(ips):
+            parsed = _parse_address(ip) if ip else None
+            if parsed is None:
+                continue
+            v4, value = parsed
+            if v4:
+                rows4.append(row)
+                values4.append(value)
+            else:
+                rows6.append(row)
+                values6.append(value)
+        if rows4 and len(self.v4_starts):
+            out[rows4] = self._inside(self.v4_starts, self.v4_ends, np.array(values4, dtype=np.uint32))
+        if rows6 and len(self.v6_starts):
+            out[rows6] = self._inside(self.v6_starts, self.v6_ends, _to_v16(values6))
+        return out
+
+    def __contains__(self, ip: str) -> bool:
+        return bool(self.contains_many([ip])[0])
+
+    def stats(self) -> Dict:
+        return {"prefixes": self.prefixes, "ranges": self.ranges, "invalid": self.invalid, "bytes": self.nbytes}
+
+
+# (blocklist, allowlist), swapped as one object on reload.
+_lists: Tuple[CidrIndex, CidrIndex] = (CidrIndex.empty(), CidrIndex.empty())
+_loaded: Dict = {"files": {}, "loaded_at": None, "seconds": None, "error": None}
+_reload_lock = threading.Lock()
+_next_check = 0.0
+
+
+def _signature(path: str):
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def reload_ip_lists() -> Dict:
+    """Rebuilds both lists from their files and swaps them in. A list whose file is missing is empty."""
+    global _lists
+    with _reload_lock:
+        start = time.perf_counter()
+        files = {path: _signature(path) for path in (IP_BLOCKLIST_PATH, IP_ALLOWLIST_PATH) if path}
+        try:
+            block = CidrIndex.load(IP_BLOCKLIST_PATH) if files.get(IP_BLOCKLIST_PATH) else CidrIndex.empty()
+            allow = CidrIndex.load(IP_ALLOWLIST_PATH) if files.get(IP_ALLOWLIST_PATH) else CidrIndex.empty()
+        except OSError as e:
+            # Keep serving the previous lists; the next check retries.
+            _loaded.update(files={}, error=str(e))
+            return ip_lists_stats()
+        _lists = (block, allow)
+        _loaded.update(files=files, loaded_at=time.time(), seconds=round(time.perf_counter() - start, 3), error=None)
+    return ip_lists_stats()
+
+
+def _check_for_changes():
+    global _next_check
+    now = time.monotonic()
+    if now < _next_check:
+        return
+    _next_check = now + IP_LISTS_CHECK_S
+    files = {path: _signature(path) for path in (IP_BLOCKLIST_PATH, IP_ALLOWLIST_PATH) if path}
+    if files != _loaded["files"] and not _reload_lock.locked():
+        threading.Thread(target=reload_ip_lists, name="ip-lists-reload", daemon=True).start()
+
+
+def ip_list_verdicts(ips: Sequence[str]) -> List[Optional[str]]:
+    """``"allow"`` or ``"block"`` for each IP on a list, None for the others."""
+    _check_for_changes()
+    block, allow = _lists
+    blocked = block.contains_many(ips) if block.ranges else np.zeros(len(ips), dtype=bool)
+    allowed = allow.contains_many(ips) if allow.ranges else np.zeros(len(ips), dtype=bool)
+    return [ALLOW if a else BLOCK if b else None for a, b in zip(allowed.tolist(), blocked.tolist())]
+
+
+def ip_list_verdict(ip: str) -> Optional[str]:
+    return ip_list_verdicts([ip])[0]
+
+
+def ip_lists_stats() -> Dict:
+    block, allow = _lists
+    return {"blocklist": {"path": IP_BLOCKLIST_PATH or None, **block.stats()},
+            "allowlist": {"path": IP_ALLOWLIST_PATH or None, **allow.stats()}, **_loaded}
+
+
+if IP_BLOCKLIST_PATH or IP_ALLOWLIST_PATH:
+    reload_ip_lists()
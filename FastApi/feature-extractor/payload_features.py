@@ -0,0 +1,87 @@
+import hashlib
+import importlib.util
+import os
+
+import numpy as np
+
+
+def _load_tokenize_payload():
+    # tokenizer/ is not a package, and the combined app loads this file by path,
+    # so the tokenizer is loaded by path too rather than through sys.path.
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizer", "payload_tokenizer.py")
+    spec = importlib.util.spec_from_file_location("feat_payload_tokenizer", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod.tokenize_payload
+
+
+tokenize_payload = _load_tokenize_payload()
+
+# Payloads per bincount call in batch mode; bounds the (chunk x 256) histogram.
+_BATCH_CHUNK = 4096
+
+
+def _entropy_from_counts(counts, lengths):
+    """Shannon entropy (bits) per row of a (n, 256) byte histogram."""
+    lengths = np.asarray(lengths, dtype=np.float64).reshape(-1, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = counts / np.where(lengths > 0, lengths, 1.0)
+        terms = np.where(counts > 0, p * np.log2(np.where(p > 0, p, 1.0)), 0.0)
+    return np.round(-terms.sum(axis=1), 3) + 0.0
+
+
+def byte_entropy(data):
+    """
+    Entropy of a UTF-8 buffer, computed from a 256-bin byte histogram.
+    """
+    if not data:
+        return 0.0
+    counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256).reshape(1, 256)
+    return float(_entropy_from_counts(counts, [len(data)])[0])
+
+
+def batch_entropy(buffers):
+    """
+    Entropy of many buffers. Each chunk of payloads is concatenated and
+    histogrammed with a single bincount keyed by (payload index, byte).
+    """
+    out = np.zeros(len(buffers), dtype=np.float64)
+    for start in range(0, len(buffers), _BATCH_CHUNK):
+        chunk = buffers[start:start + _BATCH_CHUNK]
+        lengths = np.fromiter((len(b) for b in chunk), dtype=np.int64, count=len(chunk))
+        if not lengths.any():
+            continue
+        flat = np.frombuffer(b"".join(chunk), dtype=np.uint8).astype(np.int64)
+        rows = np.repeat(np.arange(len(chunk), dtype=np.int64), lengths)
+        counts = np.bincount(rows * 256 + flat, minlength=len(chunk) * 256).reshape(len(chunk), 256)
+        out[start:start + len(chunk)] = _entropy_from_counts(counts, lengths)
+    return out
+
+
+def extract_payload_features(payload):
+    """
+    Hash, tokens and entropy of a payload, from a single UTF-8 encoding.
+    """
+    data = payload.encode()
+    return {
+        "payload_hash": hashlib.md5(data).hexdigest(),
+        "tokens": tokenize_payload(payload),
+        "entropy": byte_entropy(data),
+    }
+
+
+def extract_payload_features_batch(payloads):
+    """
+    Same as extract_payload_features for a list of payloads, with the entropy
+    of the whole list computed in vectorized chunks.
+    """
+    buffers = [p.encode() for p in payloads]
+    entropies = batch_entropy(buffers).tolist()
+    return [
+        {
+            "payload_hash": hashlib.md5(data).hexdigest(),
+            "tokens": tokenize_payload(payload),
+            "entropy": entropy,
+        }
+        for payload, data, entropy in zip(payloads, buffers, entropies)
+    ]
@@ -1,27 +1,243 @@
-import requests
+import asyncio
 import os
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
 
 API_KEY = os.getenv("ABUSEIPDB_API_KEY", "")
+ABUSEIPDB_URL = os.getenv("ABUSEIPDB_URL", "https://api.abuseipdb.com/api/v2/check")
+REPUTATION_TIMEOUT_S = float(os.getenv("REPUTATION_TIMEOUT_S", "2.0"))
+REPUTATION_MAX_CONNECTIONS = int(os.getenv("REPUTATION_MAX_CONNECTIONS", "20"))
+REPUTATION_CACHE_SIZE = int(os.getenv("REPUTATION_CACHE_SIZE", "100000"))
+REPUTATION_CACHE_TTL_S = float(os.getenv("REPUTATION_CACHE_TTL_S", "3600"))
+REPUTATION_NEGATIVE_TTL_S = float(os.getenv("REPUTATION_NEGATIVE_TTL_S", "300"))
+REPUTATION_BREAKER_FAILURES = int(os.getenv("REPUTATION_BREAKER_FAILURES", "5"))
+REPUTATION_BREAKER_RESET_S = float(os.getenv("REPUTATION_BREAKER_RESET_S", "30"))
+
+OFFLINE_SCORE = 10  # neutral reputation when no API key is configured
+FAILED_SCORE = 0
+
+
+class CircuitBreaker:
+    """
+    Stops calling the reputation API after ``failure_threshold`` consecutive
+    failures. After ``reset_timeout`` seconds one trial call is let through;
+    it closes the breaker on success and reopens it on failure.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def record_cancelled(self):
+        """A call that was cancelled says nothing about the API, but it frees the half-open trial slot."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class ReputationClient:
+    """
+    AbuseIPDB client with a pooled HTTP connection, strict timeouts, a TTL
+    cache (failed lookups are cached for a shorter time), request coalescing
+    for concurrent lookups of the same IP, and a circuit breaker.
+    """
+
+    def __init__(self, api_key=API_KEY, url=ABUSEIPDB_URL, timeout=REPUTATION_TIMEOUT_S,
+                 max_connections=REPUTATION_MAX_CONNECTIONS, cache_size=REPUTATION_CACHE_SIZE,
+                 ttl=REPUTATION_CACHE_TTL_S, negative_ttl=REPUTATION_NEGATIVE_TTL_S, breaker=None):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = httpx.Timeout(timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.breaker = breaker or CircuitBreaker(REPUTATION_BREAKER_FAILURES, REPUTATION_BREAKER_RESET_S)
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "failures": 0, "short_circuited": 0}
+        self._stats_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._inflight = {}  # (event loop, ip) -> the task fetching it on that loop
+        self._clients = {}  # event loop -> the AsyncClient used on it
+        self._clients_lock = threading.Lock()
+        self._sync_client = None
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    # --- cache ---
+    def _cache_get(self, ip):
+        with self._cache_lock:
+            entry = self._cache.get(ip)
+            fresh = entry is not None and entry[1] >= time.monotonic()
+            if fresh:
+                self._cache.move_to_end(ip)
+        self._count("hits" if fresh else "misses")
+        return entry[0] if fresh else None
+
+    def _cache_put(self, ip, score, ttl):
+        with self._cache_lock:
+            self._cache[ip] = (score, time.monotonic() + ttl)
+            self._cache.move_to_end(ip)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # --- HTTP ---
+    def _request_args(self, ip):
+        headers = {"Key": self.api_key, "Accept": "application/json"}
+        params = {"ipAddress": ip, "maxAgeInDays": 90}
+        return headers, params
+
+    def _handle_response(self, ip, response):
+        response.raise_for_status()
+        score = response.json().get("data", {}).get("abuseConfidenceScore", 0)
+        self.breaker.record_success()
+        self._cache_put(ip, score, self.ttl)
+        return score
+
+    def _handle_failure(self, ip):
+        self._count("failures")
+        self.breaker.record_failure()
+        self._cache_put(ip, FAILED_SCORE, self.negative_ttl)
+        return FAILED_SCORE
+
+    def _async_client(self):
+        # An AsyncClient is bound to the loop it was first used on, so each loop gets its own.
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            client = self._clients.get(loop)
+            if client is None:
+                # The sockets of a closed loop are already gone; its client can only be dropped.
+                for old in [l for l in self._clients if l.is_closed()]:
+                    del self._clients[old]
+                client = self._clients[loop] = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return client
+
+    async def _fetch(self, ip):
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            return FAILED_SCORE
+        headers, params = self._request_args(ip)
+        try:
+            response = await self._async_client().get(self.url, headers=headers, params=params)
+            return self._handle_response(ip, response)
+        except asyncio.CancelledError:
+            # Not an Exception: without this a cancelled half-open trial would block every later lookup.
+            self.breaker.record_cancelled()
+            raise
+        except Exception:
+            return self._handle_failure(ip)
+
+    def _precheck(self, ip):
+        if not ip or ip == "127.0.0.1":
+            return 0
+        if not self.api_key:
+            # Offline mode / testing
+            return OFFLINE_SCORE
+        return self._cache_get(ip)
+
+    async def lookup(self, ip):
+        score = self._precheck(ip)
+        if score is not None:
+            return score
+        # A task can only be awaited on its own loop, so lookups are coalesced per loop.
+        key = (asyncio.get_running_loop(), ip)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(ip))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._count("coalesced")
+        return await asyncio.shield(task)
+
+    def lookup_sync(self, ip):
+        score = self._precheck(ip)
+        if score is not None:
+            return score
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            return FAILED_SCORE
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(timeout=self.timeout, limits=self.limits)
+        headers, params = self._request_args(ip)
+        try:
+            response = self._sync_client.get(self.url, headers=headers, params=params)
+            return self._handle_response(ip, response)
+        except Exception:
+            return self._handle_failure(ip)
+
+    async def aclose(self):
+        """Closes the clients of every loop: on this loop directly, on other running loops from their own thread."""
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            clients, self._clients = self._clients, {}
+        for client_loop, client in clients.items():
+            if client_loop is loop:
+                await client.aclose()
+            elif client_loop.is_running():
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.aclose(), client_loop))
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+
+reputation_client = ReputationClient()
+
+
+async def get_ip_reputation_async(ip):
+    """
+    Returns reputation score for a given IP using AbuseIPDB API without blocking the event loop.
+    If no API key is provided, returns dummy reputation score.
+    """
+    return await reputation_client.lookup(ip)
+
 
 def get_ip_reputation(ip):
     """
     Returns reputation score for a given IP using AbuseIPDB API.
     If no API key is provided, returns dummy reputation score.
     """
-    if not ip or ip == "127.0.0.1":
-        return 0
+    return reputation_client.lookup_sync(ip)
 
-    if not API_KEY:
-        # Offline mode / testing
-        return 10  # neutral reputation
-
-    try:
-        url = f"https://api.abuseipdb.com/api/v2/check"
-        headers = {"Key": API_KEY, "Accept": "application/json"}
-        params = {"ipAddress": ip, "maxAgeInDays": 90}
-        response = requests.get(url, headers=headers, params=params)
-        data = response.json()
-        return data.get("data", {}).get("abuseConfidenceScore", 0)
 
-    except Exception:
-        return 0
+async def aclose_reputation():
+    await reputation_client.aclose()
@@ -0,0 +1,123 @@
+"""
+Tests ReputationClient against a local stub of the AbuseIPDB check endpoint.
+
+Run with ``python -m pytest`` from this directory.
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from reputation_api import FAILED_SCORE, CircuitBreaker, ReputationClient  # noqa: E402
+
+
+class StubAbuseIPDB:
+    """Answers every GET with ``status`` and ``score`` after ``delay`` seconds and counts the requests."""
+
+    def __init__(self, score=42, status=200, delay=0.0):
+        self.score, self.status, self.delay = score, status, delay
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.delay)
+                body = json.dumps({"data": {"abuseConfidenceScore": stub.score}}).encode()
+                try:
+                    self.send_response(stub.status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timeout test)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/v2/check"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        servers.append(StubAbuseIPDB(**kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def _run(client, make_coro):
+    async def main():
+        try:
+            return await make_coro()
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def test_concurrent_lookups_of_one_ip_make_one_request(stub):
+    server = stub(score=42, delay=0.2)
+    client = ReputationClient(api_key="test", url=server.url)
+
+    scores = _run(client, lambda: asyncio.gather(*(client.lookup("203.0.113.7") for _ in range(10))))
+
+    assert scores == [42] * 10
+    assert server.requests == 1
+    assert client.stats["coalesced"] == 9
+
+
+def test_breaker_opens_after_repeated_failures(stub):
+    server = stub(status=500)
+    client = ReputationClient(api_key="test", url=server.url, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60))
+
+    async def lookups():
+        return [await client.lookup(f"203.0.113.{i}") for i in range(5)]
+
+    assert _run(client, lookups) == [FAILED_SCORE] * 5
+    assert server.requests == 3
+    assert client.breaker.state == "open"
+    assert client.stats["short_circuited"] == 2
+
+
+def test_timeout_returns_fallback(stub):
+    server = stub(score=42, delay=1.0)
+    client = ReputationClient(api_key="test", url=server.url, timeout=0.1)
+
+    assert _run(client, lambda: client.lookup("203.0.113.9")) == FAILED_SCORE
+    assert client.stats["failures"] == 1
+
+
+def test_cancelled_half_open_trial_does_not_block_the_breaker(stub):
+    server = stub(status=500)
+    client = ReputationClient(api_key="test", url=server.url, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+
+    async def cancelled_trial():
+        await client.lookup("203.0.113.1")
+        assert client.breaker.state == "open"
+        await asyncio.sleep(0.1)
+        server.status, server.delay = 200, 1.0
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client._fetch("203.0.113.2"), 0.1)
+        return client.breaker.allow()
+
+    assert _run(client, cancelled_trial)
@@ -0,0 +1,586 @@
+"""
+Flow features for the bot models, built from raw packets.
+
+The bot models score the eight CICFlowMeter features of a finished flow
+(``TrafficFlow``). ``FlowMeter`` builds them from packet events: packets
+are grouped into bidirectional flows by 5-tuple, running counts and length
+sums are kept per flow, and the features are emitted when the flow ends.
+A flow ends on a TCP FIN or RST, when no packet arrived for
+``idle_timeout`` seconds, or ``active_timeout`` seconds after its first
+packet. The forward direction is that of the flow's first packet.
+
+Feature definitions follow CICFlowMeter, which produced the CTU-13 training
+data: durations and inter-arrival times in microseconds, rates per second,
+the sample standard deviation of packet lengths, and the IP length (header
+included) as a packet's length. Rates of a flow whose packets share one
+timestamp are 0 (CICFlowMeter divides by zero there).
+
+Packets are ingested in batches (numpy arrays of ``PACKET_DTYPE``), and a
+batch is aggregated with array operations; only the flows it touches cost
+Python work. Live flows sit in arrays allocated once for ``max_flows``
+flows; when the table is full the least recently seen flow is ended early.
+Timeouts run on packet time, so feeding an old capture gives the same flows
+as live traffic would have.
+
+Packets come from a pcap file (``read_pcap``), NDJSON packet events
+(``read_ndjson``, one ``{"ts", "src", "dst", "sport", "dport", "proto",
+"length", "flags"}`` object per line) or the ``/bot/flows/packets``
+endpoint. From the command line, completed flows are scored with the bot
+models in batches and written as NDJSON:
+
+    python flow_meter.py --pcap capture.pcap --output flows.ndjson --models rf iso
+    python flow_meter.py --ndjson - < packets.ndjson
+"""
+import argparse
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import IO, Dict, Iterator, List
+
+import numpy as np
+
+FIN = 0x01
+RST = 0x04
+PROTOCOLS = {"icmp": 1, "tcp": 6, "udp": 17, "icmpv6": 58}
+
+# Addresses are 128-bit, split in two halves; IPv4 is stored IPv4-mapped (::ffff:a.b.c.d).
+PACKET_DTYPE = np.dtype([("ts", "f8"), ("src_hi", "u8"), ("src_lo", "u8"), ("dst_hi", "u8"), ("dst_lo", "u8"),
+                         ("sport", "u2"), ("dport", "u2"), ("proto", "u1"), ("flags", "u1"), ("length", "u4")])
+# Endpoint a is the lower (address, port) of the two, so both directions share a key.
+KEY_DTYPE = np.dtype([("a_hi", "u8"), ("a_lo", "u8"), ("b_hi", "u8"), ("b_lo", "u8"), ("a_port", "u2"),
+                      ("b_port", "u2"), ("proto", "u1")])
+_KEY_VOID = np.dtype((np.void, KEY_DTYPE.itemsize))
+_V4_MAPPED = 0xFFFF << 32
+
+FEATURES = ("flow_duration", "flow_byts_s", "flow_pkts_s", "pkt_len_mean", "pkt_len_std", "fwd_pkts_s", "bwd_pkts_s",
+            "flow_iat_mean")
+REASONS = ("fin", "idle", "active", "evicted", "flushed")
+_FIN, _IDLE, _ACTIVE, _EVICTED, _FLUSHED = range(len(REASONS))
+
+
+def _address(text: str):
+    ip = ipaddress.ip_address(text)
+    if ip.version == 4:
+        return 0, _V4_MAPPED | int(ip)
+    value = int(ip)
+    return value >> 64, value & 0xFFFFFFFFFFFFFFFF
+
+
+def _format_address(hi: int, lo: int) -> str:
+    if hi == 0 and lo >> 32 == 0xFFFF:
+        return str(ipaddress.IPv4Address(lo & 0xFFFFFFFF))
+    return str(ipaddress.IPv6Address(hi << 64 | lo))
+
+
+def packets_from_events(events: List[Dict]) -> np.ndarray:
+    """Packet array from event dicts with ``ts`` (seconds), ``src``, ``dst``, ``length`` and optional
+    ``sport``, ``dport``, ``proto`` (number or name, default TCP) and ``flags`` (TCP flag bits)."""
+    packets = np.zeros(len(events), dtype=PACKET_DTYPE)
+    addresses: Dict[str, tuple] = {}
+    rows = []
+    for e in events:
+        src, dst = e["src"], e["dst"]
+        if src not in addresses:
+            addresses[src] = _address(src)
+        if dst not in addresses:
+            addresses[dst] = _address(dst)
+        proto = e.get("proto", 6)
+        proto = PROTOCOLS[proto.lower()] if isinstance(proto, str) else proto
+        rows.append((float(e["ts"]), *addresses[src], *addresses[dst], e.get("sport") or 0, e.get("dport") or 0, proto,
+                     e.get("flags") or 0, e["length"]))
+    packets[:] = rows
+    return packets
+
+
+def _precedes(hi1, lo1, port1, hi2, lo2, port2) -> np.ndarray:
+    """Elementwise (hi1, lo1, port1) <= (hi2, lo2, port2)."""
+    return (hi1 < hi2) | ((hi1 == hi2) & ((lo1 < lo2) | ((lo1 == lo2) & (port1 <= port2))))
+
+
+class FlowRecords:
+    """Finished flows: their key, direction, counters and why they ended, one entry per flow."""
+
+    def __init__(self, keys: np.ndarray, forward_a: np.ndarray, first: np.ndarray, last: np.ndarray,
+                 packets: np.ndarray, fwd_packets: np.ndarray, byte_sum: np.ndarray, byte_sq: np.ndarray,
+                 reasons: np.ndarray):
+        self.keys = keys
+        self.forward_a = forward_a
+        self.first = first
+        self.last = last
+        self.packets = packets
+        self.fwd_packets = fwd_packets
+        self.byte_sum = byte_sum
+        self.byte_sq = byte_sq
+        self.reasons = reasons
+
+    @classmethod
+    def concat(cls, parts: List["FlowRecords"]) -> "FlowRecords":
+        parts = [p for p in parts if len(p)] or parts[:1]
+        if not parts:
+            return cls.empty()
+        fields = ("keys", "forward_a", "first", "last", "packets", "fwd_packets", "byte_sum", "byte_sq", "reasons")
+        return cls(*(np.concatenate([getattr(p, f) for p in parts]) for f in fields))
+
+    @classmethod
+    def empty(cls) -> "FlowRecords":
+        f8, i8 = np.zeros(0), np.zeros(0, dtype=np.int64)
+        return cls(np.zeros(0, KEY_DTYPE), np.zeros(0, bool), f8, f8, i8, i8, f8, f8, np.zeros(0, np.uint8))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def features(self) -> np.ndarray:
+        """``[flows, 8]`` matrix in ``FEATURES`` (TrafficFlow) order."""
+        seconds = self.last - self.first
+        n = self.packets.astype(np.float64)
+        timed = seconds > 0
+        span = np.where(timed, seconds, 1.0)
+
+        def rate(count):
+            return np.where(timed, count / span, 0.0)
+
+        mean = self.byte_sum / n
+        several = n > 1
+        var = np.where(several, (self.byte_sq - self.byte_sum * mean) / np.where(several, n - 1, 1.0), 0.0)
+        return np.column_stack([
+            seconds * 1e6,
+            rate(self.byte_sum),
+            rate(n),
+            mean,
+            np.sqrt(np.maximum(var, 0.0)),
+            rate(self.fwd_packets.astype(np.float64)),
+            rate((self.packets - self.fwd_packets).astype(np.float64)),
+            np.where(several, seconds * 1e6 / np.where(several, n - 1, 1.0), 0.0),
+        ])
+
+    def to_dicts(self) -> List[Dict]:
+        out = []
+        for key, fwd_a, first, last, packets, reason, features in zip(
+                self.keys.tolist(), self.forward_a.tolist(), self.first.tolist(), self.last.tolist(),
+                self.packets.tolist(), self.reasons.tolist(), self.features.tolist()):
+            a_hi, a_lo, b_hi, b_lo, a_port, b_port, proto = key
+            a, b = (_format_address(a_hi, a_lo), a_port), (_format_address(b_hi, b_lo), b_port)
+            (src, sport), (dst, dport) = (a, b) if fwd_a else (b, a)
+            out.append({"src": src, "sport": sport, "dst": dst, "dport": dport, "proto": proto, "first_ts": first,
+                        "last_ts": last, "packets": packets, "end": REASONS[reason], **dict(zip(FEATURES, features))})
+        return out
+
+
+class FlowMeter:
+    def __init__(self, max_flows: int = 100_000, idle_timeout: float = 120.0, active_timeout: float = 120.0,
+                 sweep_interval: float = 1.0):
+        self.capacity = max_flows
+        self.idle = idle_timeout
+        self.active = active_timeout
+        self.sweep_interval = sweep_interval
+        self.keys = np.zeros(max_flows, dtype=KEY_DTYPE)
+        self.forward_a = np.zeros(max_flows, dtype=bool)
+        self.first = np.zeros(max_flows)
+        self.last = np.zeros(max_flows)
+        self.packets = np.zeros(max_flows, dtype=np.int64)
+        self.fwd_packets = np.zeros(max_flows, dtype=np.int64)
+        self.byte_sum = np.zeros(max_flows)
+        self.byte_sq = np.zeros(max_flows)
+        self.live = np.zeros(max_flows, dtype=bool)
+        # Key bytes -> slot, least recently seen first.
+        self._slots: "OrderedDict[bytes, int]" = OrderedDict()
+        self._free = list(range(max_flows - 1, -1, -1))
+        self.now = float("-inf")
+        self._swept = float("-inf")
+        self.counts = {"packets": 0, "flows": 0, **{reason: 0 for reason in REASONS}}
+        self._lock = threading.Lock()
+
+    def _take(self, slots, reasons) -> FlowRecords:
+        """Ends the flows in ``slots`` and returns them."""
+        slots = np.asarray(slots, dtype=np.intp)
+        records = FlowRecords(self.keys[slots], self.forward_a[slots], self.first[slots], self.last[slots],
+                              self.packets[slots], self.fwd_packets[slots], self.byte_sum[slots], self.byte_sq[slots],
+                              np.broadcast_to(np.asarray(reasons, dtype=np.uint8), len(slots)).copy())
+        self.live[slots] = False
+        for slot, key in zip(slots.tolist(), self.keys[slots].view(_KEY_VOID).tolist()):
+            del self._slots[key]
+            self._free.append(slot)
+        return records
+
+    def _expired(self) -> FlowRecords:
+        if self.now - self._swept < self.sweep_interval:
+            return FlowRecords.empty()
+        self._swept = self.now
+        idle = self.live & (self.now - self.last > self.idle)
+        active = self.live & (self.now - self.first > self.active) & ~idle
+        return FlowRecords.concat([self._take(np.flatnonzero(idle), _IDLE), self._take(np.flatnonzero(active), _ACTIVE)])
+
+    def ingest(self, packets: np.ndarray) -> FlowRecords:
+        """Adds a batch of packets (any order) and returns the flows that ended."""
+        with self._lock:
+            if not len(packets):
+                return FlowRecords.empty()
+            done = self._ingest(packets)
+            self.now = max(self.now, float(packets["ts"].max()))
+            out = FlowRecords.concat([done, self._expired()])
+            self.counts["packets"] += len(packets)
+            self._count(out)
+            return out
+
+    def flush(self) -> FlowRecords:
+        """Ends every live flow."""
+        with self._lock:
+            out = self._take(np.flatnonzero(self.live), _FLUSHED)
+            self._count(out)
+            return out
+
+    def _count(self, records: FlowRecords):
+        self.counts["flows"] += len(records)
+        for reason, n in zip(*np.unique(records.reasons, return_counts=True)):
+            self.counts[REASONS[reason]] += int(n)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"live": len(self._slots), "capacity": self.capacity, **self.counts}
+
+    def _ingest(self, p: np.ndarray) -> FlowRecords:
+        n = len(p)
+        a_is_src = _precedes(p["src_hi"], p["src_lo"], p["sport"], p["dst_hi"], p["dst_lo"], p["dport"])
+        keys = np.empty(n, dtype=KEY_DTYPE)
+        for field, src, dst in (("a_hi", "src_hi", "dst_hi"), ("a_lo", "src_lo", "dst_lo"), ("a_port", "sport", "dport")):
+            keys[field] = np.where(a_is_src, p[src], p[dst])
+            keys[field.replace("a_", "b_")] = np.where(a_is_src, p[dst], p[src])
+        keys["proto"] = p["proto"]
+        unique, inverse = np.unique(keys.view(_KEY_VOID), return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        # Packets grouped by flow key, in time order within a key.
+        order = np.lexsort((p["ts"], inverse))
+        key_of = inverse[order]
+        ts = p["ts"][order]
+        from_a = a_is_src[order]
+        length = p["length"][order].astype(np.float64)
+        flags = p["flags"][order]
+        key_start = np.r_[True, key_of[1:] != key_of[:-1]]
+
+        # Live flows of these keys; those that timed out before this batch end here.
+        ended = []
+        slot = np.full(len(unique), -1, dtype=np.intp)
+        get = self._slots.get
+        for j, key in enumerate(unique.tolist()):
+            s = get(key)
+            if s is not None:
+                slot[j] = s
+        known = np.flatnonzero(slot >= 0)
+        if len(known):
+            first_ts = ts[key_start][known]
+            s = slot[known]
+            idle = first_ts - self.last[s] > self.idle
+            active = (first_ts - self.first[s] > self.active) & ~idle
+            ended += [self._take(s[idle], _IDLE), self._take(s[active], _ACTIVE)]
+            slot[known[idle | active]] = -1
+
+        # Split each key's packets into flows: after a gap, after FIN/RST, and past the active timeout.
+        gap = np.r_[False, np.diff(ts) > self.idle]
+        closes = (flags & (FIN | RST)) != 0
+        boundary = key_start | gap | np.r_[False, closes[:-1]]
+        while True:
+            start = np.flatnonzero(boundary)
+            end = np.r_[start[1:], n] - 1
+            seg_key = key_of[start]
+            seg_slot = np.where(key_start[start], slot[seg_key], -1)
+            cont = seg_slot >= 0
+            safe = np.where(cont, seg_slot, 0)
+            begin = np.where(cont, self.first[safe], ts[start])
+            over = np.flatnonzero(ts[end] - begin > self.active)
+            if not len(over):
+                break
+            for s in over.tolist():
+                window = ts[start[s]:end[s] + 1]
+                boundary[start[s] + int(np.argmax(window - begin[s] > self.active))] = True
+
+        forward_a = np.where(cont, self.forward_a[safe], from_a[start])
+        seg_of = np.cumsum(boundary) - 1
+        counts = np.diff(np.r_[start, n])
+        fwd = np.add.reduceat((from_a == forward_a[seg_of]).astype(np.int64), start)
+        byte_sum = np.add.reduceat(length, start)
+        byte_sq = np.add.reduceat(length * length, start)
+        last = ts[end]
+        keys_s = unique.view(KEY_DTYPE)[seg_key]
+        # Continuing flows carry their counters from the table.
+        counts = counts + np.where(cont, self.packets[safe], 0)
+        fwd = fwd + np.where(cont, self.fwd_packets[safe], 0)
+        byte_sum = byte_sum + np.where(cont, self.byte_sum[safe], 0.0)
+        byte_sq = byte_sq + np.where(cont, self.byte_sq[safe], 0.0)
+        last = np.maximum(last, np.where(cont, self.last[safe], last))
+
+        last_of_key = np.r_[seg_key[1:] != seg_key[:-1], True]
+        closed = closes[end]
+        finished = closed | ~last_of_key
+        # A flow that is not its key's last ended because of what starts the next one.
+        next_gap = np.r_[gap[start[1:]], False]
+        reasons = np.where(closed, _FIN, np.where(next_gap, _IDLE, _ACTIVE)).astype(np.uint8)
+        f = np.flatnonzero(finished)
+        if len(f):
+            ended.append(FlowRecords(keys_s[f], forward_a[f], begin[f], last[f], counts[f], fwd[f], byte_sum[f],
+                                     byte_sq[f], reasons[f]))
+            done_slots = seg_slot[f][cont[f]]
+            self.live[done_slots] = False
+            for s_, key in zip(done_slots.tolist(), self.keys[done_slots].view(_KEY_VOID).tolist()):
+                del self._slots[key]
+                self._free.append(s_)
+
+        # Flows still open go (back) into the table.
+        open_ = np.flatnonzero(~finished)
+        if not len(open_):
+            return FlowRecords.concat(ended)
+        new = open_[~cont[open_]]
+        continuing = open_[cont[open_]]
+        for s in continuing.tolist():
+            self._slots.move_to_end(unique[seg_key[s]].tobytes())
+        need = len(new) - len(self._free)
+        if need > 0:
+            # Make room by ending the least recently seen flows this batch did not touch.
+            untouched = len(self._slots) - len(continuing)
+            lru = [self._slots[k] for k in islice(self._slots, min(need, untouched))]
+            ended.append(self._take(lru, _EVICTED))
+            # Flows that still do not fit end right away.
+            spill = new[len(self._free):]
+            new = new[:len(self._free)]
+            ended.append(FlowRecords(keys_s[spill], forward_a[spill], begin[spill], last[spill], counts[spill], fwd[spill],
+                                     byte_sum[spill], byte_sq[spill], np.full(len(spill), _EVICTED, dtype=np.uint8)))
+        for s in new.tolist():
+            s_ = self._free.pop()
+            seg_slot[s] = s_
+            self._slots[unique[seg_key[s]].tobytes()] = s_
+        stored = np.r_[continuing, new]
+        target = seg_slot[stored]
+        self.keys[target] = keys_s[stored]
+        self.forward_a[target] = forward_a[stored]
+        self.first[target] = begin[stored]
+        self.last[target] = last[stored]
+        self.packets[target] = counts[stored]
+        self.fwd_packets[target] = fwd[stored]
+        self.byte_sum[target] = byte_sum[stored]
+        self.byte_sq[target] = byte_sq[stored]
+        self.live[target] = True
+        return FlowRecords.concat(ended)
+
+
+##############################
+# Packet sources
+##############################
+_PCAP_MAGIC = {b"\xd4\xc3\xb2\xa1": ("<", 1e-6), b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+               b"\xa1\xb2\xc3\xd4": (">", 1e-6), b"\xa1\xb2\x3c\x4d": (">", 1e-9)}
+LINKTYPE_NULL, LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LINUX_SLL, LINKTYPE_LINUX_SLL2 = 0, 1, 101, 113, 276
+# Link header length before the IP header.
+_LINK_HEADER = {LINKTYPE_NULL: 4, LINKTYPE_ETHERNET: 14, LINKTYPE_RAW: 0, 12: 0, 14: 0, LINKTYPE_LINUX_SLL: 16,
+                LINKTYPE_LINUX_SLL2: 20}
+
+
+def _u16(buf: np.ndarray, at: np.ndarray) -> np.ndarray:
+    return (buf[at].astype(np.uint32) << 8) | buf[at + 1]
+
+
+def _u64(buf: np.ndarray, at: np.ndarray) -> np.ndarray:
+    octets = buf[at[:, None] + np.arange(8)].astype(np.uint64)
+    return np.bitwise_or.reduce(octets << np.arange(56, -1, -8, dtype=np.uint64), axis=1)
+
+
+# Bytes readable past a frame's end. The decoder reads fixed offsets for every frame and masks out
+# what the frame does not hold, so a frame at the end of the file is decoded from a padded copy.
+_PAD = 128
+
+
+def _decode(buf: np.ndarray, data: np.ndarray, caplen: np.ndarray, ts: np.ndarray, linktype: int) -> np.ndarray:
+    """Packets of the IPv4/IPv6 frames starting at ``data``; other frames are dropped."""
+    end = data + caplen
+    l3 = data + _LINK_HEADER[linktype]
+    ok = caplen >= _LINK_HEADER[linktype] + 20
+    if linktype == LINKTYPE_ETHERNET:
+        ethertype = _u16(buf, data + 12)
+        tagged = (ethertype == 0x8100) | (ethertype == 0x88A8)
+        l3 = l3 + np.where(tagged, 4, 0)
+        ethertype = np.where(tagged, _u16(buf, data + 16), ethertype)
+        ok &= ((ethertype == 0x0800) | (ethertype == 0x86DD)) & (l3 + 20 <= end)
+    version = buf[l3] >> 4
+    v4, v6 = ok & (version == 4), ok & (version == 6) & (l3 + 40 <= end)
+    keep = v4 | v6
+    l3, end, ts, v4 = l3[keep], end[keep], ts[keep], v4[keep]
+
+    p = np.zeros(len(l3), dtype=PACKET_DTYPE)
+    p["ts"] = ts
+    p["proto"] = np.where(v4, buf[l3 + 9], buf[l3 + 6])
+    p["length"] = np.where(v4, _u16(buf, l3 + 2), 40 + _u16(buf, l3 + 4))
+    p["src_hi"] = np.where(v4, 0, _u64(buf, l3 + 8))
+    p["src_lo"] = np.where(v4, _V4_MAPPED | ((_u16(buf, l3 + 12) << 16) | _u16(buf, l3 + 14)).astype(np.uint64),
+                           _u64(buf, l3 + 16))
+    p["dst_hi"] = np.where(v4, 0, _u64(buf, l3 + 24))
+    p["dst_lo"] = np.where(v4, _V4_MAPPED | ((_u16(buf, l3 + 16) << 16) | _u16(buf, l3 + 18)).astype(np.uint64),
+                           _u64(buf, l3 + 32))
+    # Ports from the first fragment of TCP/UDP only (IPv6 extension headers are not followed).
+    l4 = l3 + np.where(v4, (buf[l3] & 0x0F).astype(np.int64) * 4, 40)
+    first_fragment = ~v4 | ((_u16(buf, l3 + 6) & 0x1FFF) == 0)
+    proto = p["proto"]
+    ported = first_fragment & ((proto == 6) | (proto == 17)) & (l4 + 4 <= end)
+    p["sport"] = np.where(ported, _u16(buf, l4), 0)
+    p["dport"] = np.where(ported, _u16(buf, l4 + 2), 0)
+    p["flags"] = np.where(ported & (proto == 6) & (l4 + 14 <= end), buf[l4 + 13], 0)
+    return p
+
+
+def read_pcap(path: str, batch_size: int = 65536) -> Iterator[np.ndarray]:
+    """Packet batches from a libpcap file (not pcapng), memory-mapped and decoded a batch at a time."""
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if len(header) < 24:
+            return
+        if header[:4] == b"\x0a\x0d\x0d\x0a":
+            raise ValueError(f"{path} is pcapng; convert it with `editcap -F pcap`")
+        if header[:4] not in _PCAP_MAGIC:
+            raise ValueError(f"{path} is not a pcap file")
+        endian, resolution = _PCAP_MAGIC[header[:4]]
+        linktype = struct.unpack_from(endian + "I", header, 20)[0] & 0x0FFFFFFF
+        if linktype not in _LINK_HEADER:
+            raise ValueError(f"{path}: unsupported link type {linktype}")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    record = struct.Struct(endian + "IIII")
+    size = len(mm)
+    pos = 24
+    try:
+        while pos + 16 <= size:
+            ts = np.empty(batch_size)
+            data = np.empty(batch_size, dtype=np.int64)
+            caplen = np.empty(batch_size, dtype=np.int64)
+            count = 0
+            while count < batch_size and pos + 16 <= size:
+                sec, frac, incl, _ = record.unpack_from(mm, pos)
+                ts[count] = sec + frac * resolution
+                data[count] = pos + 16
+                caplen[count] = min(incl, size - pos - 16)
+                count += 1
+                pos += 16 + incl
+            ts, data, caplen = ts[:count], data[:count], caplen[:count]
+            buf = np.frombuffer(mm, dtype=np.uint8)
+            if pos + _PAD <= size:
+                yield _decode(buf, data, caplen, ts, linktype)
+            else:
+                base = int(data[0])
+                padded = np.zeros(size - base + _PAD, dtype=np.uint8)
+                padded[:size - base] = buf[base:]
+                yield _decode(padded, data - base, caplen, ts, linktype)
+            del buf
+    finally:
+        mm.close()
+
+
+def read_ndjson(stream: IO[str], batch_size: int = 4096) -> Iterator[np.ndarray]:
+    """Packet batches from NDJSON packet events (see ``packets_from_events``); bad lines are skipped."""
+    events = []
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue
+        if len(events) >= batch_size:
+            yield _valid_packets(events)
+            events = []
+    if events:
+        yield _valid_packets(events)
+
+
+def _valid_packets(events: List[Dict]) -> np.ndarray:
+    try:
+        return packets_from_events(events)
+    except (KeyError, TypeError, ValueError, OverflowError):
+        good = []
+        for e in events:
+            try:
+                packets_from_events([e])
+                good.append(e)
+            except (KeyError, TypeError, ValueError, OverflowError):
+                pass
+        return packets_from_events(good)
+
+
+##############################
+# Command line
+##############################
+def _score(app, records: FlowRecords, models: List[str]) -> List[Dict]:
+    flows = records.to_dicts()
+    features = records.features
+    for model in models:
+        for flow, verdict in zip(flows, app.bot_predictions(features, model)):
+            flow[model] = {k: verdict[k] for k in ("prediction", "prediction_label", "confidence")}
+    return flows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate packets into flows and score them with the bot models")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pcap", help="libpcap capture file")
+    source.add_argument("--ndjson", help="NDJSON packet events ('-' for stdin)")
+    parser.add_argument("--output", default="-", help="NDJSON output of the finished flows (default: stdout)")
+    parser.add_argument("--models", nargs="*", choices=["rf", "iso"], default=["rf"], help="bot models to score with")
+    parser.add_argument("--idle-timeout", type=float, default=120.0)
+    parser.add_argument("--active-timeout", type=float, default=120.0)
+    parser.add_argument("--max-flows", type=int, default=1_000_000, help="live flows held at once")
+    parser.add_argument("--batch-size", type=int, default=65536, help="packets per batch")
+    parser.add_argument("--score-batch", type=int, default=4096, help="finished flows per model call")
+    args = parser.parse_args()
+
+    app = None
+    if args.models:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import app
+
+        app.model_registry.load_now("bot")
+        missing = [m for m in args.models if app.models_store[m]["model"] is None]
+        if missing:
+            sys.exit(f"bot model(s) {missing} not loaded; run from the FastApi folder with the artifacts in place")
+
+    meter = FlowMeter(args.max_flows, args.idle_timeout, args.active_timeout)
+    if args.pcap:
+        batches = read_pcap(args.pcap, args.batch_size)
+    else:
+        batches = read_ndjson(sys.stdin if args.ndjson == "-" else open(args.ndjson), args.batch_size)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    pending: List[FlowRecords] = []
+    scoring = 0.0
+
+    def emit(final: bool = False):
+        nonlocal pending, scoring
+        records = FlowRecords.concat(pending)
+        if not len(records) or (len(records) < args.score_batch and not final):
+            return
+        pending = []
+        start = time.perf_counter()
+        flows = _score(app, records, args.models) if app is not None else records.to_dicts()
+        scoring += time.perf_counter() - start
+        out.write("".join(json.dumps(flow) + "\n" for flow in flows))
+
+    start = time.perf_counter()
+    for batch in batches:
+        pending.append(meter.ingest(batch))
+        emit()
+    pending.append(meter.flush())
+    emit(final=True)
+    elapsed = time.perf_counter() - start
+    if out is not sys.stdout:
+        out.close()
+
+    stats = meter.stats()
+    print(f"{stats['packets']} packets -> {stats['flows']} flows in {elapsed:.2f}s "
+          f"({stats['packets'] / max(elapsed - scoring, 1e-9):,.0f} packets/s aggregating, {scoring:.2f}s scoring); "
+          + ", ".join(f"{r}: {stats[r]}" for r in REASONS), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Flat-array evaluation of the bot RandomForest and IsolationForest.
+
+sklearn walks a forest one tree at a time, so scoring a single flow pays
+Python and joblib overhead for each of the 100 trees. ``compile_forest``
+copies every tree's nodes into one set of contiguous arrays, and
+``CompiledForest`` walks all trees for all rows together, one tree level per
+numpy step.
+
+The outputs are bit-for-bit those of the sklearn model they were compiled
+from:
+
+- inputs are cast to float32 and compared against the float64 thresholds,
+  with NaN following each node's missing-value direction, as in sklearn's
+  tree ``apply``;
+- leaf values are the same numbers sklearn adds up (class fractions for
+  ``predict_proba``, path length plus the average path length of the leaf's
+  samples minus one for the isolation depth), accumulated tree by tree in
+  estimator order;
+- ``decision_function`` of an IsolationForest finishes with the same
+  normalisation and ``offset_``.
+"""
+from typing import Optional
+
+import numpy as np
+
+
+# Levels walked between dropping the (row, tree) pairs that reached a leaf.
+_PRUNE_EVERY = 4
+
+
+class CompiledForest:
+    """All nodes of a forest in flat arrays, indexed by global node id.
+
+    Leaves point to themselves, so a row that reached its leaf stays there
+    while deeper trees finish. ``children`` interleaves left and right: node
+    ``n`` goes to ``children[2 * n]`` when its test passes, else to
+    ``children[2 * n + 1]``.
+    """
+
+    def __init__(self, roots: np.ndarray, feature: np.ndarray, threshold: np.ndarray, children: np.ndarray,
+                 missing_left: Optional[np.ndarray], values: np.ndarray, depth: int, n_features: int):
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_left = missing_left
+        self.values = values
+        self.depth = depth
+        self.n_features = n_features
+        self.n_trees = len(roots)
+        self.is_leaf = children[0::2] == np.arange(len(feature))
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.roots, self.feature, self.threshold, self.children, self.missing_left, self.values, self.is_leaf)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """Global leaf ids, shape ``[rows, trees]``."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"expected a matrix with {self.n_features} columns, got shape {X.shape}")
+        n_rows = len(X)
+        # float32 values widened once, so each level compares float64 to float64 as sklearn does.
+        values = X.astype(np.float64).ravel()
+        nan_rows = self.missing_left is not None and np.isnan(values).any()
+        feature, threshold, children = self.feature, self.threshold, self.children
+
+        # One entry per (row, tree) pair still walking; finished pairs are dropped every few levels.
+        node = np.tile(self.roots, n_rows)
+        base = np.repeat(np.arange(n_rows, dtype=np.intp) * self.n_features, self.n_trees)
+        out = np.empty_like(node)
+        active = None
+        for level in range(self.depth):
+            x = values.take(base + feature.take(node))
+            go_right = ~(x <= threshold.take(node))
+            if nan_rows:
+                go_right &= ~(np.isnan(x) & self.missing_left.take(node))
+            node = children.take(2 * node + go_right)
+            if level % _PRUNE_EVERY == _PRUNE_EVERY - 1 and level < self.depth - 1:
+                walking = ~self.is_leaf.take(node)
+                if active is None:
+                    out[:] = node
+                    active = np.flatnonzero(walking)
+                else:
+                    out[active] = node
+                    active = active[walking]
+                node, base = node[walking], base[walking]
+        if active is None:
+            out[:] = node
+        else:
+            out[active] = node
+        return out.reshape(n_rows, self.n_trees)
+
+    def accumulate(self, X: np.ndarray) -> np.ndarray:
+        """Sum of the leaf values over the trees, added in estimator order like sklearn does."""
+        values = self.values[self.leaves(X)]
+        # cumsum adds sequentially, unlike sum's pairwise reduction.
+        return np.cumsum(values, axis=1)[:, -1]
+
+
+class CompiledClassifier(CompiledForest):
+    def __init__(self, *args, classes: np.ndarray, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.classes_ = classes
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        proba = self.accumulate(X)
+        proba /= self.n_trees
+        return proba
+
+
+class CompiledIsolationForest(CompiledForest):
+    def __init__(self, *args, denominator: float, offset: float, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.denominator = denominator
+        self.offset_ = offset
+
+    def score_samples(self, X: np.ndarray) -> np.ndarray:
+        depths = self.accumulate(X)
+        denominator = self.denominator
+        # For a single training sample, denominator and depth are 0 and the score is 1.
+        return -(2 ** (-np.divide(depths, denominator, out=np.ones_like(depths), where=denominator != 0)))
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        return self.score_samples(X) - self.offset_
+
+
+def _flatten(trees, features_per_tree, n_features: int, leaf_values):
+    """Concatenates the trees' node arrays, remapping child ids and (subsampled) feature ids to global ones."""
+    sizes = [t.node_count for t in trees]
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+    total = int(sum(sizes))
+
+    feature = np.zeros(total, dtype=np.intp)
+    threshold = np.zeros(total, dtype=np.float64)
+    children = np.empty(2 * total, dtype=np.intp)
+    has_missing = all(hasattr(t, "missing_go_to_left") for t in trees)
+    missing_left = np.zeros(total, dtype=bool) if has_missing else None
+    values = []
+
+    for tree, features, offset, values_of in zip(trees, features_per_tree, offsets, leaf_values):
+        n = tree.node_count
+        span = slice(offset, offset + n)
+        own = np.arange(offset, offset + n)
+        leaf = tree.children_left == -1
+        tree_features = np.where(leaf, 0, tree.feature)
+        feature[span] = features[tree_features] if features is not None else tree_features
+        threshold[span] = np.where(leaf, 0.0, tree.threshold)
+        children[2 * offset:2 * (offset + n):2] = np.where(leaf, own, tree.children_left + offset)
+        children[2 * offset + 1:2 * (offset + n):2] = np.where(leaf, own, tree.children_right + offset)
+        if has_missing:
+            missing_left[span] = tree.missing_go_to_left.astype(bool)
+        values.append(values_of(tree))
+
+    depth = max(t.max_depth for t in trees)
+    return offsets, feature, threshold, children, missing_left, np.concatenate(values), depth, n_features
+
+
+def _class_fractions(n_classes: int, normalise: bool):
+    def values_of(tree) -> np.ndarray:
+        proba = np.array(tree.value[:, 0, :n_classes], dtype=np.float64)
+        if normalise:
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+        return proba
+
+    return values_of
+
+
+def compile_forest(model) -> Optional[CompiledForest]:
+    """A compiled copy of a fitted ``RandomForestClassifier`` or ``IsolationForest``, or None for anything else."""
+    import sklearn
+    from sklearn.ensemble import IsolationForest, RandomForestClassifier
+    from sklearn.ensemble._iforest import _average_path_length
+
+    if isinstance(model, RandomForestClassifier):
+        if model.n_outputs_ != 1:
+            return None
+        # Before 1.4, classifier leaves held weighted class counts and predict_proba normalised them per row.
+        normalise = tuple(int(p) for p in sklearn.__version__.split(".")[:2]) < (1, 4)
+        trees = [e.tree_ for e in model.estimators_]
+        arrays = _flatten(trees, [None] * len(trees), model.n_features_in_,
+                          [_class_fractions(int(model.n_classes_), normalise)] * len(trees))
+        return CompiledClassifier(*arrays, classes=model.classes_)
+
+    if isinstance(model, IsolationForest):
+        trees = [e.tree_ for e in model.estimators_]
+        subsampled = model._max_features != model.n_features_in_
+        features = [np.asarray(f) if subsampled else None for f in model.estimators_features_]
+        # The depth sklearn adds for a row ending in each node.
+        path = [lambda tree, d=d, a=a: d + a - 1.0
+                for d, a in zip(model._decision_path_lengths, model._average_path_length_per_tree)]
+        arrays = _flatten(trees, features, model.n_features_in_, path)
+        denominator = len(model.estimators_) * _average_path_length([model._max_samples])
+        return CompiledIsolationForest(*arrays, denominator=denominator, offset=model.offset_)
+    return None
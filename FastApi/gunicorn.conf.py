@@ -0,0 +1,45 @@
+"""
+Multi-process serving:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master (``preload_app``), which also loads
+the fork-safe models (``PRELOAD_MODELS``, by default the bot forests) before
+forking, so every worker shares those pages copy-on-write. The forests are
+memory-mapped from their pickles as well (``BOT_MMAP_MODE``). TensorFlow is
+not fork-safe, so each worker loads the Keras models itself; TFLite exports
+are memory-mapped and shared through the page cache.
+
+Each worker gets ``cores // workers`` inference threads, and writes its model
+status to a shared directory so ``/ready`` answers for all workers.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or multiprocessing.cpu_count()
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Read by app.py, so these must be set before the app is imported.
+os.environ.setdefault("INFERENCE_THREADS", str(max(1, multiprocessing.cpu_count() // workers)))
+os.environ.setdefault("WORKER_STATE_DIR", tempfile.mkdtemp(prefix="fastapi-workers-"))
+os.environ["GUNICORN_WORKERS"] = str(workers)
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before the first fork.
+    import app
+    app.preload_models()
+
+
+def child_exit(server, worker):
+    import worker_status
+    worker_status.remove(worker.pid)
+
+
+def on_exit(server):
+    shutil.rmtree(os.environ["WORKER_STATE_DIR"], ignore_errors=True)
@@ -0,0 +1,313 @@
+"""
+Low-overhead inference for the Keras models.
+
+``model.predict`` builds a data adapter, a callback list and a step loop on
+every call, which dominates latency for the small batches we serve.
+``CompiledModel`` traces the model once into a ``tf.function`` with a fixed
+input signature and calls the concrete graph directly.
+
+``TFLiteModel`` and ``OnnxModel`` run the same models from the files written
+by ``export_models.py``, or their quantized variants from
+``quantize_models.py``. All three take an int matrix of shape
+``[batch, seq_len]`` and return a numpy array, so callers can switch between
+them with ``load_inference_model``.
+
+A model can also be traced at a few shorter sequence lengths
+(``bucket_lengths``). ``predict_bucketed`` then pads each row only up to the
+smallest of those lengths that fits it, instead of the full ``seq_len``.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from fast_tokenizer import pad_post
+
+logger = logging.getLogger("uvicorn.error")
+
+BACKENDS = ("keras", "tflite", "onnx")
+# Quantized variants written by quantize_models.py, for the tflite and onnx backends.
+QUANTIZATIONS = ("dynamic", "int8")
+
+# Fixed per-time-step cost of a forward pass, in rows. Measured on the XSS
+# BiLSTM on CPU: a pass over L steps costs roughly L * (40 + batch_rows).
+BUCKET_STEP_OVERHEAD = 40.0
+
+
+def _model_seq_len(model) -> Optional[int]:
+    try:
+        shape = model.input_shape
+    except Exception:
+        return None
+    if isinstance(shape, list):
+        shape = shape[0]
+    return shape[1] if shape is not None and len(shape) > 1 else None
+
+
+def exported_path(keras_path: str, backend: str, quantization: Optional[str] = None) -> str:
+    """Where ``export_models.py`` writes the ``backend`` version of a Keras model
+    (``<name>.<backend>``), and ``quantize_models.py`` its quantized variants
+    (``<name>.<quantization>.<backend>``)."""
+    base = os.path.splitext(keras_path)[0]
+    return f"{base}.{quantization}.{backend}" if quantization else f"{base}.{backend}"
+
+
+class CompiledModel:
+    """Callable wrapper running ``model(x, training=False)`` as a traced graph.
+
+    The batch dimension is left open so any batch size reuses the same trace.
+    ``seq_len`` defaults to the model's own input length. One graph is traced
+    per entry of ``lengths``: ``seq_len`` plus any shorter ``bucket_lengths``.
+    """
+
+    backend = "keras"
+    quantization = None
+
+    def __init__(self, model, seq_len: Optional[int] = None, dtype=np.int32, path: Optional[str] = None,
+                 bucket_lengths: Sequence[int] = ()):
+        tf = import_tensorflow()
+
+        self.model = model
+        self.path = path
+        self.seq_len = seq_len if seq_len is not None else _model_seq_len(model)
+        self.dtype = tf.as_dtype(dtype)
+        if self.seq_len is None:
+            self.lengths = (None,)
+        else:
+            self.lengths = tuple(sorted({int(n) for n in bucket_lengths if 0 < int(n) < self.seq_len} | {self.seq_len}))
+
+        @tf.function
+        def serve(x):
+            return model(x, training=False)
+
+        self._fns = {n: serve.get_concrete_function(tf.TensorSpec(shape=[None, n], dtype=self.dtype)) for n in self.lengths}
+        self._fn = self._fns[self.seq_len]
+        self._convert = tf.convert_to_tensor
+
+    def __call__(self, X) -> np.ndarray:
+        X = self._convert(X, dtype=self.dtype)
+        fn = self._fns.get(X.shape[1], self._fn)
+        return fn(X).numpy()
+
+    def warmup(self):
+        for n in self.lengths:
+            self(np.zeros((1, n or 1), dtype=self.dtype.as_numpy_dtype))
+        return self
+
+
+_tf_lock = threading.Lock()
+_tf_threads_configured = False
+
+
+def import_tensorflow(num_threads: Optional[int] = None):
+    """Imports TensorFlow once per process and optionally caps its thread pools.
+
+    Models load on several threads, and importing TensorFlow from two of them
+    at once can deadlock, so the first import is serialized here. The thread
+    limit only applies if it is set before TensorFlow runs anything; the first
+    limit given wins. Inter-op parallelism stays at 2 so both directions of a
+    bidirectional layer can still run side by side.
+    """
+    global _tf_threads_configured
+    with _tf_lock:
+        import tensorflow as tf
+
+        if num_threads and not _tf_threads_configured:
+            _tf_threads_configured = True
+            try:
+                tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+                tf.config.threading.set_inter_op_parallelism_threads(min(2, num_threads))
+            except RuntimeError as e:
+                logger.warning(f"TensorFlow already initialized; thread limit of {num_threads} not applied: {e}")
+    return tf
+
+
+def _tflite_interpreter_class():
+    # Prefer the standalone runtimes, which do not pull in TensorFlow.
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    return import_tensorflow().lite.Interpreter
+
+
+class TFLiteModel:
+    """Runs a ``.tflite`` export. The interpreter is not thread-safe, so calls are serialized.
+
+    The interpreter memory-maps the model file, so worker processes serving
+    the same export share its weights through the page cache.
+    """
+
+    backend = "tflite"
+    quantization = None
+
+    def __init__(self, path: str, num_threads: Optional[int] = None):
+        self.path = path
+        self._interpreter = _tflite_interpreter_class()(model_path=path, num_threads=num_threads)
+        inp = self._interpreter.get_input_details()[0]
+        self._input_index = inp["index"]
+        self._output_index = self._interpreter.get_output_details()[0]["index"]
+        self.dtype = inp["dtype"]
+        self.seq_len = int(inp.get("shape_signature", inp["shape"])[1])
+        self.lengths = (self.seq_len,)
+        self._batch = None
+        self._lock = threading.Lock()
+
+    def __call__(self, X) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=self.dtype)
+        with self._lock:
+            # Reallocating is only needed when the batch size changes.
+            if X.shape[0] != self._batch:
+                self._interpreter.resize_tensor_input(self._input_index, list(X.shape))
+                self._interpreter.allocate_tensors()
+                self._batch = X.shape[0]
+            self._interpreter.set_tensor(self._input_index, X)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output_index).copy()
+
+    def warmup(self):
+        self(np.zeros((1, self.seq_len), dtype=self.dtype))
+        return self
+
+
+_ONNX_DTYPES = {"tensor(int32)": np.int32, "tensor(int64)": np.int64, "tensor(float)": np.float32}
+
+
+class OnnxModel:
+    """Runs an ``.onnx`` export on the ONNX Runtime CPU provider."""
+
+    backend = "onnx"
+    quantization = None
+
+    def __init__(self, path: str, num_threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        self.path = path
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self._session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        inp = self._session.get_inputs()[0]
+        self._input_name = inp.name
+        self.dtype = _ONNX_DTYPES.get(inp.type, np.int32)
+        self.seq_len = inp.shape[1] if isinstance(inp.shape[1], int) else None
+        self.lengths = (self.seq_len,)
+
+    def __call__(self, X) -> np.ndarray:
+        return self._session.run(None, {self._input_name: np.asarray(X, dtype=self.dtype)})[0]
+
+    def warmup(self):
+        self(np.zeros((1, self.seq_len or 1), dtype=self.dtype))
+        return self
+
+
+def load_inference_model(keras_path: str, backend: str = "keras", seq_len: Optional[int] = None,
+                         num_threads: Optional[int] = None, bucket_lengths: Sequence[int] = (),
+                         quantization: Optional[str] = None):
+    """Loads ``keras_path`` on the requested backend and warms it up.
+
+    The TFLite and ONNX backends read the exported file next to the Keras
+    model, or its ``quantization`` variant when one is given. If that file or
+    its runtime is missing, the Keras model is served instead and a warning
+    is logged. Exports are fixed to ``seq_len``, so ``bucket_lengths`` only
+    applies to the Keras backend. ``num_threads`` caps the runtime's intra-op
+    threads.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; expected one of {BACKENDS}")
+    if quantization is not None and quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}; expected one of {QUANTIZATIONS}")
+    if quantization is not None and backend == "keras":
+        logger.warning(f"Quantized variants need the tflite or onnx backend; serving {keras_path} unquantized with Keras")
+
+    if backend != "keras":
+        path = exported_path(keras_path, backend, quantization)
+        tool = "quantize_models.py" if quantization else "export_models.py"
+        if not os.path.exists(path):
+            logger.warning(f"{path} not found (run {tool}); serving {keras_path} with Keras")
+        else:
+            try:
+                runner = TFLiteModel(path, num_threads) if backend == "tflite" else OnnxModel(path, num_threads)
+                if seq_len is not None and runner.seq_len not in (None, seq_len):
+                    raise ValueError(f"exported seq_len {runner.seq_len} does not match {seq_len}")
+                if bucket_lengths:
+                    logger.warning(f"Length buckets are not supported by the {backend} backend; padding {path} to {runner.seq_len}")
+                runner.quantization = quantization
+                return runner.warmup()
+            except Exception as e:
+                logger.warning(f"Failed to load {path} with {backend}: {e}; serving {keras_path} with Keras")
+
+    tf = import_tensorflow(num_threads)
+    return CompiledModel(tf.keras.models.load_model(keras_path), seq_len=seq_len, path=keras_path,
+                         bucket_lengths=bucket_lengths).warmup()
+
+
+def _plan_buckets(lengths, counts, step_overhead: float):
+    """Splits the non-empty buckets into contiguous groups, each padded to its longest bucket.
+
+    The cost of one forward pass is modelled as ``length * (step_overhead + rows)``:
+    the recurrent layers walk every time step in sequence, and each step has a
+    fixed cost on top of the per-row work. Returns ``[(pad_length, bucket_ids)]``.
+    """
+    used = [b for b in range(len(lengths)) if counts[b]]
+    best = [0.0] + [float("inf")] * len(used)
+    cut = [0] * (len(used) + 1)
+    for j in range(1, len(used) + 1):
+        rows = 0
+        for i in range(j - 1, -1, -1):
+            rows += counts[used[i]]
+            cost = best[i] + lengths[used[j - 1]] * (step_overhead + rows)
+            if cost < best[j]:
+                best[j], cut[j] = cost, i
+    groups, j = [], len(used)
+    while j > 0:
+        i = cut[j]
+        groups.append((lengths[used[j - 1]], used[i:j]))
+        j = i
+    return groups[::-1]
+
+
+def _timed_forward(model, sequences, pad_length: int, timings: Optional[Dict[str, float]]) -> np.ndarray:
+    if timings is None:
+        return model(pad_post(sequences, pad_length)).reshape(-1)
+    start = time.perf_counter()
+    X = pad_post(sequences, pad_length)
+    padded = time.perf_counter()
+    out = model(X).reshape(-1)
+    timings["pad"] = timings.get("pad", 0.0) + padded - start
+    timings["forward"] = timings.get("forward", 0.0) + time.perf_counter() - padded
+    return out
+
+
+def predict_bucketed(model, sequences, step_overhead: float = BUCKET_STEP_OVERHEAD,
+                     timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """Scores token sequences, one score per row, in input order.
+
+    Each row is assigned the smallest of ``model.lengths`` that holds it. Buckets
+    are then grouped so that short rows run at a short padded length when that
+    is cheaper than one pass at the longest length (see ``_plan_buckets``).
+    Rows longer than the largest length are truncated, as with plain padding.
+    When ``timings`` is given, seconds spent padding and in the model are added
+    to its ``"pad"`` and ``"forward"`` keys.
+    """
+    lengths = model.lengths
+    if len(lengths) == 1:
+        return _timed_forward(model, sequences, lengths[0], timings)
+
+    sizes = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    buckets = np.minimum(np.searchsorted(lengths, sizes), len(lengths) - 1)
+    counts = np.bincount(buckets, minlength=len(lengths))
+    scores = np.empty(len(sequences), dtype=np.float32)
+    for pad_length, group in _plan_buckets(lengths, counts, step_overhead):
+        rows = np.flatnonzero(np.isin(buckets, group))
+        scores[rows] = _timed_forward(model, [sequences[i] for i in rows], pad_length, timings)
+    return scores
@@ -0,0 +1,154 @@
+"""
+Background model loading with per-model readiness.
+
+Each model registers a loader. Eager models are loaded concurrently on a
+small thread pool when the app starts, so routes that do not need them can
+serve right away. Lazy models are loaded by the first request that needs
+them. Every model records its state and how long its load took.
+
+Readiness is gated by the ``required`` models when they are given, and
+otherwise by every eager model whose artifacts are present: a model that was
+not shipped cannot become ready by waiting, so it does not hold the app back.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger("uvicorn.error")
+
+PENDING = "pending"          # lazy model not requested yet
+LOADING = "loading"
+READY = "ready"
+UNAVAILABLE = "unavailable"  # loader finished but artifacts were missing
+FAILED = "failed"            # loader raised
+
+
+class ModelSlot:
+    def __init__(self, name: str, load_fn: Callable[[], None], available_fn: Callable[[], bool], lazy: bool):
+        self.name = name
+        self.load_fn = load_fn
+        self.available_fn = available_fn
+        self.lazy = lazy
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.done = threading.Event()
+
+    def as_dict(self) -> Dict:
+        return {
+            "state": self.state,
+            "lazy": self.lazy,
+            "load_seconds": None if self.load_seconds is None else round(self.load_seconds, 3),
+            "loaded_at": self.loaded_at,
+            "error": self.error,
+        }
+
+
+class ModelRegistry:
+    def __init__(self, max_workers: int = 4, on_update: Optional[Callable[[], None]] = None,
+                 required: Optional[Iterable[str]] = None):
+        self.max_workers = max_workers
+        self.on_update = on_update
+        self.required = None if required is None else frozenset(required)
+        self._slots: Dict[str, ModelSlot] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def register(self, name: str, load_fn: Callable[[], None], available_fn: Callable[[], bool], lazy: bool = False):
+        self._slots[name] = ModelSlot(name, load_fn, available_fn, lazy)
+
+    def start(self):
+        """Schedules every eager or required model; returns without waiting for them."""
+        unknown = sorted((self.required or frozenset()) - self._slots.keys())
+        if unknown:
+            logger.warning(f"Required models {unknown} are not registered")
+        for slot in self._slots.values():
+            if self._gates(slot) or not slot.lazy:
+                self._schedule(slot)
+
+    def load_now(self, name: str):
+        """Loads ``name`` on the calling thread, e.g. in a server's master before it forks workers."""
+        slot = self._slots[name]
+        with self._lock:
+            if slot.state != PENDING:
+                return
+            slot.state = LOADING
+        self._load(slot)
+
+    def _schedule(self, slot: ModelSlot):
+        with self._lock:
+            if slot.state != PENDING:
+                return
+            slot.state = LOADING
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="model-load")
+            self._executor.submit(self._load, slot)
+
+    def _load(self, slot: ModelSlot):
+        start = time.perf_counter()
+        try:
+            slot.load_fn()
+            if slot.available_fn():
+                slot.state = READY
+            else:
+                slot.state = UNAVAILABLE
+                slot.error = "model artifacts not found"
+        except FileNotFoundError as e:
+            slot.state = UNAVAILABLE
+            slot.error = str(e)
+        except Exception as e:
+            slot.state = FAILED
+            slot.error = str(e)
+            logger.error(f"Loading {slot.name} model failed: {e}")
+        finally:
+            slot.load_seconds = time.perf_counter() - start
+            slot.loaded_at = time.time()
+            slot.done.set()
+        logger.info(f"{slot.name} model {slot.state} after {slot.load_seconds:.2f}s")
+        if self.on_update is not None:
+            try:
+                self.on_update()
+            except Exception as e:
+                logger.warning(f"Model status update hook failed: {e}")
+
+    def wait(self, name: str, timeout: Optional[float] = None) -> bool:
+        """Starts ``name`` if it is lazy and not loaded yet, then waits for its load to finish."""
+        slot = self._slots[name]
+        self._schedule(slot)
+        return slot.done.wait(timeout)
+
+    def wait_all(self, timeout: Optional[float] = None) -> bool:
+        """Waits for every eager or required model."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for slot in self._slots.values():
+            if slot.lazy and not self._gates(slot):
+                continue
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not slot.done.wait(remaining):
+                return False
+        return True
+
+    def _gates(self, slot: ModelSlot) -> bool:
+        """Whether ``slot`` must be ready for the app to be."""
+        if self.required is not None:
+            return slot.name in self.required
+        return not slot.lazy and slot.state != UNAVAILABLE
+
+    def ready(self) -> bool:
+        """True once every model that gates readiness has loaded and can serve."""
+        return all(slot.state == READY for slot in self._slots.values() if self._gates(slot))
+
+    def not_ready(self) -> Dict[str, Dict]:
+        """State and error of each model that gates readiness and cannot serve yet."""
+        return {name: {"state": slot.state, "error": slot.error}
+                for name, slot in self._slots.items() if self._gates(slot) and slot.state != READY}
+
+    def status(self) -> Dict[str, Dict]:
+        return {name: slot.as_dict() for name, slot in self._slots.items()}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
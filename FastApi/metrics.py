@@ -0,0 +1,241 @@
+"""
+Prometheus text-format metrics without a client library.
+
+Counters and histograms are plain Python numbers behind one lock per metric.
+Recording a value is a dict lookup, a ``bisect`` and two additions, cheap
+enough to leave on in production. Gauges read their values from callbacks
+when a snapshot is taken, so queue depths, cache counters and model states
+cost nothing between scrapes.
+
+A ``snapshot()`` is a JSON-able dict. Snapshots from several worker processes
+are combined with ``merge`` (every sample is summed) and rendered with
+``render``.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+# Joins label values into one key of a JSON snapshot.
+_SEP = "\x1f"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _header(self) -> Dict:
+        return {"type": self.kind, "help": self.help, "labelnames": list(self.labelnames)}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            samples = {_SEP.join(k): v for k, v in self._values.items()}
+        return {**self._header(), "samples": samples}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: one count per bucket, one for +Inf, then the sum.
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        """``with histogram.time("xss", "pad"): ...`` observes the block's duration."""
+        return _Timer(self, labels)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            samples = {_SEP.join(k): list(v) for k, v in self._values.items()}
+        return {**self._header(), "buckets": list(self.buckets), "samples": samples}
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class CallbackMetric(_Metric):
+    """A gauge or counter whose samples come from ``fn`` at snapshot time.
+
+    ``fn`` returns ``{label_values_tuple: value}``.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], fn: Callable[[], Dict[Tuple[str, ...], float]],
+                 kind: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def snapshot(self) -> Dict:
+        samples = {_SEP.join(k): float(v) for k, v in self.fn().items()}
+        return {**self._header(), "samples": samples}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge_callback(self, name: str, help: str, labelnames: Sequence[str], fn, kind: str = "gauge") -> CallbackMetric:
+        return self._add(CallbackMetric(name, help, labelnames, fn, kind))
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+
+def merge(snapshots: Iterable[Dict[str, Dict]]) -> Dict[str, Dict]:
+    """Sums matching samples across snapshots (counters, histogram buckets and gauges alike)."""
+    merged: Dict[str, Dict] = {}
+    for snap in snapshots:
+        for name, metric in snap.items():
+            target = merged.get(name)
+            if target is None:
+                merged[name] = {**metric, "samples": {k: (list(v) if isinstance(v, list) else v)
+                                                      for k, v in metric["samples"].items()}}
+                continue
+            samples = target["samples"]
+            for key, value in metric["samples"].items():
+                old = samples.get(key)
+                if old is None:
+                    samples[key] = list(value) if isinstance(value, list) else value
+                elif isinstance(old, list):
+                    samples[key] = [a + b for a, b in zip(old, value)]
+                else:
+                    samples[key] = old + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], key: str, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, key.split(_SEP))) if names else []
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(snapshot: Dict[str, Dict]) -> str:
+    """Prometheus text exposition format 0.0.4."""
+    lines = []
+    for name, metric in snapshot.items():
+        names = metric["labelnames"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key, value in sorted(metric["samples"].items()):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_labels(names, key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + [float("inf")], value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(names, key, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, key)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_labels(names, key)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# Router of the request being served, set by ``MetricsMiddleware``.
+current_router: ContextVar[str] = ContextVar("current_router", default="other")
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware counting requests and timing them per router.
+
+    The router is the first path segment when it is one of ``routers``,
+    otherwise ``"other"``.
+    """
+
+    def __init__(self, app, requests: Counter, latency: Histogram, routers: Iterable[str]):
+        self.app = app
+        self.requests = requests
+        self.latency = latency
+        self.routers = frozenset(routers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        segment = scope["path"].split("/", 2)[1] if scope["path"].count("/") else ""
+        router = segment if segment in self.routers else "other"
+        token = current_router.set(router)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.latency.observe(time.perf_counter() - start, router)
+            self.requests.inc(router, str(status))
+            current_router.reset(token)
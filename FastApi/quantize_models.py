@@ -0,0 +1,288 @@
+"""
+Post-training quantization of the BiLSTM, XSS and behaviour models.
+
+For each model this builds quantized variants on the TFLite and ONNX
+backends and compares them with the float model on held-out data:
+
+- ``dynamic``: weights stored as int8, activations stay float
+  (TFLite ``Optimize.DEFAULT`` / onnxruntime ``quantize_dynamic``);
+- ``int8``: weights and activations int8, with activation ranges calibrated
+  on representative inputs (TFLite representative dataset / onnxruntime
+  ``quantize_static``, QDQ format). Ops without an int8 kernel stay float.
+
+The data is read and split the way the training scripts do it
+(``BiLstm/main.py``, ``XSS/train_xss_char_bilstm.py``,
+``User_Behaviour/train_behavior_lstm.py``): tokenized with the app's own
+tokenizers, padded the way the app pads, and split 80/20 stratified with
+``random_state=42``. Calibration samples come from the training part and the
+report from the held-out part. Without the dataset a seeded synthetic corpus
+(``benchmarks/corpus.py``) is used; its labels are only a rough guide, so
+judge those runs by agreement with the float model.
+
+A variant is written next to the ``.h5`` file as
+``<name>.<variant>.<backend>`` when it agrees with the float model on at
+least ``--min-agreement`` of the held-out verdicts. Serve it with
+``BIL_QUANT``/``XSS_QUANT``/``BEH_QUANT`` set to the variant and the
+matching ``*_BACKEND``. Run from the FastApi folder:
+
+    python quantize_models.py --models xss behaviour --report quantization_report.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "benchmarks"))
+
+import corpus  # noqa: E402
+import tensorflow as tf  # noqa: E402
+from export_models import (MODELS, batched_predict, export_onnx, export_saved_model, format_cell,  # noqa: E402
+                           time_ms, unrolled_model)
+from fast_tokenizer import pad_post  # noqa: E402
+from inference import QUANTIZATIONS, CompiledModel, OnnxModel, TFLiteModel, exported_path  # noqa: E402
+
+DATASETS = {
+    "bilstm": os.path.join("BiLstm", "payload_dataset.csv"),
+    "xss": os.path.join("XSS", "XSS_dataset.csv"),
+    "behaviour": os.path.join("User_Behaviour", "Dataa.csv"),
+}
+BACKENDS = ("tflite", "onnx")
+RANDOM_STATE = 42
+
+
+# Run in a fresh interpreter so allocations freed by earlier models do not hide a model's own footprint.
+_RSS_PROBE = """
+import os, sys
+sys.path.insert(0, {app_dir!r})
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+from inference import load_inference_model
+__import__({runtime!r})
+before = rss()
+runner = load_inference_model({keras_path!r}, {backend!r}, num_threads={threads!r}, quantization={variant!r})
+print((rss() - before) / 2 ** 20)
+"""
+
+
+def load_rss_mb(keras_path: str, backend: str, variant, threads) -> Optional[float]:
+    """Resident memory added by loading and warming up one model, or None where it cannot be measured."""
+    if not os.path.exists("/proc/self/statm"):
+        return None
+    runtime = "onnxruntime" if backend == "onnx" else "tensorflow"
+    code = _RSS_PROBE.format(app_dir=APP_DIR, runtime=runtime, keras_path=keras_path, backend=backend, variant=variant,
+                             threads=threads)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    try:
+        return float(result.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return None
+
+
+def load_samples(name: str, data_path, synthetic: int, seed: int):
+    """``(texts_or_sessions, labels, source)`` for ``name``, from its dataset or the synthetic corpus."""
+    rng = random.Random(seed)
+    if name == "behaviour":
+        if data_path and os.path.exists(data_path):
+            sessions, source = corpus.load_session_csv(data_path), data_path
+        else:
+            sessions, source = corpus.synthetic_sessions(synthetic, rng), "synthetic"
+        # The training script's label: the session has a Click event.
+        labels = [any("Click" in e["Event"] for e in s["events"]) for s in sessions]
+        return sessions, labels, source
+
+    if data_path and os.path.exists(data_path):
+        rows, source = corpus.load_payload_csv(data_path), data_path
+        labels = [r["kind"] != "benign" for r in rows]
+    else:
+        rows, source = corpus.synthetic_payloads(synthetic, rng), "synthetic"
+        labels = [r["kind"] == ("sqli" if name == "bilstm" else "xss") for r in rows]
+    return [r["payload"] for r in rows], labels, source
+
+
+def encode(name: str, samples, app) -> np.ndarray:
+    """Token matrix for ``samples``, built the way the app builds it before the forward pass."""
+    if name == "bilstm":
+        return pad_post(app.bil_tokenizer.texts_to_sequences([app.bil_preprocess_text(t) for t in samples],
+                                                              maxlen=app.BIL_MAX_LEN), app.BIL_MAX_LEN)
+    if name == "xss":
+        return pad_post(app.xss_tokenizer.texts_to_sequences(samples, maxlen=app.xss_saved_maxlen), app.xss_saved_maxlen)
+    seqs = [[app.beh_label_to_index.get(f"{e['Event']}_{e['page_name']}_{e['browser_type']}", app.beh_unknown_idx)
+             for e in s["events"]] for s in samples]
+    return pad_post(seqs, app.BEH_MAXLEN, truncating="pre")
+
+
+def split(X: np.ndarray, y: np.ndarray):
+    from sklearn.model_selection import train_test_split
+
+    stratify = y if len(np.unique(y)) > 1 else None
+    return train_test_split(X, y, test_size=0.2, stratify=stratify, random_state=RANDOM_STATE)
+
+
+def quantize_tflite(model, seq_len: int, variant: str, calibration: np.ndarray, out_path: str, workdir: str):
+    converter = tf.lite.TFLiteConverter.from_saved_model(export_saved_model(unrolled_model(model), seq_len, workdir))
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "int8":
+        converter.representative_dataset = lambda: ([calibration[i:i + 1].astype(np.int32)] for i in range(len(calibration)))
+    with open(out_path, "wb") as f:
+        f.write(converter.convert())
+
+
+def quantize_onnx(model, seq_len: int, variant: str, calibration: np.ndarray, out_path: str, workdir: str):
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    float_path = os.path.join(workdir, "float.onnx")
+    export_onnx(model, seq_len, float_path, workdir)
+    if variant == "dynamic":
+        quantize_dynamic(float_path, out_path, weight_type=QuantType.QInt8)
+        return
+    input_name = onnx.load(float_path).graph.input[0].name
+
+    class Calibration(CalibrationDataReader):
+        def __init__(self):
+            self.rows = iter([{input_name: calibration[i:i + 1].astype(np.int32)} for i in range(len(calibration))])
+
+        def get_next(self):
+            return next(self.rows, None)
+
+    quantize_static(float_path, out_path, Calibration(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QInt8, weight_type=QuantType.QInt8)
+
+
+QUANTIZERS = {"tflite": (quantize_tflite, TFLiteModel), "onnx": (quantize_onnx, OnnxModel)}
+
+
+def evaluate(runner, X: np.ndarray, y: np.ndarray, reference, repeats: int):
+    probs = batched_predict(runner, X, 32)
+    row = {
+        "accuracy": float(np.mean((probs >= 0.5) == y)),
+        "ms_batch1": time_ms(runner, X[:1], repeats),
+        "ms_batch32": time_ms(runner, X[:32], repeats),
+    }
+    if reference is not None:
+        row["agreement"] = float(np.mean((probs >= 0.5) == (reference >= 0.5)))
+        row["max_diff"] = float(np.max(np.abs(probs - reference)))
+    return row, probs
+
+
+def quantize_model(name: str, args, app) -> list:
+    from loading import READY
+
+    path, _ = MODELS[name]
+    app.model_registry.load_now(name)
+    if app.model_registry.status()[name]["state"] != READY:
+        raise RuntimeError(f"the app could not load the {name} model or its tokenizer")
+
+    samples, labels, source = load_samples(name, getattr(args, f"{name}_data"), args.synthetic, args.seed)
+    X_train, X_test, _, y_test = split(encode(name, samples, app), np.asarray(labels, dtype=bool))
+    X_test, y_test = X_test[:args.samples], y_test[:args.samples]
+    rng = np.random.default_rng(args.seed)
+    calibration = X_train[rng.permutation(len(X_train))[:args.calibration]]
+    base = {"model": name, "data": source, "held_out": len(X_test), "calibration": len(calibration)}
+
+    model = tf.keras.models.load_model(path, compile=False)
+    reference_runner = CompiledModel(model, seq_len=X_test.shape[1]).warmup()
+    metrics, reference = evaluate(reference_runner, X_test, y_test, None, args.repeats)
+    rows = [{**base, "backend": "keras", "variant": "float", "size_kb": os.path.getsize(path) / 1024,
+             "rss_mb": load_rss_mb(path, "keras", None, args.threads), "agreement": 1.0, "max_diff": 0.0, **metrics,
+             "status": "baseline"}]
+
+    for backend in args.backends:
+        quantize, runner_cls = QUANTIZERS[backend]
+        float_path = exported_path(path, backend)
+        if os.path.exists(float_path):
+            # The unquantized export from export_models.py, for comparison.
+            runner = runner_cls(float_path, args.threads).warmup()
+            row = {**base, "backend": backend, "variant": "float", "size_kb": os.path.getsize(float_path) / 1024,
+                   "rss_mb": load_rss_mb(path, backend, None, args.threads)}
+            metrics, _ = evaluate(runner, X_test, y_test, reference, args.repeats)
+            rows.append({**row, **metrics, "status": "baseline"})
+        for variant in args.variants:
+            out_path = exported_path(path, backend, variant)
+            row = {**base, "backend": backend, "variant": variant}
+            workdir = tempfile.mkdtemp(prefix=f"quantize-{name}-")
+            try:
+                tmp_path = os.path.join(workdir, os.path.basename(out_path))
+                quantize(model, X_test.shape[1], variant, calibration, tmp_path, workdir)
+                runner = runner_cls(tmp_path, args.threads).warmup()
+                row["size_kb"] = os.path.getsize(tmp_path) / 1024
+                metrics, _ = evaluate(runner, X_test, y_test, reference, args.repeats)
+                row.update(metrics)
+                if row["agreement"] >= args.min_agreement:
+                    shutil.move(tmp_path, out_path)
+                    row["rss_mb"] = load_rss_mb(path, backend, variant, args.threads)
+                    row["status"] = "written"
+                else:
+                    row["status"] = "REJECTED"
+            except Exception as e:
+                row["status"] = f"failed: {e}"
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the models and report accuracy, latency and memory")
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=list(MODELS))
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--variants", nargs="+", default=list(QUANTIZATIONS), choices=list(QUANTIZATIONS))
+    for name in MODELS:
+        parser.add_argument(f"--{name}-data", default=DATASETS[name], help=f"{name} training data (default: %(default)s)")
+    parser.add_argument("--synthetic", type=int, default=5000, help="synthetic corpus size when the dataset is missing")
+    parser.add_argument("--samples", type=int, default=2000, help="held-out rows to evaluate on")
+    parser.add_argument("--calibration", type=int, default=200, help="training rows used to calibrate int8 ranges")
+    parser.add_argument("--min-agreement", type=float, default=0.99,
+                        help="smallest share of held-out verdicts a variant must share with the float model")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None, help="runtime intra-op threads (default: runtime's own)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    import app
+
+    print(f"{'model':<10} {'backend':<7} {'variant':<8} {'size KB':>9} {'accuracy':>9} {'agree':>7} {'max |diff|':>11} "
+          f"{'ms@1':>7} {'ms@32':>8} {'RSS MB':>7}  status")
+    report, failed = [], False
+    for name in args.models:
+        path, _ = MODELS[name]
+        if not os.path.exists(path):
+            print(f"{name:<10} skipped: {path} not found")
+            continue
+        try:
+            rows = quantize_model(name, args, app)
+        except Exception as e:
+            print(f"{name:<10} skipped: {e}")
+            failed = True
+            continue
+        print(f"{name:<10} data: {rows[0]['data']}, {rows[0]['held_out']} held out, {rows[0]['calibration']} calibration rows")
+        for r in rows:
+            failed = failed or r["status"] not in ("baseline", "written")
+            print(f"{r['model']:<10} {r['backend']:<7} {r['variant']:<8} {format_cell(r.get('size_kb'), '9.1f')} "
+                  f"{format_cell(r.get('accuracy'), '9.4f')} {format_cell(r.get('agreement'), '7.4f')} {format_cell(r.get('max_diff'), '11.2e')} "
+                  f"{format_cell(r.get('ms_batch1'), '7.2f')} {format_cell(r.get('ms_batch32'), '8.2f')} {format_cell(r.get('rss_mb'), '7.1f')}  "
+                  f"{r['status']}")
+        report += rows
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.report}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Sliding-window request rates per IP and per subnet in fixed memory.
+
+``RateSketch`` is a count-min sketch split into time buckets: a ring of
+``buckets + 1`` sketches, one per ``window / buckets`` seconds. A key's count
+over the last ``window`` seconds is the sum over the ring, with the oldest
+bucket weighted by the share of it still inside the window, and the minimum
+over the rows. Adding uses conservative update (only the rows at the minimum
+grow), which keeps the overestimate from hash collisions well below the
+count-min bound of ``e / width`` of the window's traffic. An update or a query
+touches ``depth`` counters per bucket whatever the number of distinct keys,
+and the memory is fixed when the sketch is created.
+
+Rows are indexed from a keyed BLAKE2 hash with a random salt, so a flood
+cannot be crafted to collide with a chosen address.
+
+The counters live in anonymous shared memory. Under gunicorn with
+``preload_app`` the sketch is created in the master, and every forked worker
+counts into the same arrays, so a rate covers all workers. Workers take turns
+through a ``lockf`` lock on an unlinked temporary file, which the kernel
+releases if a worker dies holding it.
+
+Each sketch also keeps a small table of heavy hitters, the keys with the
+highest counts seen at or above a floor.
+
+``RateTracker`` feeds one sketch with addresses and one with their subnets,
+and maps the rates to a 0..1 ``ddos`` score.
+"""
+import fcntl
+import ipaddress
+import mmap
+import os
+import tempfile
+import threading
+import time
+from hashlib import blake2b
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+_MASK64 = (1 << 64) - 1
+# IPv4 addresses are kept as IPv4-mapped IPv6 (::ffff:a.b.c.d).
+_V4_MAPPED = 0xFFFF << 32
+# Marks an empty heavy-hitter slot.
+_EMPTY = np.iinfo(np.int64).min // 2
+
+
+class RateSketch:
+    def __init__(self, window_s: float = 10.0, buckets: int = 10, width: int = 32768, depth: int = 4,
+                 top_k: int = 64, hh_floor: int = 1):
+        if window_s <= 0 or buckets < 1 or width < 1 or depth < 1:
+            raise ValueError("window_s, buckets, width and depth must be positive")
+        self.window_s = float(window_s)
+        self.buckets = int(buckets)
+        self.bucket_s = self.window_s / self.buckets
+        self.width = int(width)
+        self.depth = int(depth)
+        self.top_k = int(top_k)
+        self.hh_floor = max(1, int(hh_floor))
+        self.slots = self.buckets + 1
+        self._salt = os.urandom(16)
+        # lockf excludes other processes, the thread lock other threads of this one.
+        self._lock = threading.Lock()
+        self._lock_file = tempfile.TemporaryFile()
+
+        cells = self.slots * self.depth * self.width
+        layout = [("ring", np.int32, cells), ("clock", np.int64, 1),
+                  ("hh_hi", np.uint64, self.top_k), ("hh_lo", np.uint64, self.top_k),
+                  ("hh_count", np.int64, self.top_k), ("hh_bucket", np.int64, self.top_k)]
+        size = sum(np.dtype(dtype).itemsize * n for _, dtype, n in layout)
+        # Anonymous mmaps are MAP_SHARED, so processes forked after this point share the pages.
+        self._mm = mmap.mmap(-1, size)
+        offset = 0
+        arrays = {}
+        for name, dtype, n in layout:
+            arrays[name] = np.frombuffer(self._mm, dtype=dtype, count=n, offset=offset)
+            offset += np.dtype(dtype).itemsize * n
+        self._ring = arrays["ring"].reshape(self.slots, self.depth * self.width)
+        self._clock = arrays["clock"]
+        self._hh_hi, self._hh_lo = arrays["hh_hi"], arrays["hh_lo"]
+        self._hh_count, self._hh_bucket = arrays["hh_count"], arrays["hh_bucket"]
+        self._clock[0] = self._bucket(time.monotonic())
+        self._hh_bucket[:] = _EMPTY
+        self._row_base = [r * self.width for r in range(self.depth)]
+        self._weights = np.ones(self.slots)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._mm)
+
+    def _bucket(self, now: float) -> int:
+        return int(now // self.bucket_s)
+
+    def _locked(self):
+        return _ProcessLock(self._lock, self._lock_file.fileno())
+
+    def _cells(self, key: int) -> np.ndarray:
+        h = int.from_bytes(blake2b(key.to_bytes(16, "big"), digest_size=8, key=self._salt).digest(), "little")
+        # Kirsch-Mitzenmacher: row r uses h1 + r * h2, which is as good as depth independent hashes here.
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        width = self.width
+        return np.array([base + (h1 + r * h2) % width for r, base in enumerate(self._row_base)], dtype=np.intp)
+
+    def _advance(self, bucket: int):
+        """Clears the slots of the buckets that started since the last call, in any process."""
+        last = int(self._clock[0])
+        if bucket <= last:
+            return
+        self._clock[0] = bucket
+        for b in range(max(last + 1, bucket - self.slots + 1), bucket + 1):
+            self._ring[b % self.slots] = 0
+
+    def _window_count(self, cells: np.ndarray, now: float, bucket: int) -> float:
+        # The oldest slot started a full window before the current one; only part of it is still inside.
+        weights = self._weights
+        weights[:] = 1.0
+        weights[(bucket + 1) % self.slots] = 1.0 - (now - bucket * self.bucket_s) / self.bucket_s
+        return float((weights @ self._ring[:, cells]).min())
+
+    def add(self, key: int, count: int = 1, now: Optional[float] = None) -> float:
+        """Counts ``key`` and returns its count over the window, this one included."""
+        now = time.monotonic() if now is None else now
+        bucket = self._bucket(now)
+        cells = self._cells(key)
+        with self._locked():
+            self._advance(bucket)
+            row = self._ring[bucket % self.slots]
+            current = row[cells]
+            row[cells] = np.maximum(current, current.min() + count)
+            estimate = self._window_count(cells, now, bucket)
+            if estimate >= self.hh_floor:
+                self._track(key, estimate, bucket)
+        return estimate
+
+    def estimate(self, key: int, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        bucket = self._bucket(now)
+        with self._locked():
+            self._advance(bucket)
+            return self._window_count(self._cells(key), now, bucket)
+
+    def _track(self, key: int, estimate: float, bucket: int):
+        hi, lo = np.uint64(key >> 64), np.uint64(key & _MASK64)
+        found = np.flatnonzero((self._hh_hi == hi) & (self._hh_lo == lo) & (self._hh_bucket != _EMPTY))
+        if len(found):
+            slot = int(found[0])
+        else:
+            # Entries not updated for a whole window have aged out and are replaced first.
+            live = np.where(self._hh_bucket > bucket - self.slots, self._hh_count, -1)
+            slot = int(live.argmin())
+            if live[slot] >= estimate:
+                return
+            self._hh_hi[slot], self._hh_lo[slot] = hi, lo
+        self._hh_count[slot] = int(estimate)
+        self._hh_bucket[slot] = bucket
+
+    def heavy_hitters(self, now: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Tracked keys at or above the floor with their current counts, highest first."""
+        now = time.monotonic() if now is None else now
+        bucket = self._bucket(now)
+        with self._locked():
+            self._advance(bucket)
+            slots = np.flatnonzero(self._hh_bucket > bucket - self.slots)
+            keys = {(int(self._hh_hi[s]) << 64) | int(self._hh_lo[s]) for s in slots}
+            counts = [(key, self._window_count(self._cells(key), now, bucket)) for key in keys]
+        return sorted(((k, c) for k, c in counts if c >= self.hh_floor), key=lambda kc: -kc[1])
+
+
+class _ProcessLock:
+    def __init__(self, lock: threading.Lock, fd: int):
+        self.lock = lock
+        self.fd = fd
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        except BaseException:
+            self.lock.release()
+            raise
+
+    def __exit__(self, *exc):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+
+
+def parse_address(ip: str) -> Optional[Tuple[int, bool]]:
+    """``(address as a 128-bit int, is IPv4)``, IPv4 mapped into IPv6, or None if ``ip`` is not an address."""
+    try:
+        addr = ipaddress.ip_address(ip.strip())
+    except (ValueError, AttributeError):
+        return None
+    if addr.version == 4:
+        return _V4_MAPPED | int(addr), True
+    mapped = addr.ipv4_mapped
+    if mapped is not None:
+        return _V4_MAPPED | int(mapped), True
+    return int(addr), False
+
+
+def format_key(key: int, prefix: Optional[int] = None) -> str:
+    if key >> 32 == 0xFFFF:
+        addr = ipaddress.IPv4Address(key & 0xFFFFFFFF)
+    else:
+        addr = ipaddress.IPv6Address(key)
+    return str(addr) if prefix is None else f"{addr}/{prefix}"
+
+
+def rate_score(rate: float, limit: float, flood_factor: float) -> float:
+    """0 up to ``limit`` requests/s, rising linearly to 1 at ``flood_factor`` times the limit."""
+    if rate <= limit:
+        return 0.0
+    return min(1.0, (rate - limit) / ((flood_factor - 1.0) * limit))
+
+
+class RateTracker:
+    """Request rates of addresses and their subnets (``/v4_prefix`` or ``/v6_prefix``), and a ddos score.
+
+    Heavy hitters are the addresses (subnets) at or above a quarter of their
+    limit.
+    """
+
+    def __init__(self, ip_limit: float = 20.0, subnet_limit: float = 200.0, flood_factor: float = 5.0,
+                 v4_prefix: int = 24, v6_prefix: int = 64, window_s: float = 10.0, buckets: int = 10,
+                 width: int = 32768, depth: int = 4, top_k: int = 64):
+        if ip_limit <= 0 or subnet_limit <= 0 or flood_factor <= 1:
+            raise ValueError("limits must be positive and flood_factor above 1")
+        if not 0 <= v4_prefix <= 32 or not 0 <= v6_prefix <= 128:
+            raise ValueError("v4_prefix must be within 0..32 and v6_prefix within 0..128")
+        self.ip_limit = ip_limit
+        self.subnet_limit = subnet_limit
+        self.flood_factor = flood_factor
+        self.v4_prefix = v4_prefix
+        self.v6_prefix = v6_prefix
+        self.window_s = window_s
+        self.ips = RateSketch(window_s, buckets, width, depth, top_k, hh_floor=int(ip_limit * window_s / 4))
+        self.subnets = RateSketch(window_s, buckets, width, depth, top_k, hh_floor=int(subnet_limit * window_s / 4))
+
+    def _subnet(self, key: int, v4: bool) -> Tuple[int, int]:
+        prefix = self.v4_prefix if v4 else self.v6_prefix
+        host_bits = (32 if v4 else 128) - prefix
+        return (key >> host_bits) << host_bits, prefix
+
+    def _result(self, key: int, v4: bool, ip_count: float, subnet_count: float) -> Dict:
+        subnet, prefix = self._subnet(key, v4)
+        ip_rate = ip_count / self.window_s
+        subnet_rate = subnet_count / self.window_s
+        score = max(rate_score(ip_rate, self.ip_limit, self.flood_factor),
+                    rate_score(subnet_rate, self.subnet_limit, self.flood_factor))
+        return {"ip": format_key(key), "ip_rate": round(ip_rate, 3), "subnet": format_key(subnet, prefix),
+                "subnet_rate": round(subnet_rate, 3), "score": round(score, 4)}
+
+    def observe(self, ip: str, count: int = 1, now: Optional[float] = None) -> Optional[Dict]:
+        """Counts ``count`` requests from ``ip`` and returns its rates and score, or None if it is not an address."""
+        parsed = parse_address(ip)
+        if parsed is None:
+            return None
+        key, v4 = parsed
+        now = time.monotonic() if now is None else now
+        ip_count = self.ips.add(key, count, now)
+        subnet_count = self.subnets.add(self._subnet(key, v4)[0], count, now)
+        return self._result(key, v4, ip_count, subnet_count)
+
+    def peek(self, ip: str, now: Optional[float] = None) -> Optional[Dict]:
+        """Like ``observe`` without counting a request."""
+        parsed = parse_address(ip)
+        if parsed is None:
+            return None
+        key, v4 = parsed
+        now = time.monotonic() if now is None else now
+        return self._result(key, v4, self.ips.estimate(key, now), self.subnets.estimate(self._subnet(key, v4)[0], now))
+
+    def heavy_hitters(self, now: Optional[float] = None) -> Dict[str, List[Dict]]:
+        now = time.monotonic() if now is None else now
+        ips = [{"ip": format_key(k), "rate": round(c / self.window_s, 3)} for k, c in self.ips.heavy_hitters(now)]
+        subnets = []
+        for k, c in self.subnets.heavy_hitters(now):
+            prefix = self.v4_prefix if k >> 32 == 0xFFFF else self.v6_prefix
+            subnets.append({"subnet": format_key(k, prefix), "rate": round(c / self.window_s, 3)})
+        return {"ips": ips, "subnets": subnets}
+
+    def stats(self) -> Dict:
+        s = self.ips
+        return {"window_s": self.window_s, "buckets": s.buckets, "width": s.width, "depth": s.depth,
+                "bytes": self.ips.nbytes + self.subnets.nbytes, "ip_limit": self.ip_limit,
+                "subnet_limit": self.subnet_limit, "flood_factor": self.flood_factor,
+                "v4_prefix": self.v4_prefix, "v6_prefix": self.v6_prefix}
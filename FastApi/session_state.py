@@ -0,0 +1,240 @@
+"""
+Incremental scoring of behaviour sessions, one event at a time.
+
+The behaviour model reads a session's last ``window`` events, post-padded
+with token 0, through Embedding -> LSTM -> Dense layers. ``LstmSessionScorer``
+runs the same network in numpy from the Keras weights, which lets a session's
+LSTM state be kept between calls:
+
+- while a session holds at most ``window`` events, a new event is one LSTM
+  step from the cached state, followed by the steps over the padding the
+  model sees after the last event;
+- past ``window`` events the oldest one drops out of the model's view, so the
+  window is rerun from a ring buffer of the last ``window`` tokens.
+
+Either way an event costs at most ``window`` LSTM steps however long the
+session gets, and the score equals a full rescoring of the session.
+
+``SessionStore`` keeps that state in arrays allocated once for a fixed number
+of sessions. Sessions expire after a TTL, and the least recently updated one
+is evicted when a new session needs its slot. The store-wide lock only guards
+that bookkeeping; the LSTM steps run on a copy of the session's state under one
+of a set of striped locks, so different sessions are scored in parallel while
+updates to one session stay in order.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Rough per-session cost of the OrderedDict node, the key and the (slot, expiry) tuple.
+_ENTRY_OVERHEAD = 200
+_LOCK_STRIPES = 64
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+_ACTIVATIONS = {"linear": lambda x: x, "relu": lambda x: np.maximum(x, 0.0), "sigmoid": _sigmoid, "tanh": np.tanh}
+
+
+class LstmSessionScorer:
+    """An Embedding -> LSTM -> Dense... -> 1 unit network evaluated step by step in float32.
+
+    ``gate_table`` holds each token's input contribution to the four LSTM
+    gates (embedding @ kernel + bias), so a step is one table lookup and one
+    ``h @ recurrent_kernel``. Gate columns are reordered from Keras' i, f, c, o
+    to i, f, o, c so the three sigmoid gates are one contiguous slice.
+    """
+
+    def __init__(self, gate_table: np.ndarray, recurrent_kernel: np.ndarray, head: Sequence[Tuple[np.ndarray, np.ndarray, str]],
+                 pad_token: int = 0):
+        self.units = u = recurrent_kernel.shape[0]
+        order = np.r_[0:2 * u, 3 * u:4 * u, 2 * u:3 * u]
+        self.gate_table = np.ascontiguousarray(gate_table[:, order], dtype=np.float32)
+        self.recurrent_kernel = np.ascontiguousarray(recurrent_kernel[:, order], dtype=np.float32)
+        self.head = [(w.astype(np.float32), b.astype(np.float32), _ACTIVATIONS[act]) for w, b, act in head]
+        self.pad_gates = self.gate_table[pad_token]
+
+    @classmethod
+    def from_keras(cls, model) -> Optional["LstmSessionScorer"]:
+        """Reads the weights of ``model``, or returns None when its layers are not of the supported kind."""
+        return cls.from_layers([(layer.__class__.__name__, layer.get_config(), layer.get_weights()) for layer in model.layers])
+
+    @classmethod
+    def from_h5(cls, path: str) -> Optional["LstmSessionScorer"]:
+        """Same as ``from_keras`` for a Keras ``.h5`` file, read with h5py so TensorFlow is never imported."""
+        import h5py
+
+        with h5py.File(path, "r") as f:
+            config = f.attrs["model_config"]
+            config = json.loads(config.decode() if isinstance(config, bytes) else config)
+            if config.get("class_name") != "Sequential":
+                return None
+            weights = f["model_weights"]
+            layers = []
+            for layer in config["config"]["layers"]:
+                name = layer["config"]["name"]
+                group = weights[name] if name in weights else None
+                names = [n.decode() if isinstance(n, bytes) else n for n in group.attrs["weight_names"]] if group is not None else []
+                layers.append((layer["class_name"], layer["config"], [np.asarray(group[n]) for n in names]))
+        return cls.from_layers(layers)
+
+    @classmethod
+    def from_layers(cls, layers: Sequence[Tuple[str, Dict, List[np.ndarray]]]) -> Optional["LstmSessionScorer"]:
+        """Builds the scorer from ``(class name, config, weights)`` per layer, or returns None for other architectures."""
+        layers = [layer for layer in layers if layer[0] not in ("InputLayer", "Dropout")]
+        if len(layers) < 3:
+            return None
+        embedding, lstm, dense = layers[0], layers[1], layers[2:]
+        if embedding[0] != "Embedding" or embedding[1].get("mask_zero"):
+            return None
+        config = lstm[1] if lstm[0] == "LSTM" else {}
+        if (config.get("activation") != "tanh" or config.get("recurrent_activation") != "sigmoid" or not config.get("use_bias")
+                or config.get("return_sequences") or config.get("go_backwards") or config.get("stateful")):
+            return None
+        head = []
+        for class_name, layer_config, weights in dense:
+            if class_name != "Dense" or layer_config.get("activation") not in _ACTIVATIONS or not layer_config.get("use_bias"):
+                return None
+            w, b = weights
+            head.append((w, b, layer_config["activation"]))
+        if head[-1][0].shape[1] != 1:
+            return None
+
+        (table,) = embedding[2]
+        kernel, recurrent_kernel, bias = lstm[2]
+        return cls(table.astype(np.float32) @ kernel.astype(np.float32) + bias.astype(np.float32), recurrent_kernel, head)
+
+    def step(self, state: np.ndarray, gates: np.ndarray):
+        """Advances ``state`` (``[h, c]``, shape 2 x units) in place by one step with input ``gates``."""
+        h, c = state
+        z = gates + h @ self.recurrent_kernel
+        u = self.units
+        ifo = _sigmoid(z[:3 * u])
+        c *= ifo[u:2 * u]
+        c += ifo[:u] * np.tanh(z[3 * u:])
+        h[:] = ifo[2 * u:] * np.tanh(c)
+
+    def advance(self, state: np.ndarray, tokens: Sequence[int]):
+        for token in tokens:
+            self.step(state, self.gate_table[token])
+
+    def score(self, state: np.ndarray, pad_steps: int) -> float:
+        """Probability after ``pad_steps`` padding tokens, without touching ``state``."""
+        tail = state.copy()
+        for _ in range(pad_steps):
+            self.step(tail, self.pad_gates)
+        x = tail[0]
+        for w, b, activation in self.head:
+            x = activation(x @ w + b)
+        return float(x[0])
+
+
+class SessionStore:
+    """Per-session LSTM state and last ``window`` tokens, for at most a fixed number of sessions."""
+
+    def __init__(self, scorer: LstmSessionScorer, window: int, max_entries: int = 100_000, ttl_seconds: float = 1800.0,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.scorer = scorer
+        self.window = window
+        self.ttl = ttl_seconds
+        self.slot_bytes = window * 4 + 8 + 2 * scorer.units * 4 + _ENTRY_OVERHEAD
+        self.capacity = max(0, min(max_entries, max_bytes // self.slot_bytes))
+        self.tokens = np.zeros((self.capacity, window), dtype=np.int32)  # ring buffer per session
+        self.counts = np.zeros(self.capacity, dtype=np.int64)
+        self.states = np.zeros((self.capacity, 2, scorer.units), dtype=np.float32)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Updated in LRU order with the TTL refreshed on every update, so the
+        # front entry is always the next to expire as well as the least recent.
+        self._slots: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._free = list(range(self.capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+    def _expire(self, now: float):
+        while self._slots:
+            key, (slot, expires) = next(iter(self._slots.items()))
+            if expires >= now:
+                return
+            del self._slots[key]
+            self._free.append(slot)
+            self.expirations += 1
+
+    def _slot(self, key: str) -> int:
+        entry = self._slots.pop(key, None)
+        if entry is not None:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        if not self._free:
+            _, (slot, _) = self._slots.popitem(last=False)
+            self._free.append(slot)
+            self.evictions += 1
+        slot = self._free.pop()
+        self.counts[slot] = 0
+        self.states[slot] = 0.0
+        return slot
+
+    def append(self, key: str, tokens: List[int]) -> Tuple[float, int]:
+        """Adds ``tokens`` to session ``key`` and returns ``(probability, events_seen)``.
+
+        An unknown, expired or evicted session starts over from ``tokens``.
+        """
+        if self.capacity == 0:
+            raise RuntimeError("session store has no capacity")
+        with self._stripes[hash(key) % _LOCK_STRIPES]:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                slot = self._slot(key)
+                self._slots[key] = (slot, now + self.ttl)
+                ring, state, count = self.tokens[slot].copy(), self.states[slot].copy(), int(self.counts[slot])
+
+            window = self.window
+            count += len(tokens)
+            for i, token in enumerate(tokens[-window:], start=count - min(len(tokens), window)):
+                ring[i % window] = token
+            if count <= window:
+                self.scorer.advance(state, tokens)
+                probability = self.scorer.score(state, window - count)
+            else:
+                # The window slid: rerun its tokens, oldest first, from a zero state.
+                first = count % window
+                state[:] = 0.0
+                self.scorer.advance(state, np.concatenate([ring[first:], ring[:first]]))
+                probability = self.scorer.score(state, 0)
+
+            with self._lock:
+                # Meanwhile the session may have been evicted or discarded and its slot handed to another one.
+                entry = self._slots.get(key)
+                if entry is not None and entry[0] == slot:
+                    self.tokens[slot], self.states[slot], self.counts[slot] = ring, state, count
+            return probability, count
+
+    def discard(self, key: str) -> bool:
+        with self._lock:
+            entry = self._slots.pop(key, None)
+            if entry is None:
+                return False
+            self._free.append(entry[0])
+            return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": len(self._slots),
+                "capacity": self.capacity,
+                "bytes": self.capacity * self.slot_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,91 @@
+"""
+Single-flight coalescing of identical model calls.
+
+During a scan burst the same payload arrives many times within a few
+milliseconds, before its verdict is in the cache. ``SingleFlight`` keeps a
+table of the keys being computed: the first caller for a key computes it, and
+callers that ask for the same key meanwhile wait for that result instead of
+running the model again. Duplicates within one batch are coalesced the same
+way. The entry is dropped as soon as the result is in, so the table only
+holds work in progress.
+"""
+import threading
+from concurrent.futures import Future
+from typing import Dict, Hashable, List, Optional, Sequence
+
+
+class Flight:
+    """One caller's claim on a list of keys. ``lead`` holds the positions it must compute and ``resolve``."""
+
+    def __init__(self, table: "SingleFlight", keys: Sequence[Hashable], futures: List[Future], lead: List[int]):
+        self.table = table
+        self.keys = keys
+        self.futures = futures
+        self.lead = lead
+
+    def resolve(self, position: int, value):
+        self.table._settle(self.keys[position], self.futures[position], value=value)
+
+    def result(self, position: int):
+        return self.futures[position].result()
+
+    def __enter__(self) -> "Flight":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Keys this caller led but did not resolve would leave their followers waiting forever.
+        error = exc if exc is not None else RuntimeError("computation finished without a result")
+        for position in self.lead:
+            if not self.futures[position].done():
+                self.table._settle(self.keys[position], self.futures[position], error=error)
+
+
+class SingleFlight:
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self.computed = 0
+        self.coalesced = 0
+        self._flights: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, keys: Sequence[Hashable]) -> Flight:
+        """Joins the flights already open for ``keys`` and opens one for each of the others.
+
+        The caller must resolve every position in ``lead`` before waiting on any
+        other result, inside a ``with`` block so a failure reaches the waiters.
+        """
+        futures: List[Future] = []
+        lead: List[int] = []
+        if not self.enabled:
+            return Flight(self, keys, [Future() for _ in keys], list(range(len(keys))))
+        with self._lock:
+            for position, key in enumerate(keys):
+                future = self._flights.get(key)
+                if future is None:
+                    future = self._flights[key] = Future()
+                    lead.append(position)
+                futures.append(future)
+            self.computed += len(lead)
+            self.coalesced += len(keys) - len(lead)
+        return Flight(self, keys, futures, lead)
+
+    def _settle(self, key: Hashable, future: Future, value=None, error: Optional[BaseException] = None):
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.computed + self.coalesced
+            return {
+                "enabled": self.enabled,
+                "in_flight": len(self._flights),
+                "computed": self.computed,
+                "coalesced": self.coalesced,
+                "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0,
+            }
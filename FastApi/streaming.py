@@ -0,0 +1,142 @@
+"""
+Streaming NDJSON scoring for bulk rescoring.
+
+The request body is read as it arrives and split into lines. Each line is a
+JSON document. Lines are grouped into batches and scored on the thread pool,
+and results stream back as NDJSON in input order, one line per non-blank
+input line. Blank lines are skipped but still counted, so match results to
+inputs on ``line`` rather than on position.
+At most ``max_inflight`` batches are held at a time, so memory stays bounded
+however large the body is. When the client stops reading results, input
+reading stops too.
+
+Every output line carries ``line`` (1-based input line number) and, when the
+input object had one, its ``id``. A line that cannot be parsed or scored
+gets an ``error`` instead of a verdict; the stream carries on.
+"""
+import asyncio
+import json
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """Yields ``(line_number, line)`` for each non-blank line (blank lines still advance the number); ``line`` is None when it exceeds ``max_line_bytes``."""
+    buffer = b""
+    line_no = 0
+    skipping = False  # inside an over-long line, waiting for its newline
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line, start = buffer[start:end], end + 1
+            line_no += 1
+            if skipping:
+                skipping = False
+                yield line_no, None
+            elif line.strip():
+                yield line_no, line if len(line) <= max_line_bytes else None
+        buffer = buffer[start:]
+        if len(buffer) > max_line_bytes:
+            skipping = True
+            buffer = b""
+    if skipping or buffer.strip():
+        yield line_no + 1, None if skipping else buffer
+
+
+def _error_detail(e: Exception) -> str:
+    if isinstance(e, HTTPException):
+        return str(e.detail)
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+    return str(e)
+
+
+async def score_ndjson(chunks: AsyncIterator[bytes], parse: Callable[[Any], Any],
+                       score: Callable[[List[Any]], List[Dict]], batch_size: int, max_inflight: int,
+                       max_line_bytes: int) -> AsyncIterator[bytes]:
+    """Parses each line with ``parse`` and scores batches of parsed items with ``score`` (run on the thread pool)."""
+    pending: deque = deque()
+
+    async def finish(rows, task) -> bytes:
+        try:
+            verdicts = await task if task is not None else []
+            error = None
+        except Exception as e:
+            verdicts, error = [], _error_detail(e)
+        verdicts = iter(verdicts)
+        out = []
+        for meta, item_error in rows:
+            if item_error is None and error is None:
+                out.append({**meta, **next(verdicts)})
+            else:
+                out.append({**meta, "error": item_error or error})
+        return "".join(json.dumps(r) + "\n" for r in out).encode()
+
+    def submit(rows, items):
+        # Started now, so the batch scores while the next one is read.
+        task = asyncio.ensure_future(run_in_threadpool(score, items)) if items else None
+        pending.append((rows, task))
+
+    rows: List[Tuple[Dict, Optional[str]]] = []
+    items: List[Any] = []
+    try:
+        async for line_no, line in ndjson_lines(chunks, max_line_bytes):
+            meta: Dict[str, Any] = {"line": line_no}
+            if line is None:
+                rows.append((meta, f"line longer than {max_line_bytes} bytes"))
+            else:
+                try:
+                    obj = json.loads(line)
+                    if isinstance(obj, dict) and "id" in obj:
+                        meta["id"] = obj["id"]
+                    items.append(parse(obj))
+                    rows.append((meta, None))
+                except Exception as e:
+                    rows.append((meta, f"invalid line: {_error_detail(e)}"))
+            if len(rows) >= batch_size:
+                submit(rows, items)
+                rows, items = [], []
+                if len(pending) >= max_inflight:
+                    yield await finish(*pending.popleft())
+        if rows:
+            submit(rows, items)
+        while pending:
+            yield await finish(*pending.popleft())
+    finally:
+        # Client went away mid-stream: drop the batches nobody will read.
+        for _, task in pending:
+            if task is not None:
+                task.cancel()
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """StreamingResponse whose content is produced while the request body is still being read.
+
+    Below ASGI 2.4, StreamingResponse watches ``receive`` for a disconnect
+    while it streams, and that watcher would swallow the body messages the
+    content is reading. Here a disconnect surfaces through the body reader.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+
+def ndjson_response(chunks: AsyncIterator[bytes], parse, score, batch_size: int, max_inflight: int,
+                    max_line_bytes: int) -> StreamingResponse:
+    return BodyStreamingResponse(score_ndjson(chunks, parse, score, batch_size, max_inflight, max_line_bytes),
+                                 media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,190 @@
+"""
+Tests FlowMeter against a packet-at-a-time reference meter, and read_pcap on a handmade capture.
+
+Run with ``python -m pytest`` from this directory.
+"""
+import random
+import socket
+import struct
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from flow_meter import FIN, RST, FlowMeter, FlowRecords, packets_from_events, read_pcap  # noqa: E402
+
+
+def _flows(records: FlowRecords):
+    """Comparable ``(src, sport, dst, dport, proto, first, last, packets, fwd_packets, bytes, end)`` per flow."""
+    return sorted(
+        (d["src"], d["sport"], d["dst"], d["dport"], d["proto"], d["first_ts"], d["last_ts"], d["packets"], fwd, total,
+         d["end"])
+        for d, fwd, total in zip(records.to_dicts(), records.fwd_packets.tolist(), records.byte_sum.tolist()))
+
+
+def _reference(batches, idle, active):
+    """The same flows, built one packet at a time in time order, sweeping timeouts after every batch."""
+    live, out, now = {}, [], float("-inf")
+
+    def end(key, reason):
+        f = live.pop(key)
+        out.append((*f["fwd"], *f["bwd"], key[2], f["first"], f["last"], f["packets"], f["fwd_packets"], f["bytes"],
+                    reason))
+
+    for batch in batches:
+        for e in sorted(batch, key=lambda e: e["ts"]):
+            a, b = (e["src"], e["sport"]), (e["dst"], e["dport"])
+            key = (*sorted([a, b]), e["proto"])
+            f = live.get(key)
+            if f is not None and e["ts"] - f["last"] > idle:
+                end(key, "idle")
+            elif f is not None and e["ts"] - f["first"] > active:
+                end(key, "active")
+            if key not in live:
+                live[key] = {"fwd": a, "bwd": b, "first": e["ts"], "last": e["ts"], "packets": 0, "fwd_packets": 0,
+                             "bytes": 0.0}
+            f = live[key]
+            f["last"] = e["ts"]
+            f["packets"] += 1
+            f["fwd_packets"] += a == f["fwd"]
+            f["bytes"] += e["length"]
+            if e["flags"] & (FIN | RST):
+                end(key, "fin")
+        now = max([now] + [e["ts"] for e in batch])
+        for key in list(live):
+            if now - live[key]["last"] > idle:
+                end(key, "idle")
+            elif now - live[key]["first"] > active:
+                end(key, "active")
+    for key in list(live):
+        end(key, "flushed")
+    return sorted(out)
+
+
+def _events(rng, n):
+    hosts = ["10.0.0.1", "10.0.0.2", "192.168.1.7", "2001:db8::1", "2001:db8::2"]
+    ts, events = 0.0, []
+    for _ in range(n):
+        # Mostly short steps so flows outlive the active timeout, with the odd gap past the idle one.
+        ts += rng.choices([0.01, 0.1, 0.5, 15.0], weights=[60, 30, 10, 1])[0]
+        v6 = rng.random() < 0.3
+        src, dst = rng.sample(hosts[3:] if v6 else hosts[:3], 2)
+        events.append({"ts": ts, "src": src, "dst": dst, "sport": 1234, "dport": rng.choice([80, 443]),
+                       "proto": rng.choice([6, 17]), "length": rng.randint(40, 1500),
+                       "flags": FIN if rng.random() < 0.05 else RST if rng.random() < 0.02 else 0x10})
+    return events
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_flows_match_packet_at_a_time_reference(seed):
+    rng = random.Random(seed)
+    events = _events(rng, 600)
+    batches, i = [], 0
+    while i < len(events):
+        size = rng.randint(1, 80)
+        batch = events[i:i + size]
+        rng.shuffle(batch)  # ingest accepts a batch in any order
+        batches.append(batch)
+        i += size
+
+    meter = FlowMeter(max_flows=1000, idle_timeout=10.0, active_timeout=8.0, sweep_interval=0.0)
+    records = [meter.ingest(packets_from_events(batch)) for batch in batches] + [meter.flush()]
+
+    assert _flows(FlowRecords.concat(records)) == _reference(batches, 10.0, 8.0)
+    assert meter.stats()["live"] == 0
+
+
+def _event(ts, src, sport=1234, flags=0x10):
+    return {"ts": ts, "src": src, "dst": "10.9.9.9", "sport": sport, "dport": 80, "proto": 6, "length": 100, "flags": flags}
+
+
+def test_full_table_evicts_least_recently_seen_flow():
+    meter = FlowMeter(max_flows=2, idle_timeout=100.0, active_timeout=100.0)
+    assert len(meter.ingest(packets_from_events([_event(0, "10.0.0.1"), _event(1, "10.0.0.2")]))) == 0
+
+    ended = meter.ingest(packets_from_events([_event(2, "10.0.0.1"), _event(3, "10.0.0.3")]))
+
+    assert [(d["src"], d["packets"], d["end"]) for d in ended.to_dicts()] == [("10.0.0.2", 1, "evicted")]
+    assert sorted((d["src"], d["packets"]) for d in meter.flush().to_dicts()) == [("10.0.0.1", 2), ("10.0.0.3", 1)]
+
+
+def test_new_flows_that_do_not_fit_spill():
+    meter = FlowMeter(max_flows=1, idle_timeout=100.0, active_timeout=100.0)
+
+    ended = meter.ingest(packets_from_events([_event(0, "10.0.0.1"), _event(1, "10.0.0.2"), _event(2, "10.0.0.3"),
+                                              _event(3, "10.0.0.1")]))
+    flushed = meter.flush()
+
+    assert [d["end"] for d in ended.to_dicts()] == ["evicted", "evicted"]
+    assert len(flushed) == 1
+    assert sum(ended.packets.tolist() + flushed.packets.tolist()) == 4
+
+
+##############################
+# pcap
+##############################
+def _ipv4(src, dst, proto, l4, total=None):
+    total = 20 + len(l4) if total is None else total
+    return struct.pack("!BBHHHBBH4s4s", 0x45, 0, total, 0, 0, 64, proto, 0, socket.inet_aton(src), socket.inet_aton(dst)) + l4
+
+
+def _ipv6(src, dst, next_header, l4):
+    return struct.pack("!IHBB16s16s", 6 << 28, len(l4), next_header, 64, socket.inet_pton(socket.AF_INET6, src),
+                       socket.inet_pton(socket.AF_INET6, dst)) + l4
+
+
+def _tcp(sport, dport, flags):
+    return struct.pack("!HHIIBBHHH", sport, dport, 0, 0, 5 << 4, flags, 65535, 0, 0)
+
+
+def _udp(sport, dport, payload=b""):
+    return struct.pack("!HHHH", sport, dport, 8 + len(payload), 0) + payload
+
+
+def _ethernet(ethertype, payload, vlan=None):
+    tag = struct.pack("!HH", 0x8100, vlan) if vlan is not None else b""
+    return b"\x02" * 6 + b"\x04" * 6 + tag + struct.pack("!H", ethertype) + payload
+
+
+def _pcap(frames, truncate=0):
+    """Little-endian microsecond pcap of ``(seconds, microseconds, frame)``; the last ``truncate`` bytes are cut off."""
+    out = struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)
+    for sec, usec, frame in frames:
+        out += struct.pack("<IIII", sec, usec, len(frame), len(frame)) + frame
+    return out[:len(out) - truncate]
+
+
+@pytest.mark.parametrize("batch_size", [2, 64])
+def test_read_pcap_decodes_ethernet_vlan_ipv6_and_truncated_frames(tmp_path, batch_size):
+    frames = [
+        (1, 0, _ethernet(0x0800, _ipv4("10.0.0.1", "10.0.0.2", 6, _tcp(1234, 80, 0x02)))),
+        (1, 250000, _ethernet(0x0800, _ipv4("10.0.0.3", "10.0.0.4", 17, _udp(53, 5353, b"x" * 12)), vlan=7)),
+        (2, 0, _ethernet(0x0806, b"\x00" * 28)),  # ARP: dropped
+        (2, 500000, _ethernet(0x86DD, _ipv6("2001:db8::1", "2001:db8::2", 6, _tcp(443, 50000, FIN | 0x10) + b"y" * 20))),
+        (3, 0, _ethernet(0x0800, _ipv4("10.0.0.5", "10.0.0.6", 6, _tcp(8080, 9090, RST) + b"z" * 100))),
+    ]
+    # The last frame keeps its IPv4 header and ports but loses the TCP flags and everything after them.
+    path = tmp_path / "capture.pcap"
+    path.write_bytes(_pcap(frames, truncate=len(frames[-1][2]) - 14 - 20 - 4))
+
+    packets = np.concatenate(list(read_pcap(str(path), batch_size)))
+
+    expected = packets_from_events([
+        {"ts": 1 + 0 * 1e-6, "src": "10.0.0.1", "dst": "10.0.0.2", "sport": 1234, "dport": 80, "proto": 6, "length": 40,
+         "flags": 0x02},
+        {"ts": 1 + 250000 * 1e-6, "src": "10.0.0.3", "dst": "10.0.0.4", "sport": 53, "dport": 5353, "proto": 17,
+         "length": 40, "flags": 0},
+        {"ts": 2 + 500000 * 1e-6, "src": "2001:db8::1", "dst": "2001:db8::2", "sport": 443, "dport": 50000, "proto": 6,
+         "length": 80, "flags": FIN | 0x10},
+        {"ts": 3 + 0 * 1e-6, "src": "10.0.0.5", "dst": "10.0.0.6", "sport": 8080, "dport": 9090, "proto": 6,
+         "length": 140, "flags": 0},
+    ])
+    assert packets.tolist() == expected.tolist()
+
+
+def test_read_pcap_drops_frame_cut_inside_ip_header(tmp_path):
+    frames = [(1, 0, _ethernet(0x0800, _ipv4("10.0.0.1", "10.0.0.2", 6, _tcp(1234, 80, 0x02))))] * 2
+    path = tmp_path / "capture.pcap"
+    path.write_bytes(_pcap(frames, truncate=len(frames[-1][2]) - 14 - 10))
+
+    assert sum(len(batch) for batch in read_pcap(str(path))) == 1
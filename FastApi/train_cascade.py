@@ -0,0 +1,157 @@
+"""
+Train the tier-1 cascade model for the BiLSTM or XSS detector.
+
+Tier 1 learns to reproduce the deep model's verdicts (``--labels`` uses the
+dataset's own labels instead). Payloads are scored by the deep model through
+the app's loaders, split into a training and a held-out part, and the exit
+thresholds are chosen on the held-out part (see ``cascade.exit_thresholds``).
+The result is written next to the deep model and picked up at startup:
+
+    python train_cascade.py --model xss --data XSS_dataset.csv
+    python train_cascade.py --model bilstm --data payload_dataset.csv --max-miss 0.001
+
+Run from the FastApi folder. Without ``--data`` a seeded synthetic corpus
+(``benchmarks/corpus.py``) is used, which is only good for trying it out:
+train on traffic that looks like production, mostly benign, for the exit
+rate to carry over.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "benchmarks"))
+
+import bulk_score  # noqa: E402
+from cascade import DEFAULT_BITS, CascadeTier1, exit_thresholds  # noqa: E402
+
+
+def read_payloads(path: str, column, limit: int):
+    payloads, labels = [], []
+    for frame in bulk_score.read_chunks(path, 50_000):
+        name = column or next((c for c in bulk_score.PAYLOAD_COLUMNS if c in frame.columns), None)
+        if name is None:
+            sys.exit(f"{path} has none of the columns {bulk_score.PAYLOAD_COLUMNS}; pass --payload-column")
+        frame = frame[frame[name].notna()]
+        payloads += [str(p) for p in frame[name]]
+        if "Label" in frame.columns:
+            labels += [str(v).strip().rstrip(",") == "1" for v in frame["Label"]]
+        if limit and len(payloads) >= limit:
+            break
+    payloads = payloads[:limit] if limit else payloads
+    return payloads, (labels[:len(payloads)] if len(labels) >= len(payloads) else None)
+
+
+def design_matrix(tier: CascadeTier1, payloads):
+    from scipy.sparse import csr_matrix
+
+    indptr, indices, flagged = [0], [], np.zeros(len(payloads), dtype=bool)
+    for i, payload in enumerate(payloads):
+        row, flagged[i] = tier.features(payload)
+        indices.extend(sorted(set(row)))
+        indptr.append(len(indices))
+    X = csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr), shape=(len(payloads), tier.mask + 1))
+    return X, flagged
+
+
+def teacher_scores(model: str, payloads, batch_size: int = 1024) -> np.ndarray:
+    """The deep model's probabilities, scored with the app's own loader and scoring path."""
+    import app
+    from loading import READY
+
+    app.model_registry.load_now(model)
+    if app.model_registry.status()[model]["state"] != READY:
+        sys.exit(f"The {model} model could not be loaded; run from the FastApi folder with its artifacts in place")
+    score = app.bil_score if model == "bilstm" else app.xss_score
+    out = []
+    for start in range(0, len(payloads), batch_size):
+        out += score(payloads[start:start + batch_size], use_cache=False, cascade=False)
+    return np.asarray(out, dtype=np.float64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and calibrate the tier-1 cascade model")
+    parser.add_argument("--model", choices=["bilstm", "xss"], required=True)
+    parser.add_argument("--data", help="CSV or JSON Lines with a payload column (default: synthetic corpus)")
+    parser.add_argument("--payload-column")
+    parser.add_argument("--labels", action="store_true", help="fit the dataset's Label column instead of the deep model")
+    parser.add_argument("--limit", type=int, default=0, help="use at most this many payloads")
+    parser.add_argument("--synthetic", type=int, default=20000, help="corpus size without --data")
+    parser.add_argument("--attack-ratio", type=float, default=0.1, help="share of attacks in the synthetic corpus")
+    parser.add_argument("--bits", type=int, default=DEFAULT_BITS, help="log2 of the hashed feature space")
+    parser.add_argument("--C", type=float, default=4.0, help="inverse regularization strength")
+    parser.add_argument("--holdout", type=float, default=0.25, help="fraction held out to set the thresholds")
+    parser.add_argument("--max-miss", type=float, default=0.002,
+                        help="largest fraction of the attacks allowed to exit as benign")
+    parser.add_argument("--max-false-alarm", type=float, default=0.002,
+                        help="largest fraction of the benign payloads allowed to exit as attacks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="output file (default: cascade_tier1.npz next to the deep model)")
+    args = parser.parse_args()
+
+    import app
+    from sklearn.linear_model import LogisticRegression
+
+    if args.data:
+        payloads, dataset_labels = read_payloads(args.data, args.payload_column, args.limit)
+    else:
+        import corpus
+
+        payloads = [p["payload"] for p in corpus.synthetic_payloads(args.synthetic, random.Random(args.seed), args.attack_ratio)]
+        dataset_labels = None
+    if args.labels and dataset_labels is None:
+        sys.exit("--labels needs a Label column in --data")
+
+    start = time.perf_counter()
+    if args.labels:
+        labels = np.asarray(dataset_labels, dtype=bool)
+    else:
+        labels = teacher_scores(args.model, payloads) >= 0.5
+        print(f"Deep model scored {len(payloads)} payloads in {time.perf_counter() - start:.1f}s")
+    if labels.all() or not labels.any():
+        sys.exit("The labels are all the same class; tier 1 needs both attacks and benign payloads")
+
+    tier = CascadeTier1(np.zeros(2 ** args.bits, dtype=np.float32), 0.0, 0.0, 1.0, app.tokenize_payload)
+    X, flagged = design_matrix(tier, payloads)
+    order = np.random.default_rng(args.seed).permutation(len(payloads))
+    cut = int(len(order) * (1 - args.holdout))
+    train, held = order[:cut], order[cut:]
+
+    clf = LogisticRegression(C=args.C, solver="liblinear", max_iter=1000)
+    clf.fit(X[train], labels[train])
+    tier.weights = clf.coef_.ravel().astype(np.float32)
+    tier.bias = float(clf.intercept_[0])
+
+    probs = 1.0 / (1.0 + np.exp(-(X[held] @ tier.weights.astype(np.float64) + tier.bias)))
+    tier.low, tier.high = exit_thresholds(probs, labels[held], flagged[held], args.max_miss, args.max_false_alarm)
+    exit_benign = (probs < tier.low) & ~flagged[held]
+    exit_attack = probs > tier.high
+    y = labels[held]
+    tier.report = {
+        "teacher": "labels" if args.labels else args.model,
+        "payloads": len(payloads),
+        "held_out": len(held),
+        "attack_ratio": round(float(y.mean()), 4),
+        "exit_ratio": round(float((exit_benign | exit_attack).mean()), 4),
+        "missed_attacks": int((exit_benign & y).sum()),
+        "false_alarms": int((exit_attack & ~y).sum()),
+        "max_miss": args.max_miss,
+        "max_false_alarm": args.max_false_alarm,
+    }
+
+    out = args.out or (app.BIL_CASCADE_PATH if args.model == "bilstm" else app.XSS_CASCADE_PATH)
+    tier.save(out)
+    r = tier.report
+    print(f"Thresholds: benign below {tier.low:.4f}, attack above {tier.high:.4f}")
+    print(f"Held out {r['held_out']} payloads ({r['attack_ratio']:.1%} attacks): {r['exit_ratio']:.1%} exit at tier 1, "
+          f"{r['missed_attacks']} attacks exit as benign, {r['false_alarms']} benign exit as attacks")
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Bounded in-memory cache of model verdicts keyed by payload hash.
+
+Entries are evicted least-recently-used first when the cache exceeds its entry
+or memory budget, and expire after a TTL. The cache is tied to a model version
+string; changing the version drops every entry.
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Rough per-entry cost of the OrderedDict node and the (value, expiry) tuple.
+_ENTRY_OVERHEAD = 160
+
+
+def payload_key(payload: str) -> bytes:
+    return hashlib.md5(payload.encode()).digest()
+
+
+def model_version(*paths: Optional[str]) -> Optional[str]:
+    """Identifies a set of model artifacts by path, size and modification time."""
+    parts = []
+    for p in paths:
+        if not p or not os.path.exists(p):
+            return None
+        st = os.stat(p)
+        parts.append(f"{os.path.basename(p)}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(parts)
+
+
+class VerdictCache:
+    def __init__(self, name: str, max_entries: int = 100_000, ttl_seconds: float = 3600.0,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self.version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key: bytes) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires, size = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                self._bytes -= size
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: bytes, value: Any, version: Optional[str] = None):
+        """Stores ``value`` unless it was computed for a different model ``version``."""
+        if not self.enabled:
+            return
+        size = _ENTRY_OVERHEAD + sys.getsizeof(key) + sys.getsizeof(value)
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def set_version(self, version: Optional[str]):
+        with self._lock:
+            if version != self.version:
+                self._data.clear()
+                self._bytes = 0
+                self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "version": self.version,
+            }
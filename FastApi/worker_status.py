@@ -0,0 +1,91 @@
+"""
+Per-worker status files for multi-process serving.
+
+Under gunicorn each worker is its own process, and a request reaches only
+one of them. Every worker writes its model status to
+``WORKER_STATE_DIR/<pid>.status.json`` and its metrics to
+``<pid>.metrics.json``; any worker can then answer for all of them.
+Without ``WORKER_STATE_DIR`` (single-process uvicorn) nothing is written.
+"""
+import json
+import os
+from typing import Dict, Optional
+
+WORKER_STATE_DIR = os.getenv("WORKER_STATE_DIR", "")
+KINDS = ("status", "metrics")
+
+
+def enabled() -> bool:
+    return bool(WORKER_STATE_DIR) and os.path.isdir(WORKER_STATE_DIR)
+
+
+def _path(pid: int, kind: str) -> str:
+    return os.path.join(WORKER_STATE_DIR, f"{pid}.{kind}.json")
+
+
+def _write(kind: str, data: Dict):
+    if not enabled():
+        return
+    path = _path(os.getpid(), kind)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def publish(status: Dict):
+    _write("status", status)
+
+
+def publish_metrics(snapshot: Dict):
+    _write("metrics", snapshot)
+
+
+def remove(pid: int):
+    for kind in KINDS:
+        try:
+            os.remove(_path(pid, kind))
+        except (FileNotFoundError, TypeError):
+            pass
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _collect(kind: str, exclude: Optional[int] = None) -> Dict[str, Dict]:
+    if not enabled():
+        return {}
+    suffix = f".{kind}.json"
+    found = {}
+    for name in os.listdir(WORKER_STATE_DIR):
+        if not name.endswith(suffix):
+            continue
+        pid = int(name[:-len(suffix)])
+        if pid == exclude:
+            continue
+        if not _alive(pid):
+            remove(pid)
+            continue
+        try:
+            with open(os.path.join(WORKER_STATE_DIR, name), "r", encoding="utf-8") as f:
+                found[str(pid)] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return found
+
+
+def collect() -> Dict[str, Dict]:
+    """Status of every live worker, keyed by pid."""
+    return _collect("status")
+
+
+def collect_metrics(exclude: Optional[int] = None) -> Dict[str, Dict]:
+    """Latest metrics snapshot of every live worker except ``exclude``, keyed by pid."""
+    return _collect("metrics", exclude)
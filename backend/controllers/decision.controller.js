@@ -10,98 +10,41 @@ export const analyzeRequest = async (req, res) => {
     const { payload, ip, ua } = req.body;
     console.log(req.body);
 
-    // Step 1: extract features (tokens, entropy, geo, reputation)
-    const featureRes = await axios.post(
-      "http://localhost:8000/feature/extract_features",
-      { payload, ip, ua }
-    );
-
-    // Step 2: call the models that accept the raw payload in parallel
-    const calls = [
-      // BILSTM payload detector
-      axios.post("http://localhost:8000/bilstm/predict", { text: payload }),
-      // XSS detector
-      axios.post("http://localhost:8000/xss/predict", { payload }),
-    ];
-
-    // If the incoming request provided a TrafficFlow-like `flow` object, use it
-    // to call the bot prediction endpoints. Otherwise skip bot calls (can't
-    // invent network features from a payload string).
-    let hasFlow = false;
-    const flow = req.body.flow;
-    if (flow && typeof flow === "object") {
-      hasFlow = true;
-      // supervised and unsupervised bot endpoints expect the same TrafficFlow schema
-      calls.push(
-        axios.post("http://localhost:8000/bot/predict/supervised", flow)
-      );
-      calls.push(
-        axios.post("http://localhost:8000/bot/predict/unsupervised", flow)
-      );
+    // Single hop: the FastAPI /analyze endpoint extracts features and runs
+    // every model in-process. Bot models only run when the request carries a
+    // TrafficFlow-like `flow` object (we can't invent network features from a
+    // payload string); behaviour only runs when `sessions` are provided.
+    const body = { payload: payload ?? "", ip: ip ?? "", ua: ua ?? "" };
+    if (req.body.flow && typeof req.body.flow === "object") {
+      body.flow = req.body.flow;
     }
-
-    // If behaviour sessions are provided, call behaviour endpoint
-    let hasSessions = false;
     if (req.body.sessions && Array.isArray(req.body.sessions)) {
-      hasSessions = true;
-      calls.push(
-        axios.post("http://localhost:8000/behaviour/predict", {
-          sessions: req.body.sessions,
-        })
-      );
+      body.sessions = req.body.sessions;
     }
 
-    const settled = await Promise.allSettled(calls);
-
-    // Map responses to numeric scores (0..1). Be defensive with response shapes.
-    // settled[0] -> bilstm, settled[1] -> xss, next -> optional bot supervised, bot unsupervised, behaviour
-    const bilIdx = 0;
-    const xssIdx = 1;
-    const botSuperIdx = hasFlow ? 2 : null;
-    const botIsoIdx = hasFlow ? 3 : null;
-    const behIdx = hasFlow ? (hasSessions ? 4 : 3) : hasSessions ? 2 : null;
-
-    const bilRes = settled[bilIdx];
-    const xssRes = settled[xssIdx];
-    const botSuperRes = botSuperIdx !== null ? settled[botSuperIdx] : null;
-    const botIsoRes = botIsoIdx !== null ? settled[botIsoIdx] : null;
-    const behRes = behIdx !== null ? settled[behIdx] : null;
-
-    const payloadScore =
-      bilRes && bilRes.status === "fulfilled" && bilRes.value?.data?.results
-        ? bilRes.value.data.results[0].confidence ?? 0
-        : 0;
-
-    const xssScore =
-      xssRes &&
-      xssRes.status === "fulfilled" &&
-      xssRes.value?.data?.prob_malicious
-        ? xssRes.value.data.prob_malicious
-        : 0;
-
-    const botScore =
-      botSuperRes && botSuperRes.status === "fulfilled"
-        ? botSuperRes.value?.data?.confidence ?? 0
-        : botIsoRes && botIsoRes.status === "fulfilled"
-        ? botIsoRes.value?.data?.confidence ?? 0
-        : 0;
-
-    const behaviorScore =
-      behRes && behRes.status === "fulfilled" && behRes.value?.data?.predictions
-        ? behRes.value.data.predictions[0].probability ?? 0
-        : 0;
+    const analysis = await axios.post("http://localhost:8000/analyze", body);
+    const scores = analysis.data?.scores || {};
+    if (analysis.data?.errors && Object.keys(analysis.data.errors).length) {
+      console.warn("analyze errors:", analysis.data.errors);
+    }
 
+    // Map scores to numbers (0..1); a model that didn't run reports null.
+    // ddos comes from the per-IP / per-subnet request rates FastAPI tracks
+    // for every analyzed request that carries an ip.
     const results = {
-      payload: Number(payloadScore) || 0,
-      bot: Number(botScore) || 0,
-      ddos: Number(botScore) || 0,
-      behavior: Number(behaviorScore) || 0,
-      xss: Number(xssScore) || 0,
-      features: featureRes.data || {},
+      payload: Number(scores.payload) || 0,
+      bot: Number(scores.bot) || 0,
+      ddos: Number(scores.ddos) || 0,
+      behavior: Number(scores.behavior) || 0,
+      xss: Number(scores.xss) || 0,
+      features: analysis.data?.features || {},
     };
 
-    const threatScore = calculateThreatScore(results);
-    let decision = applyPolicy(threatScore);
+    // An IP on the FastAPI blocklist / allowlist comes back with a verdict
+    // and no model scores; that verdict is final.
+    const listVerdict = analysis.data?.verdict;
+    const threatScore = listVerdict === "block" ? 1 : listVerdict === "allow" ? 0 : calculateThreatScore(results);
+    let decision = listVerdict || applyPolicy(threatScore);
 
     // Override policy: if any single model reports a very high confidence,
     // block immediately. This prevents a single critical signal from being
@@ -118,8 +61,8 @@ export const analyzeRequest = async (req, res) => {
       modelScores[a] >= modelScores[b] ? a : b
     );
     const topScore = Number(modelScores[topModel] || 0);
-    let overrideReason = null;
-    if (topScore >= OVERRIDE_THRESHOLD) {
+    let overrideReason = listVerdict ? { ipList: listVerdict } : null;
+    if (!listVerdict && topScore >= OVERRIDE_THRESHOLD) {
       decision = "block";
       overrideReason = { model: topModel, score: topScore };
     }
@@ -138,7 +81,9 @@ export const analyzeRequest = async (req, res) => {
     if (decision !== "allow") {
       let subject = `Threat Alert: ${decision.toUpperCase()}`;
       let body = `Suspicious activity detected from ${ip} with score ${threatScore}`;
-      if (overrideReason) {
+      if (overrideReason?.ipList) {
+        body += ` -- immediate block: IP is on the blocklist`;
+      } else if (overrideReason) {
         body += ` -- immediate block due to ${overrideReason.model} (score=${overrideReason.score})`;
       }
       await sendAlertEmail(subject, body);